@@ -0,0 +1,167 @@
+import heapq
+import numpy as np
+from typing import List, Dict, Tuple, Callable
+
+class ArbitrageIndex():
+    def __init__(self, tokens: List[str], scan_order: List[int], multi_token: bool,
+    track_resets: bool = False, bulk_fraction: float = 0.25):
+        """
+        Keeps the getRate results of every token pair arbitrage scans in a max-heap
+        ordered by rate, and only recomputes the pairs marked dirty since the last
+        lookup
+
+        Entries are invalidated lazily: each pair has a version that is bumped when
+        it is recomputed, and heap entries of older versions are dropped when they
+        reach the top. When many pairs are dirty at once, they are recomputed with
+        one rate matrix evaluation instead of one getRate call each
+
+        Parameters:
+        1. tokens: token types labelling the rows and columns of scan_order
+        2. scan_order: flat indices into an N x N matrix of the pairs arbitrage
+        scans, in scanning order
+        3. multi_token: whether a swap changes every pair of its tokens (multi
+        token pools) or only the pool between them (pairwise pools)
+        4. track_resets: whether or not to remember the pairs marked since the last
+        restore_tx and restore_batch calls
+        5. bulk_fraction: fraction of dirty pairs above which the rate matrix is
+        evaluated
+        """
+        self.tokens = tokens
+        self.multi_token = multi_token
+        self.track_resets = track_resets
+        self.bulk_fraction = bulk_fraction
+        n = len(tokens)
+        self.pairs = [divmod(int(flat), n) for flat in scan_order]
+        self.rows = np.array([row for row, col in self.pairs], dtype=np.int64)
+        self.cols = np.array([col for row, col in self.pairs], dtype=np.int64)
+        self.position = {pair: pos for pos, pair in enumerate(self.pairs)}
+        self.token_index = {tok: i for i, tok in enumerate(tokens)}
+        self.token_positions = [[pos for pos, pair in enumerate(self.pairs) if i in pair] \
+            for i in range(n)]
+
+        self.versions = [0] * len(self.pairs)
+        self.dirty = set(range(len(self.pairs)))
+        self.heap = []
+        self.live = {}
+        self.lim = None
+        self.tx_marks, self.batch_marks = set(), set()
+
+    def __mark(self, positions):
+        self.dirty.update(positions)
+        if self.track_resets:
+            self.tx_marks.update(positions)
+            self.batch_marks.update(positions)
+
+    def mark_token(self, token: str):
+        """
+        Marks every pair involving a token dirty, i.e. after its price changed
+
+        Parameters:
+        1. token: token type
+        """
+        self.__mark(self.token_positions[self.token_index[token]])
+
+    def mark_swap(self, intype: str, outtype: str):
+        """
+        Marks the pairs whose pool state a swap changed dirty
+
+        Parameters:
+        1. intype: input token type of the swap
+        2. outtype: output token type of the swap
+        """
+        if self.multi_token:
+            self.mark_token(intype)
+            self.mark_token(outtype)
+        else:
+            i, j = self.token_index[intype], self.token_index[outtype]
+            self.__mark([self.position[pair] for pair in ((i, j), (j, i)) \
+                if pair in self.position])
+
+    def restore_tx(self):
+        """
+        Notes that the pool state was reset to its value before the last
+        transaction; the pairs changed since then are dirty again
+        """
+        self.dirty |= self.tx_marks
+        self.tx_marks = set()
+
+    def restore_batch(self):
+        """
+        Notes that the pool state and equilibriums were reset to their values
+        before the last batch; the pairs changed since then are dirty again
+        """
+        self.dirty |= self.batch_marks
+        self.tx_marks, self.batch_marks = set(), set()
+
+    def __get_rate(self, pos: int, get_rate: Callable[[Tuple[str, str]], Dict[str, float]],
+    crash_type: List[str]) -> Tuple[float, float, float]:
+        """
+        Evaluates getRate for one pair; pairs that cannot be arbitraged get a nan
+        rate, as in rate_matrix
+
+        Returns:
+        1. rate
+        2. in_amt
+        3. out_amt
+        """
+        row, col = self.pairs[pos]
+        if self.tokens[col] in crash_type:
+            return np.nan, np.nan, np.nan
+
+        rate_dict = get_rate((self.tokens[row], self.tokens[col]))
+        if any(isinstance(x, complex) for x in rate_dict.values()):
+            return np.nan, np.nan, np.nan
+        return rate_dict["rate"], rate_dict["in_amt"], rate_dict["out_amt"]
+
+    def best(self, get_rate: Callable[[Tuple[str, str]], Dict[str, float]],
+    rate_matrix: Callable[[], Dict[str, np.ndarray]], crash_type: List[str], lim: float
+    ) -> Tuple[Tuple[str, str], Dict[str, float]]:
+        """
+        Recomputes the dirty pairs and finds the pair with the highest rate
+
+        Parameters:
+        1. get_rate: getRate of the market maker
+        2. rate_matrix: rate_matrix of the market maker
+        3. crash_type: crashing token types, which are never output
+        4. lim: how large the input token amount must be to be a candidate
+
+        Returns:
+        1. token pool of the best candidate, or None if there is none
+        2. getRate result of the best candidate, or None if there is none
+        """
+        if lim != self.lim:
+            self.dirty = set(range(len(self.pairs)))
+            self.lim = lim
+
+        dirty = list(self.dirty)
+        self.dirty = set()
+        if len(dirty) > self.bulk_fraction * len(self.pairs):
+            rates = rate_matrix()
+            rows, cols = self.rows[dirty], self.cols[dirty]
+            values = zip(dirty, *[rates[key][rows, cols].tolist() \
+                for key in ("rate", "in_amt", "out_amt")])
+        else:
+            values = [(pos,) + self.__get_rate(pos, get_rate, crash_type) for pos in dirty]
+
+        for pos, rate, in_amt, out_amt in values:
+            self.versions[pos] += 1
+            self.live.pop(pos, None)
+            # nan rates never beat a candidate in the scan
+            if rate == rate and in_amt > lim:
+                entry = (-rate, pos, self.versions[pos], in_amt, out_amt)
+                self.live[pos] = entry
+                heapq.heappush(self.heap, entry)
+
+        if len(self.heap) > 4 * len(self.live) + 16:
+            self.heap = list(self.live.values())
+            heapq.heapify(self.heap)
+        while self.heap and self.heap[0][2] != self.versions[self.heap[0][1]]:
+            heapq.heappop(self.heap)
+
+        if not self.heap:
+            return None, None
+        rate, pos, version, in_amt, out_amt = self.heap[0]
+        row, col = self.pairs[pos]
+
+        return (self.tokens[row], self.tokens[col]), \
+            {"in_amt": in_amt, "out_amt": out_amt, "rate": -rate}
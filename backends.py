@@ -0,0 +1,48 @@
+"""
+Compute backends of MarketMakerInterface.simulate_traffic
+
+"python" runs the simulation loop in Python on the pool status objects; "numba"
+runs the whole loop as one compiled function over array-backed state (see
+simloop). numba is optional: if it is not installed, the python backend is used.
+"""
+import warnings
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS = ["python", "numba"]
+
+def jit(func):
+    """
+    Compiles a function with numba if it is installed
+
+    Parameters:
+    1. func: function written in the subset of Python numba compiles
+
+    Returns:
+    1. compiled function, or func itself without numba
+    """
+    if numba is None:
+        return func
+
+    return numba.njit(cache=True, error_model="numpy")(func)
+
+def resolve(name: str) -> str:
+    """
+    Picks the backend to simulate with
+
+    Parameters:
+    1. name: requested backend, one of BACKENDS
+
+    Returns:
+    1. name, or "python" if the numba backend is requested without numba
+    """
+    if not name in BACKENDS:
+        raise ValueError("unknown backend {}, expected one of {}".format(name, BACKENDS))
+    if name == "numba" and numba is None:
+        warnings.warn("numba is not installed, falling back to the python backend")
+        return "python"
+
+    return name
@@ -0,0 +1,347 @@
+"""
+Benchmarks of the simulation engines, scenario generators and metrics:
+
+    python benchmark.py [-o <results.json>] [--quick] [--only <pattern> ...]
+        [--compare <earlier results.json>]
+
+Every case runs on fixed seeds and the configs in config/random, is timed
+repeat times (the median is reported) and is run once more under tracemalloc
+for its peak memory. Results are written as JSON, together with the code
+version, so runs can be compared over time (--compare prints the speedup of
+every case against an earlier results file).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import numpy as np
+from typing import List, Dict, Tuple, Callable
+
+import marketmakers
+import metrics
+import runmanifest
+import simulator
+from imarketmaker import MarketMakerInterface
+from pricegen import PriceGenerator
+from pricepath import PricePath
+from traffic import Traffic
+from trafficgen import TrafficGenerator
+
+CONFIG_DIR = os.path.join("config", "random")
+MARKET_MAKERS = {
+    "AMM": "amm",
+    "PMM": "pmm_005",
+    "CSMM": "csmm",
+    "MAMM": "mamm",
+    "MPMM": "mpmm_005",
+    "MCSMM": "mcsmm"
+}
+ARB_TOKENS = [3, 6, 12, 24]
+SEED = 0
+
+def load_config(mm_name: str, batches: int, batch_size: int, tokens: int = None) -> Dict:
+    """
+    Loads a config of config/random resized for benchmarking
+
+    Parameters:
+    1. mm_name: config name
+    2. batches: number of price batches (and traffic batches)
+    3. batch_size: number of transactions per batch
+    4. tokens: if given, the config's tokens are replaced by this many synthetic
+    tokens with prices spread over four orders of magnitude
+
+    Returns:
+    1. simulation config
+    """
+    with open(os.path.join(CONFIG_DIR, mm_name + ".json"), "r") as f:
+        config = json.load(f)
+
+    config["traffic"]["init_kwargs"]["shape"] = [batches, batch_size]
+    config["price_gen"]["init_kwargs"]["batches"] = batches
+    if tokens is not None:
+        config["initializer"]["token_configs"]["token_infos"]["price_gen"] = \
+            {"T{}".format(i): {"start": 10.0 ** (i % 4)} for i in range(tokens)}
+
+    return config
+
+def make_scenario(config: Dict, seed: int = SEED) -> Tuple[PricePath, Traffic]:
+    """
+    Generates a config's prices and traffic in memory, as prepare_scenario does
+
+    Parameters:
+    1. config: simulation config
+    2. seed: seed of both generators
+
+    Returns:
+    1. external prices
+    2. traffic
+    """
+    _, _, single_pools, _, traffic_info, price_gen_info, _ = simulator.initialize(config)
+
+    price_generator = PriceGenerator(**config["price_gen"]["init_kwargs"], seed=seed)
+    price_generator.configure_tokens(price_gen_info)
+    ext_prices = price_generator.simulate_ext_prices()
+
+    traffic_generator = TrafficGenerator(**config["traffic"]["init_kwargs"], seed=seed)
+    traffic_generator.configure_tokens(single_pools, traffic_info)
+
+    return ext_prices, traffic_generator.generate_traffic(ext_prices)
+
+def make_market_maker(config: Dict, **simulate_kwargs) -> MarketMakerInterface:
+    """
+    Builds and configures the market maker of a config
+
+    Parameters:
+    1. config: simulation config
+    2. simulate_kwargs: configure_simulation arguments overriding the config's
+
+    Returns:
+    1. market maker at its starting state
+    """
+    pairwise_pools, pairwise_infos, single_pools, single_infos, _, _, crash_types = \
+        simulator.initialize(config)
+
+    MMClass = getattr(marketmakers, config["market_maker"]["type"])
+    mm = MMClass(
+        pairwise_pools = pairwise_pools,
+        pairwise_infos = pairwise_infos,
+        single_pools = single_pools,
+        single_infos = single_infos
+    )
+    mm.configure_simulation(**dict(config["market_maker"]["simulate_kwargs"], **simulate_kwargs))
+    mm.configure_crash_types(crash_types)
+
+    return mm
+
+def measure(setup: Callable[[], Tuple], run: Callable[..., int], repeat: int = 3
+) -> Dict[str, float]:
+    """
+    Times a benchmark case
+
+    Parameters:
+    1. setup: builds the arguments of run (not timed)
+    2. run: the measured work; returns how many units of work it did
+    3. repeat: number of timed runs
+
+    Returns:
+    1. median and every run time in seconds, units of work, units per second
+    and peak traced memory in bytes of one more run
+    """
+    runs = []
+    for i in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        units = run(*args)
+        runs.append(time.perf_counter() - start)
+
+    args = setup()
+    tracemalloc.start()
+    run(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    seconds = statistics.median(runs)
+
+    return {
+            "seconds": seconds,
+            "runs": runs,
+            "units": units,
+            "per_second": units / seconds if seconds > 0 else None,
+            "peak_bytes": peak
+        }
+
+def engine_cases(batches: int, batch_size: int) -> Dict[str, Tuple[Callable, Callable, str]]:
+    """
+    Returns:
+    1. name -> (setup, run, unit) of simulate_traffic of every market maker
+    class, stateful and in reset_tx mode
+    """
+    cases = {}
+    for mm_type, mm_name in MARKET_MAKERS.items():
+        config = load_config(mm_name, batches, batch_size)
+        ext_prices, traffics = make_scenario(config)
+        for mode, reset_tx in [("stateful", "False"), ("reset_tx", "True")]:
+            setup = lambda config=config, reset_tx=reset_tx, ext_prices=ext_prices, \
+                traffics=traffics: (make_market_maker(config, reset_tx=reset_tx), traffics,
+                ext_prices)
+            run = lambda mm, traffics, ext_prices: \
+                mm.simulate_traffic(traffics, ext_prices)[0].swaps
+            cases["engine/{}/{}".format(mm_type, mode)] = (setup, run, "swaps")
+
+    return cases
+
+def arbitrage_cases(rounds: int) -> Dict[str, Tuple[Callable, Callable, str]]:
+    """
+    Returns:
+    1. name -> (setup, run, unit) of arbitrage() on pairwise (AMM) and multi
+    token (MAMM) pools as the number of tokens grows; every call follows a new
+    price batch
+    """
+    cases = {}
+    for mm_type, mm_name in [("AMM", "amm"), ("MAMM", "mamm")]:
+        for tokens in ARB_TOKENS:
+            config = load_config(mm_name, rounds, 1, tokens)
+            ext_prices, _ = make_scenario(config)
+
+            def setup(config=config, ext_prices=ext_prices):
+                mm = make_market_maker(config)
+                mm.prices = ext_prices[0]
+                return mm, ext_prices
+
+            def run(mm, ext_prices):
+                for j in range(len(ext_prices)):
+                    mm.set_prices(ext_prices[j])
+                    mm.arbitrage()
+                return len(ext_prices)
+
+            cases["arbitrage/{}/{}_tokens".format(mm_type, tokens)] = (setup, run, "calls")
+
+    return cases
+
+def generator_cases(batches: int, batch_size: int) -> Dict[str, Tuple[Callable, Callable, str]]:
+    """
+    Returns:
+    1. name -> (setup, run, unit) of PriceGenerator and TrafficGenerator
+    """
+    config = load_config("amm", batches, batch_size)
+    _, _, single_pools, _, traffic_info, price_gen_info, _ = simulator.initialize(config)
+    ext_prices, _ = make_scenario(config)
+
+    def price_setup():
+        generator = PriceGenerator(**config["price_gen"]["init_kwargs"], seed=SEED)
+        generator.configure_tokens(price_gen_info)
+        return generator,
+
+    def traffic_setup():
+        generator = TrafficGenerator(**config["traffic"]["init_kwargs"], seed=SEED)
+        generator.configure_tokens(single_pools, traffic_info)
+        return generator,
+
+    return {
+            "generator/price": (price_setup,
+                lambda generator: len(generator.simulate_ext_prices()), "batches"),
+            "generator/traffic": (traffic_setup,
+                lambda generator: generator.generate_traffic(ext_prices).inval.size,
+                "transactions")
+        }
+
+def metrics_cases(batches: int, batch_size: int) -> Dict[str, Tuple[Callable, Callable, str]]:
+    """
+    Returns:
+    1. name -> (setup, run, unit) of every metric function, on the swaps of a
+    stateful AMM run
+    """
+    config = load_config("amm", batches, batch_size)
+    ext_prices, traffics = make_scenario(config)
+    output, history, initial, crash_types = \
+        make_market_maker(config).simulate_traffic(traffics, ext_prices)
+    swaps = output.swaps
+    setup = lambda: ()
+
+    def quiet(func: Callable, *args) -> int:
+        with contextlib.redirect_stdout(io.StringIO()):
+            func(*args)
+        return swaps
+
+    return {
+            "metrics/capital_efficiency": (setup,
+                lambda: quiet(metrics.capital_efficiency, output, crash_types, ""), "swaps"),
+            "metrics/price_impact": (setup,
+                lambda: quiet(metrics.price_impact, output, crash_types, ""), "swaps"),
+            "metrics/impermanent_loss": (setup,
+                lambda: quiet(metrics.impermanent_loss, initial, history, crash_types, ""),
+                "swaps")
+        }
+
+def run_benchmarks(quick: bool = False, only: List[str] = None, repeat: int = 3) -> Dict:
+    """
+    Runs the benchmark cases
+
+    Parameters:
+    1. quick: whether or not to run the cases on small inputs (a smoke test)
+    2. only: shell-style patterns of the case names to run (all if None)
+    3. repeat: number of timed runs of each case
+
+    Returns:
+    1. results of the form:
+    {
+        "meta": code version, platform and sizes of the run,
+        "cases": case name -> measurement (see measure) and unit
+    }
+    """
+    batches, batch_size, rounds = (200, 10, 20) if quick else (2000, 10, 200)
+    builders = [
+        lambda: engine_cases(batches, batch_size),
+        lambda: arbitrage_cases(rounds),
+        lambda: generator_cases(batches * 10, batch_size),
+        lambda: metrics_cases(batches, batch_size)
+    ]
+
+    results = {}
+    for build in builders:
+        for name, (setup, run, unit) in build().items():
+            if not runmanifest.matches(name, only):
+                continue
+            print("running {}".format(name), file=sys.stderr)
+            results[name] = dict(measure(setup, run, repeat), unit=unit)
+
+    return {
+            "meta": {
+                "code_version": runmanifest.code_version(),
+                "time": time.time(),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "sizes": {"batches": batches, "batch_size": batch_size,
+                    "arbitrage_rounds": rounds},
+                "repeat": repeat,
+                "seed": SEED
+            },
+            "cases": results
+        }
+
+def compare(earlier: Dict, later: Dict) -> Dict[str, float]:
+    """
+    Parameters:
+    1. earlier: results of run_benchmarks
+    2. later: results of run_benchmarks
+
+    Returns:
+    1. case name -> speedup of later over earlier (earlier seconds / later
+    seconds), for the cases both ran
+    """
+    return {name: earlier["cases"][name]["seconds"] / case["seconds"] \
+        for name, case in later["cases"].items() if name in earlier["cases"]}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Market Maker Simulator benchmarks')
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='Path of the JSON results (default: printed)')
+    parser.add_argument('--quick', action='store_true',
+                        help='Run every case on small inputs')
+    parser.add_argument('--only', type=str, nargs='+', default=None,
+                        help='Only run the cases matching these patterns (e.g. "engine/*")')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of timed runs of each case')
+    parser.add_argument('--compare', type=str, default=None,
+                        help='Path of earlier JSON results to print speedups against')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.quick, args.only, args.repeat)
+    if args.output is None:
+        print(json.dumps(results, indent=4))
+    else:
+        with open(args.output, "w") as f:
+            f.write(json.dumps(results, indent=4))
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            for name, speedup in compare(json.load(f), results).items():
+                print("{}: {:.2f}x".format(name, speedup), file=sys.stderr)
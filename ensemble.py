@@ -0,0 +1,283 @@
+import numpy as np
+from typing import List, Dict
+from imarketmaker import MarketMakerInterface
+from outputtx import OutputTx
+from traffic import Traffic
+from pricepath import PricePath
+
+class EnsembleOutput():
+    COLUMNS = ["in_type", "out_type", "inpool_init_val", "outpool_init_val",
+        "inpool_after_val", "outpool_after_val", "market_rate", "after_rate"]
+
+    def __init__(self, tokens: List[str], crash: np.ndarray, executed: np.ndarray,
+    columns: Dict[str, np.ndarray], changes: np.ndarray):
+        """
+        Swaps of an Ensemble simulation; every array has a leading step axis and
+        a replica axis, and a replica's swaps are its executed steps in order
+
+        Parameters:
+        1. tokens: token types, indexed by the token ids of in_type and out_type
+        2. crash: whether or not each token type crashed in price
+        3. executed: (steps, replicas) mask of the steps each replica swapped in
+        4. columns: (steps, replicas) array of each OutputTx field, with token ids
+        for in_type and out_type
+        5. changes: (steps, replicas, keys) relative changes of the token balances
+        of the pools after each swap (status[key][0] / initial[key][0] - 1), for
+        the pool keys impermanent loss tracks
+        """
+        self.tokens = tokens
+        self.crash = crash
+        self.executed = executed
+        self.columns = columns
+        self.changes = changes
+
+    @property
+    def replicas(self) -> int:
+        return self.executed.shape[1]
+
+    def outputs(self, replica: int) -> List[OutputTx]:
+        """
+        Parameters:
+        1. replica: index of the replica
+
+        Returns:
+        1. output information associated with each swap of the replica
+        """
+        steps = self.executed[:, replica]
+        values = [self.columns[name][steps, replica].tolist() for name in self.COLUMNS]
+        tokens = self.tokens
+
+        return [OutputTx(tokens[row[0]], tokens[row[1]], *row[2:]) for row in zip(*values)]
+
+class Ensemble():
+    def __init__(self, mm: MarketMakerInterface):
+        """
+        Simulates replicas of one market maker in lockstep: pool states and
+        prices carry a leading replica axis and every transaction is stepped for
+        all replicas at once with the market maker's pair kernels (gather_pairs,
+        pair_swaps and pair_equilibriums)
+
+        Parameters:
+        1. mm: configured market maker (configure_simulation and
+        configure_crash_types); its pool state is the starting state of every
+        replica and is not changed
+        """
+        self.mm = mm
+
+    def simulate(self, traffics: List[Traffic], external_prices: List[PricePath],
+    lim: float = 1e-8) -> EnsembleOutput:
+        """
+        Simulates every replica's traffic and price path, as simulate_traffic
+        would one at a time; states without a real value go nan instead of
+        raising or turning complex
+
+        Parameters:
+        1. traffics: traffic of each replica, all of the same shape
+        2. external_prices: price path of each replica
+        3. lim: how large the input token amount must be to execute an arbitrage
+
+        Returns:
+        1. swaps of every replica
+        """
+        mm = self.mm
+        tokens = mm.rate_tokens()
+        index = {tok: i for i, tok in enumerate(tokens)}
+        replicas = np.arange(len(traffics))
+
+        prices = np.stack([path.columns(tokens) for path in external_prices])
+        ids = [np.array([index[tok] for tok in traffic.tokens], dtype=np.int64) \
+            for traffic in traffics]
+        intype = np.stack([lut[traffic.intype] for lut, traffic in zip(ids, traffics)])
+        outtype = np.stack([lut[traffic.outtype] for lut, traffic in zip(ids, traffics)])
+        inval = np.stack([traffic.inval for traffic in traffics]).astype(np.float64)
+        is_arb = np.stack([traffic.is_arb for traffic in traffics]).astype(bool) & mm.arb
+
+        state = np.repeat(mm.token_info.array[None], len(replicas), axis=0)
+        eqs = None if mm.equilibriums is None else \
+            np.repeat(mm.equilibriums.array[None], len(replicas), axis=0)
+        start_state = state.copy()
+        start_eqs = None if eqs is None else eqs.copy()
+
+        # pool keys impermanent loss tracks, as (replica,) + key_index + (0,)
+        keys = [key for key in mm.token_info if not key in mm.crash_type]
+        positions = [np.atleast_1d(mm.token_info.positions[key]) for key in keys]
+        self.key_index = tuple(np.array(ix, dtype=np.int64) for ix in zip(*positions))
+        self.initial = self.__balances(state, replicas)
+        self.steps = []
+
+        batches, batch_size = intype.shape[1:]
+        for j in range(batches):
+            batch_prices = prices[:, j]
+            if mm.reset_tx and eqs is not None:
+                eqs[...] = start_eqs
+
+            for i in range(batch_size):
+                arb = is_arb[:, j, i]
+                swaps = replicas[~arb]
+                if len(swaps):
+                    self.__swap(state, eqs, swaps, intype[swaps, j, i], outtype[swaps, j, i],
+                        inval[swaps, j, i], batch_prices)
+                if mm.has_arbitrage and arb.any():
+                    self.__arbitrage(state, eqs, replicas[arb], batch_prices, lim)
+
+                if mm.reset_tx:
+                    state[...] = start_state
+
+        return self.__output(tokens, len(replicas))
+
+    def __balances(self, state: np.ndarray, replicas: np.ndarray) -> np.ndarray:
+        """
+        Returns:
+        1. (replicas, keys) token balances of the pool keys impermanent loss
+        tracks, in the given replicas
+        """
+        return state[(replicas[:, None],) + self.key_index + (0,)]
+
+    def __swap(self, state: np.ndarray, eqs: np.ndarray, replicas: np.ndarray,
+    rows: np.ndarray, cols: np.ndarray, invals: np.ndarray, batch_prices: np.ndarray,
+    out_amts: np.ndarray = None):
+        """
+        Executes one swap in each of the given replicas, as swap would
+
+        Parameters:
+        1. state: token_info arrays of every replica
+        2. eqs: equilibriums arrays of every replica, or None
+        3. replicas: replicas that swap
+        4. rows: input token id of each swap
+        5. cols: output token id of each swap
+        6. invals: amount of input token inserted by each swap
+        7. batch_prices: (replicas, tokens) current prices
+        8. out_amts: amount of output token each swap removes (quoted if None)
+        """
+        mm = self.mm
+        market_rates = batch_prices[replicas, cols] / batch_prices[replicas, rows]
+        pairs = mm.gather_pairs(state, eqs, rows, cols, replicas)
+        out_amts, after_rates, invals = mm.pair_swaps(pairs, invals, market_rates, out_amts)
+
+        i_0, o_0 = pairs["i_0"], pairs["o_0"]
+        i_1, o_1 = i_0 + invals, o_0 - out_amts
+        if mm.multi_token:
+            state[replicas, rows, 0] = i_1
+            state[replicas, cols, 0] = o_1
+        else:
+            state[replicas, rows, cols, 0] = i_1
+            state[replicas, rows, cols, 1] = o_1
+            state[replicas, cols, rows, 0] -= out_amts
+            state[replicas, cols, rows, 1] += invals
+
+        if mm.swaps_change_equilibriums:
+            # the pool and its reverse move to the equilibriums before the swap
+            in_e, out_e = mm.pair_equilibriums(pairs, market_rates)
+            k = pairs["k"]
+            eqs[replicas, rows, cols] = np.stack([in_e, out_e, k], axis=-1)
+            eqs[replicas, cols, rows] = np.stack([out_e, in_e, k], axis=-1)
+
+        with np.errstate(all="ignore"):
+            changes = self.__balances(state, replicas) / self.initial[replicas] - 1
+        self.steps.append((replicas, (rows, cols, i_0, o_0, i_1, o_1, market_rates,
+            after_rates), changes))
+
+    def __arbitrage(self, state: np.ndarray, eqs: np.ndarray, replicas: np.ndarray,
+    batch_prices: np.ndarray, lim: float):
+        """
+        Performs arbitrage in each of the given replicas, as arbitrage would: every
+        replica takes up to arb_actions swaps and stops at its first unprofitable
+        one
+
+        Parameters:
+        1. state: token_info arrays of every replica
+        2. eqs: equilibriums arrays of every replica, or None
+        3. replicas: replicas that arbitrage
+        4. batch_prices: (replicas, tokens) current prices
+        5. lim: how large the input token amount must be to execute the arbitrage
+        """
+        mm = self.mm
+        n = len(mm.rate_tokens())
+        scan_order = mm.scan_order()
+        # like arbitrage's info, the best pair so far carries over between actions
+        info_rate = np.full(len(replicas), -1.0)
+        info_in, info_out = np.zeros(len(replicas)), np.zeros(len(replicas))
+        info_rows = np.zeros(len(replicas), dtype=np.int64)
+        info_cols = np.zeros(len(replicas), dtype=np.int64)
+        active = np.arange(len(replicas))
+
+        for i in range(mm.arb_actions):
+            rates = self.__rate_matrix(state, eqs, replicas[active], batch_prices)
+            rate, in_amt, out_amt = [rates[key].reshape(len(active), -1)[:, scan_order] \
+                for key in ["rate", "in_amt", "out_amt"]]
+            with np.errstate(invalid="ignore"):
+                candidates = np.where((rate > info_rate[active, None]) & (in_amt > lim),
+                    rate, -np.inf)
+
+            best = np.argmax(candidates, axis=1)
+            found = candidates[np.arange(len(active)), best] > -np.inf
+            best, picked = best[found], active[found]
+            info_rate[picked] = rate[found, best]
+            info_in[picked], info_out[picked] = in_amt[found, best], out_amt[found, best]
+            info_rows[picked], info_cols[picked] = np.divmod(scan_order[best], n)
+
+            active = active[(info_rate[active] > 1) & (info_in[active] > 0)]
+            if not len(active):
+                break
+            self.__swap(state, eqs, replicas[active], info_rows[active], info_cols[active],
+                info_in[active], batch_prices, info_out[active])
+
+    def __rate_matrix(self, state: np.ndarray, eqs: np.ndarray, replicas: np.ndarray,
+    batch_prices: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Evaluates rate_matrix for each of the given replicas
+
+        Returns:
+        1. A dictionary of (replicas, tokens, tokens) arrays of the form:
+        {
+            "in_amt": amounts of intype token to input to reach equilibrium,
+            "out_amt": amounts of outtype token to remove to reach equilibrium,
+            "rate": ratios of internal exchange rate to market rate
+        }
+        """
+        mm = self.mm
+        tokens = np.arange(len(mm.rate_tokens()))
+        prices = batch_prices[replicas]
+        market_rates = prices[:, None, :] / prices[:, :, None]
+
+        pairs = mm.gather_pairs(state, eqs, tokens[None, :, None], tokens[None, None, :],
+            replicas[:, None, None])
+        in_e, out_e = mm.pair_equilibriums(pairs, market_rates)
+        in_amt, out_amt = in_e - pairs["i_0"], pairs["o_0"] - out_e
+
+        with np.errstate(all="ignore"):
+            internal_rate = np.where(out_amt == 0, 1, in_amt / out_amt)
+            internal_rate[internal_rate == 0] = 1
+            rate = market_rates / internal_rate
+
+        rate[:, tokens, tokens] = np.nan
+        rate[:, :, [tok in mm.crash_type for tok in mm.rate_tokens()]] = np.nan
+
+        return {
+                "in_amt": in_amt,
+                "out_amt": out_amt,
+                "rate": rate
+            }
+
+    def __output(self, tokens: List[str], replicas: int) -> EnsembleOutput:
+        """
+        Lays the recorded steps out as (steps, replicas) arrays
+        """
+        steps = len(self.steps)
+        executed = np.zeros((steps, replicas), dtype=bool)
+        columns = {name: np.full((steps, replicas), np.nan) \
+            for name in EnsembleOutput.COLUMNS[2:]}
+        columns["in_type"] = np.zeros((steps, replicas), dtype=np.int64)
+        columns["out_type"] = np.zeros((steps, replicas), dtype=np.int64)
+        changes = np.full((steps, replicas, self.initial.shape[1]), np.nan)
+
+        for s, (step_replicas, values, step_changes) in enumerate(self.steps):
+            executed[s, step_replicas] = True
+            for name, value in zip(EnsembleOutput.COLUMNS, values):
+                columns[name][s, step_replicas] = value
+            changes[s, step_replicas] = step_changes
+        self.steps = []
+
+        crash = np.array([tok in self.mm.crash_type for tok in tokens], dtype=bool)
+
+        return EnsembleOutput(tokens, crash, executed, columns, changes)
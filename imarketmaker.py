@@ -1,12 +1,36 @@
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Union, Iterator
 from inputtx import InputTx
-from outputtx import OutputTx
-from poolstatus import PoolStatusInterface
+from traffic import Traffic
+from pricepath import PricePath
+from outputtx import OutputTx, OutputTxLog
+from poolstatus import PoolStatusInterface, PoolStatusHistory
+from iobserver import SwapObserverInterface
+from arbindex import ArbitrageIndex
+import backends
+import simloop
 from copy import deepcopy
+import numpy as np
 
 class MarketMakerInterface:
+    observers = []
+    pool_layout = None
+    arb_index = None
+    state_version = 0
+    price_version = 0
+    quote_versions = None
+    tx_undo = None
+    batch_undo = None
+    swaps_change_equilibriums = False
+    swap_chunk = 4096
+    swap_run_min = 32
+    batch_by_default = False
+    has_arbitrage = True
+    loop_kind = None
+    backend = "python"
+
     def configure_simulation(self, reset_tx: str = "False", arb: str = "True",
-    arb_actions: int = 1, multi_token: str = "True"):
+    arb_actions: int = 1, multi_token: str = "True", indexed_arb: str = "False",
+    batch_swaps: str = None, backend: str = "python"):
         """
         Configures settings for traffic simulation
 
@@ -15,11 +39,23 @@ class MarketMakerInterface:
         2. arb: whether or not arbitrage opportunities are acted on
         3. arb_actions: how many swaps can occur for one arbitrage opportunity
         4. multi_token: indicates if there are multi token pools
+        5. indexed_arb: whether or not arbitrage keeps pair rates in an index and
+        only recomputes the pairs changed since its last call, instead of
+        rescanning every pair
+        6. batch_swaps: whether or not, in reset_tx mode, swaps are priced
+        together with swap_batch instead of one at a time; if None, only the
+        market makers whose swaps it speeds up batch them (see batch_by_default)
+        7. backend: "python", or "numba" to run the whole simulation loop compiled
+        (see simloop); falls back to "python" if numba is not installed
         """
         self.reset_tx = reset_tx == "True"
         self.arb = arb == "True"
         self.arb_actions = arb_actions
         self.multi_token = multi_token == "True"
+        self.indexed_arb = indexed_arb == "True"
+        self.batch_swaps = self.batch_by_default if batch_swaps is None \
+            else batch_swaps == "True"
+        self.backend = backends.resolve(backend)
     
     def configure_crash_types(self, crash_type: List[str] = []):
         """
@@ -32,67 +68,370 @@ class MarketMakerInterface:
         self.crash_type = crash_type
 
     def simulate_traffic(self,
-                         traffic: List[List[InputTx]],
-                         external_price: List[Dict[str, float]]
-    ) -> Tuple[List[List[OutputTx]], List[List[PoolStatusInterface]],
-    PoolStatusInterface, List[str]]:
+                         traffic: Union[Traffic, List[List[InputTx]]],
+                         external_price: Union[PricePath, List[Dict[str, float]]],
+                         observers: List[SwapObserverInterface] = [],
+                         record: bool = True
+    ) -> Tuple[OutputTxLog, PoolStatusHistory, PoolStatusInterface, List[str]]:
         """
         Given a traffic and price data, simulate swaps
 
         Parameters:
-        1. traffic: 2-d list of transactions to simulate
-        2. external_price: 1-d list of token prices (defined per batch)
+        1. traffic: columnar traffic or 2-d list of transactions to simulate
+        2. external_price: price path or 1-d list of token prices (defined per batch)
+        3. observers: notified of every executed swap as it happens
+        4. record: whether or not to keep swap outputs and pool status history;
+        if False, observers are the only consumers of the swaps
 
         Returns:
-        1. output information associated with each swap
-        2. status of pool after each swap
+        1. output information associated with each swap, as a columnar log that
+        reads like a 2-d list of OutputTx (empty if not recorded)
+        2. status of pool after each swap (None if not recorded)
         3. initial status of pool
-        4. final status of pool
+        4. crashing token types
         """
+        if self.backend == "numba" and self.loop_kind is not None:
+            return self.__simulate_compiled(traffic, external_price, observers, record)
+
         self.prices = external_price[0]
+        self.price_version += 1
         initial_copy = deepcopy(self.token_info)
+        self.arb_index = None
+        if self.indexed_arb:
+            tokens, pool_index, scan_order = self.__layout()
+            self.arb_index = ArbitrageIndex(tokens, scan_order, self.multi_token,
+                self.reset_tx)
 
-        txs = []
-        stats = []
+        txs = OutputTxLog(self.rate_tokens())
+        stats = PoolStatusHistory(self.token_info) if record else None
+        self.observers = observers
+        for observer in observers:
+            observer.start(initial_copy, self.crash_type)
 
-        if self.reset_tx:
-            token_info_copy = deepcopy(self.token_info)
-            equilibrium_copy = deepcopy(self.equilibriums)
-
-        for j, batch in enumerate(traffic):
-            self.prices = external_price[j]
-            batch_txs = []
-            batch_stats = []
+        self.tx_undo, self.batch_undo = ([], []) if self.reset_tx else (None, None)
 
+        for j, batch in enumerate(self.__plan(traffic, external_price)):
+            self.set_prices(external_price[j])
             if self.reset_tx:
-                self.token_info = token_info_copy
-                self.equilibriums = equilibrium_copy
-                token_info_copy = deepcopy(self.token_info)
-                equilibrium_copy = deepcopy(self.equilibriums)
-
-            for tx in batch:
-                if tx.is_arb and self.arb:
-                    output_lst, stat_lst = self.arbitrage()
-                    for i in output_lst:
-                        batch_txs.append(i)
-                    for i in stat_lst:
-                        batch_stats.append(i)
+                self.rollback(self.batch_undo)
+                self.state_version += 1
+                if self.arb_index is not None:
+                    self.arb_index.restore_batch()
+
+            for tx, swapped in batch:
+                if swapped is not None:
+                    info, changes = swapped
+                    if self.arb_index is not None:
+                        self.arb_index.mark_swap(tx.intype, tx.outtype)
+                    if self.observers:
+                        # observers see the pool as if the swap was executed
+                        self.apply_changes(changes)
+                    self.observe(info)
+                    if record:
+                        txs.append(info)
+                        stats.record(changes)
+                elif tx.is_arb and self.arb:
+                    output_lst, change_lst = self.arbitrage()
+                    if record:
+                        for i in output_lst:
+                            txs.append(i, True)
+                        for i in change_lst:
+                            stats.record(i)
                 else:
-                    info, stat = self.swap(tx, None)
-                    batch_txs.append(info)
-                    batch_stats.append(stat)
+                    info, changes = self.swap(tx, None)
+                    self.observe(info)
+                    if record:
+                        txs.append(info)
+                        stats.record(changes)
 
                 if self.reset_tx:
-                    self.token_info = token_info_copy
-                    token_info_copy = deepcopy(self.token_info)
+                    self.rollback(self.tx_undo)
+                    self.state_version += 1
+                    if self.arb_index is not None:
+                        self.arb_index.restore_tx()
+                    if record:
+                        stats.resync(self.token_info)
+
+            if record:
+                txs.end_batch()
+                stats.end_batch()
+
+        for observer in observers:
+            observer.finish()
+        self.observers = []
+        self.arb_index = None
+        self.tx_undo, self.batch_undo = None, None
+
+        return txs, stats, initial_copy, self.crash_type
+
+    def __simulate_compiled(self,
+                            traffic: Union[Traffic, List[List[InputTx]]],
+                            external_price: Union[PricePath, List[Dict[str, float]]],
+                            observers: List[SwapObserverInterface],
+                            record: bool
+    ) -> Tuple[OutputTxLog, PoolStatusHistory, PoolStatusInterface, List[str]]:
+        """
+        simulate_traffic on the numba backend: the whole loop runs compiled on
+        the token_info and equilibriums arrays (see simloop.simulate), then the
+        executed swaps are replayed to the observers and the pool status history
+
+        Parameters and returns are those of simulate_traffic
+        """
+        tokens = self.rate_tokens()
+        index = {tok: i for i, tok in enumerate(tokens)}
+        if not isinstance(traffic, Traffic):
+            traffic = Traffic.from_txs(tokens, traffic)
+        if not isinstance(external_price, PricePath):
+            external_price = PricePath.from_dicts(external_price)
+        ids = np.array([index[tok] for tok in traffic.tokens], dtype=np.int64)
+
+        initial_copy = deepcopy(self.token_info)
+        state = self.token_info.array.copy()
+        eqs = np.zeros((1, 3)) if self.equilibriums is None else self.equilibriums.array
+        rows = np.empty((traffic.intype.size * max(1, self.arb_actions), simloop.ROW_SIZE))
 
-            txs.append(batch_txs)
-            stats.append(batch_stats)
+        with np.errstate(all="ignore"):
+            count = simloop.simulate(self.loop_kind, len(tokens), self.reset_tx, self.arb,
+                self.arb_actions, 1e-8, getattr(self, "float_tolerance", 0.0),
+                state.reshape(-1, state.shape[-1]), eqs.reshape(-1, eqs.shape[-1]),
+                np.ascontiguousarray(external_price.columns(tokens)), ids[traffic.intype],
+                ids[traffic.outtype], np.asarray(traffic.inval, dtype=np.float64),
+                np.asarray(traffic.is_arb, dtype=bool),
+                np.array([tok in self.crash_type for tok in tokens], dtype=bool),
+                self.scan_order(), rows)
+        rows = rows[:count]
+
+        txs = OutputTxLog(tokens)
+        if record:
+            batch, tx = rows[:, 0].astype(np.int64), rows[:, 1].astype(np.int64)
+            # arbitrage swaps are the ones made on an is_arb transaction
+            txs.extend(rows[:, 2], rows[:, 3], rows[:, 4:10], batch,
+                np.asarray(traffic.is_arb, dtype=bool)[batch, tx] & self.arb)
+        stats = PoolStatusHistory(self.token_info) if record else None
+        self.observers = observers
+        for observer in observers:
+            observer.start(initial_copy, self.crash_type)
+
+        if observers or record:
+            batch_rows = np.searchsorted(rows[:, 0], np.arange(len(traffic) + 1))
+            for j in range(len(traffic)):
+                last_tx = None
+                for row in rows[batch_rows[j]:batch_rows[j + 1]].tolist():
+                    tx, intype, outtype = int(row[1]), tokens[int(row[2])], tokens[int(row[3])]
+                    if self.reset_tx and last_tx is not None and tx != last_tx:
+                        self.__reset(initial_copy, stats)
+                    last_tx = tx
+
+                    info = OutputTx(intype, outtype, *row[4:10])
+                    if self.multi_token:
+                        changes = [(intype, 0, row[6]), (outtype, 0, row[7])]
+                    else:
+                        pool, reverse = (intype, outtype), (outtype, intype)
+                        changes = [(pool, 0, row[6]), (pool, 1, row[7]),
+                            (reverse, 0, row[10]), (reverse, 1, row[11])]
+                    if observers:
+                        for key, slot, value in changes:
+                            self.token_info[key][slot] = value
+                    self.observe(info)
+                    if record:
+                        stats.record(changes)
+
+                if self.reset_tx and last_tx is not None:
+                    self.__reset(initial_copy, stats)
+                if record:
+                    txs.end_batch()
+                    stats.end_batch()
+
+        for observer in observers:
+            observer.finish()
+        self.observers = []
+        self.token_info.array[...] = state
+        self.state_version += 1
+        self.set_prices(external_price[len(external_price) - 1])
 
         return txs, stats, initial_copy, self.crash_type
+
+    def __reset(self, initial: PoolStatusInterface, stats: PoolStatusHistory):
+        """
+        Resets token_info to initial after a transaction in reset_tx mode
+
+        Parameters:
+        1. initial: pool status before any swaps
+        2. stats: pool status history to note the reset in, or None
+        """
+        self.token_info.array[...] = initial.array
+        if stats is not None:
+            stats.resync(self.token_info)
+
+    def __plan(self, traffic: Union[Traffic, List[List[InputTx]]],
+    external_price: Union[PricePath, List[Dict[str, float]]]
+    ) -> Iterator[Iterator[Tuple[InputTx, Tuple[OutputTx, List[Tuple[object, int, float]]]]]]:
+        """
+        Walks through the traffic, pricing swaps with swap_batch ahead of time
+        where reset_tx mode makes them independent: every swap starts from the
+        same token_info, so unless swaps change equilibriums, all the swaps of
+        many batches are priced at once; otherwise each run of swaps between
+        arbitrage transactions is priced once it is reached
+
+        Parameters:
+        1. traffic: traffic to simulate
+        2. external_price: token prices of each batch
+
+        Returns:
+        1. iterator over batches, each an iterator over (transaction, swap_batch
+        result for it); the result is None for transactions that must go
+        through swap or arbitrage
+        """
+        if not (self.reset_tx and self.batch_swaps):
+            for batch in traffic:
+                yield ((tx, None) for tx in batch)
+        elif self.swaps_change_equilibriums:
+            for batch in traffic:
+                yield self.__runs(list(batch))
+        else:
+            pending, swaps = [], 0
+            for j, batch in enumerate(traffic):
+                pending.append((j, list(batch)))
+                swaps += len(pending[-1][1])
+                if swaps >= self.swap_chunk:
+                    yield from self.__chunk(pending, external_price)
+                    pending, swaps = [], 0
+            yield from self.__chunk(pending, external_price)
+
+    def __chunk(self, pending: List[Tuple[int, List[InputTx]]],
+    external_price: Union[PricePath, List[Dict[str, float]]]
+    ) -> Iterator[List[Tuple[InputTx, Tuple[OutputTx, List[Tuple[object, int, float]]]]]]:
+        """
+        Prices the swaps of several batches with one swap_batch evaluation
+
+        Parameters:
+        1. pending: (batch index, transactions) of the batches
+        2. external_price: token prices of each batch
+
+        Returns:
+        1. iterator over the batches, each a list of (transaction, swap_batch
+        result for it or None)
+        """
+        tokens = self.rate_tokens()
+        prices = np.array([[external_price[j][tok] for tok in tokens] for j, batch in pending],
+            dtype=np.float64).reshape(len(pending), len(tokens))
+        swaps = [(b, tx) for b, (j, batch) in enumerate(pending) for tx in batch \
+            if not (tx.is_arb and self.arb)]
+
+        outputs = None
+        if swaps:
+            # unknown tokens only need a placeholder here; swap_batch rejects them
+            index = self.token_info.index
+            b = np.array([b for b, tx in swaps], dtype=np.int64)
+            rows = np.array([index.get(tx.intype, 0) for b, tx in swaps], dtype=np.int64)
+            cols = np.array([index.get(tx.outtype, 0) for b, tx in swaps], dtype=np.int64)
+            outputs, change_lst = self.swap_batch([tx for b, tx in swaps],
+                prices[b, cols] / prices[b, rows])
+        if outputs is None:
+            swapped = iter([None] * len(swaps))
+        else:
+            swapped = zip(outputs, change_lst)
+
+        for j, batch in pending:
+            yield [(tx, None if tx.is_arb and self.arb else next(swapped)) for tx in batch]
+
+    def __runs(self, txs: List[InputTx]
+    ) -> Iterator[Tuple[InputTx, Tuple[OutputTx, List[Tuple[object, int, float]]]]]:
+        """
+        Walks through a batch, pricing each run of swaps between arbitrage
+        transactions with swap_batch once it is reached; runs shorter than
+        swap_run_min go through swap, as arrays do not pay off for them
+
+        Parameters:
+        1. txs: transactions of the batch
+
+        Returns:
+        1. iterator over (transaction, swap_batch result for it or None)
+        """
+        start = 0
+        while start < len(txs):
+            if txs[start].is_arb and self.arb:
+                yield txs[start], None
+                start += 1
+                continue
+
+            end = start
+            while end < len(txs) and not (txs[end].is_arb and self.arb):
+                end += 1
+            outputs, change_lst = None, None
+            if end - start >= self.swap_run_min:
+                outputs, change_lst = self.swap_batch(txs[start:end])
+            if outputs is None:
+                outputs, change_lst = [None] * (end - start), [None] * (end - start)
+
+            for tx, output, changes in zip(txs[start:end], outputs, change_lst):
+                yield tx, None if output is None else (output, changes)
+            start = end
+
+    def set_prices(self, prices: Dict[str, float]):
+        """
+        Moves the simulation to new market prices
+
+        Parameters:
+        1. prices: market price of every token
+        """
+        if self.arb_index is not None:
+            for tok in self.arb_index.tokens:
+                if prices[tok] != self.prices[tok]:
+                    self.arb_index.mark_token(tok)
+        self.prices = prices
+        self.price_version += 1
+
+    def save_entry(self, status: PoolStatusInterface, key: object):
+        """
+        Remembers the entries of a pool before they are changed, so that a reset
+        can roll them back; only active in reset_tx mode, where token_info is
+        rolled back after every transaction and equilibriums after every batch
+
+        Parameters:
+        1. status: pool status about to be changed (token_info or equilibriums)
+        2. key: pool key of the entries about to be changed
+        """
+        if self.tx_undo is not None:
+            log = self.tx_undo if status is self.token_info else self.batch_undo
+            log.append((status, key, tuple(status[key])))
+
+    def apply_changes(self, changes: List[Tuple[object, int, float]]):
+        """
+        Writes the pool entries changed by a swap into token_info
+
+        Parameters:
+        1. changes: (pool key, entry index, value after swap) for every pool entry
+        changed by the swap
+        """
+        for key, slot, value in changes:
+            self.save_entry(self.token_info, key)
+            self.token_info[key][slot] = value
+
+    def rollback(self, log: List[Tuple[PoolStatusInterface, object, Tuple[float, ...]]]):
+        """
+        Restores the pool entries saved in an undo log, latest first, and empties
+        the log
+
+        Parameters:
+        1. log: tx_undo or batch_undo
+        """
+        for status, key, info in reversed(log):
+            status[key] = info
+        log.clear()
+
+    def observe(self, output: OutputTx):
+        """
+        Notifies the observers of the running simulation of an executed swap
+
+        Parameters:
+        1. output: output information associated with the swap
+        """
+        for observer in self.observers:
+            observer.observe(output, self.token_info)
     
     def swap(self, tx: InputTx, out_amt: float, execute: bool = True
-    ) -> Tuple[OutputTx, PoolStatusInterface]:
+    ) -> Tuple[OutputTx, List[Tuple[object, int, float]]]:
         """
         Initiate a swap specified by tx given that the amount of output token removed
         is known
@@ -104,28 +443,46 @@ class MarketMakerInterface:
         
         Returns:
         1. output information associated with swap (after_rate is incorrect)
-        2. status of pool ater swap
+        2. (pool key, entry index, value after swap) for every pool entry changed
+        by the swap
         """
         if out_amt == None:
             raise NotImplementedError
         else:
+            changes = []
             if self.multi_token:
-                in0, out0 = self.token_info[tx.intype][0], self.token_info[tx.outtype][0]
+                in_info, out_info = self.token_info[tx.intype], self.token_info[tx.outtype]
+                in0, out0 = in_info[0], out_info[0]
                 
                 if execute:
-                    self.token_info[tx.intype][0] += tx.inval
-                    self.token_info[tx.outtype][0] -= out_amt
+                    self.state_version += 1
+                    if self.arb_index is not None:
+                        self.arb_index.mark_swap(tx.intype, tx.outtype)
+                    self.save_entry(self.token_info, tx.intype)
+                    self.save_entry(self.token_info, tx.outtype)
+                    in_info[0] += tx.inval
+                    out_info[0] -= out_amt
+                    changes = [(tx.intype, 0, in_info[0]), (tx.outtype, 0, out_info[0])]
             else:
-                pool_info = self.token_info[(tx.intype, tx.outtype)]
+                pool = (tx.intype, tx.outtype)
+                pool_info = self.token_info[pool]
                 in0, out0 = pool_info[0], pool_info[1]
 
                 if execute:
+                    self.state_version += 1
+                    if self.arb_index is not None:
+                        self.arb_index.mark_swap(tx.intype, tx.outtype)
+                    reverse = (tx.outtype, tx.intype)
+                    self.save_entry(self.token_info, pool)
+                    self.save_entry(self.token_info, reverse)
                     pool_info[0] += tx.inval
                     pool_info[1] -= out_amt
 
-                    reverse_pool = self.token_info[(tx.outtype, tx.intype)]
+                    reverse_pool = self.token_info[reverse]
                     reverse_pool[0] -= out_amt
                     reverse_pool[1] += tx.inval
+                    changes = [(pool, 0, pool_info[0]), (pool, 1, pool_info[1]),
+                        (reverse, 0, reverse_pool[0]), (reverse, 1, reverse_pool[1])]
 
             return OutputTx(
                 in_type = tx.intype,
@@ -136,8 +493,246 @@ class MarketMakerInterface:
                 outpool_after_val = out0 - out_amt,
                 market_rate = self.prices[tx.outtype] / self.prices[tx.intype],
                 after_rate = 1
-            ), deepcopy(self.token_info)
+            ), changes
     
+    def quote(self, intype: str, outtype: str, inval: float) -> Tuple[float, float]:
+        """
+        Prices a swap without executing it; results are memoized until the pool
+        state or the market prices change
+
+        Parameters:
+        1. intype: input token type
+        2. outtype: output token type
+        3. inval: amount of input token inserted
+
+        Returns:
+        1. amount of output token removed by the swap
+        2. after_rate of the swap, i.e. the rate of the same swap repeated right
+        after it
+        """
+        versions = (self.state_version, self.price_version)
+        if versions != self.quote_versions:
+            self.quotes = {}
+            self.quote_versions = versions
+
+        key = (intype, outtype, inval)
+        if not key in self.quotes:
+            self.quotes[key] = self.calculate_quote(intype, outtype, inval)
+
+        return self.quotes[key]
+
+    def batch_arrays(self, txs: List[InputTx], market_rates: np.ndarray = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Lays transactions out as arrays for calculate_quotes
+
+        Parameters:
+        1. txs: transactions
+        2. market_rates: market exchange rate (output token price / input token
+        price) of every transaction; taken from the current prices if None
+
+        Returns:
+        1. input token ids (indices into rate_tokens)
+        2. output token ids (indices into rate_tokens)
+        3. amounts of input token inserted
+        4. market exchange rates
+        or None if a transaction cannot be laid out (unknown token, or the same
+        input and output token)
+        """
+        index = self.token_info.index
+        if not all(tx.intype in index and tx.outtype in index for tx in txs):
+            return None
+        rows = np.array([index[tx.intype] for tx in txs], dtype=np.int64)
+        cols = np.array([index[tx.outtype] for tx in txs], dtype=np.int64)
+        invals = np.array([tx.inval for tx in txs], dtype=np.float64)
+        if np.any(rows == cols):
+            return None
+
+        if market_rates is None:
+            prices = self.price_vector()
+            market_rates = prices[cols] / prices[rows]
+
+        return rows, cols, invals, market_rates
+
+    def swap_batch(self, txs: List[InputTx], market_rates: np.ndarray = None
+    ) -> Tuple[List[OutputTx], List[List[Tuple[object, int, float]]]]:
+        """
+        Executes swaps that all start from the current pool state, like the swaps
+        of reset_tx mode; the swaps are priced together by one calculate_quotes
+        evaluation and token_info is left unchanged
+
+        Parameters:
+        1. txs: transactions
+        2. market_rates: market exchange rate of every transaction, if the swaps
+        are priced at other prices than the current ones
+
+        Returns:
+        1. output information associated with each swap, or None if the swaps
+        cannot be priced as arrays and must go through swap
+        2. (pool key, entry index, value after swap) for every pool entry each
+        swap changes, or None
+        """
+        arrays = self.batch_arrays(txs, market_rates)
+        if arrays is None:
+            return None, None
+        rows, cols, invals, market_rates = arrays
+
+        try:
+            out_amts, after_rates, inserted = self.calculate_quotes(rows, cols, invals,
+                market_rates)
+        except NotImplementedError:
+            return None, None
+        # the scalar path raises or goes complex where arrays go non-finite
+        if not (np.isfinite(out_amts).all() and np.isfinite(after_rates).all()):
+            return None, None
+        # as in swap, transactions record what the pools actually took in
+        for k in np.flatnonzero(inserted != invals).tolist():
+            txs[k].inval = float(inserted[k])
+        invals = inserted
+
+        if self.multi_token:
+            balances = self.token_info.vector(0)
+            in_0, out_0 = balances[rows], balances[cols]
+        else:
+            in_0 = self.token_info.matrix(0)[rows, cols]
+            out_0 = self.token_info.matrix(1)[rows, cols]
+            reverse_in = self.token_info.matrix(0)[cols, rows] - out_amts
+            reverse_out = self.token_info.matrix(1)[cols, rows] + invals
+        in_1, out_1 = in_0 + invals, out_0 - out_amts
+
+        outputs, change_lst = [], []
+        columns = [in_0, out_0, in_1, out_1, market_rates, after_rates]
+        if not self.multi_token:
+            columns += [reverse_in, reverse_out]
+        for tx, values in zip(txs, zip(*[column.tolist() for column in columns])):
+            outputs.append(OutputTx(tx.intype, tx.outtype, *values[:6]))
+            if self.multi_token:
+                change_lst.append([(tx.intype, 0, values[2]), (tx.outtype, 0, values[3])])
+            else:
+                pool, reverse = (tx.intype, tx.outtype), (tx.outtype, tx.intype)
+                change_lst.append([(pool, 0, values[2]), (pool, 1, values[3]),
+                    (reverse, 0, values[6]), (reverse, 1, values[7])])
+
+        return outputs, change_lst
+
+    def calculate_quotes(self, rows: np.ndarray, cols: np.ndarray, invals: np.ndarray,
+    market_rates: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Vectorized calculate_quote over independent swaps that all start from the
+        current pool state; must not change any state
+
+        Parameters:
+        1. rows: input token ids (indices into rate_tokens)
+        2. cols: output token ids (indices into rate_tokens)
+        3. invals: amounts of input token inserted
+        4. market_rates: output token price / input token price of each swap
+
+        Returns:
+        1. amounts of output token removed by the swaps
+        2. after_rates of the swaps
+        3. amounts of input token actually inserted
+        """
+        pairs = self.gather_pairs(self.token_info.array,
+            None if self.equilibriums is None else self.equilibriums.array, rows, cols)
+
+        return self.pair_swaps(pairs, invals, market_rates)
+
+    def gather_pairs(self, state: np.ndarray, equilibriums: np.ndarray, rows: np.ndarray,
+    cols: np.ndarray, replicas: np.ndarray = None) -> Dict[str, np.ndarray]:
+        """
+        Gathers the entries of token pairs from pool status arrays laid out like
+        token_info.array; the arrays may carry a leading replica axis (see
+        Ensemble)
+
+        Parameters:
+        1. state: token_info array
+        2. equilibriums: equilibriums array, or None
+        3. rows: input token ids (indices into rate_tokens)
+        4. cols: output token ids (indices into rate_tokens)
+        5. replicas: replica of every pair if the arrays have a replica axis
+
+        Returns:
+        1. A dictionary of the form:
+        {
+            "i_0": input token balances,
+            "o_0": output token balances,
+            "k": k values of the pairs,
+            "in_eq": input token equilibriums (None without equilibriums),
+            "out_eq": output token equilibriums (None without equilibriums)
+        }
+        whose arrays have the broadcast shape of replicas, rows and cols
+        """
+        lead = () if replicas is None else (replicas,)
+        in_eq, out_eq = None, None
+        if self.multi_token:
+            i_0, o_0 = state[lead + (rows, 0)], state[lead + (cols, 0)]
+            k = np.maximum(state[lead + (rows, 1)], state[lead + (cols, 1)])
+            if equilibriums is not None:
+                in_eq, out_eq = equilibriums[lead + (rows, 0)], equilibriums[lead + (cols, 0)]
+        else:
+            i_0, o_0, k = [state[lead + (rows, cols, slot)] for slot in range(3)]
+            if equilibriums is not None:
+                in_eq, out_eq = [equilibriums[lead + (rows, cols, slot)] for slot in range(2)]
+
+        return {
+                "i_0": i_0,
+                "o_0": o_0,
+                "k": k,
+                "in_eq": in_eq,
+                "out_eq": out_eq
+            }
+
+    def pair_swaps(self, pairs: Dict[str, np.ndarray], invals: np.ndarray,
+    market_rates: np.ndarray, out_amts: np.ndarray = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Array version of swap's pricing: prices swaps of gathered token pairs, as
+        swap would price them from those pair states
+
+        Parameters:
+        1. pairs: token pairs, from gather_pairs
+        2. invals: amounts of input token inserted
+        3. market_rates: output token price / input token price of each swap
+        4. out_amts: amounts of output token removed, as swap's out_amt (quoted
+        if None)
+
+        Returns:
+        1. amounts of output token removed by the swaps
+        2. after_rates of the swaps
+        3. amounts of input token actually inserted
+        """
+        raise NotImplementedError
+
+    def pair_equilibriums(self, pairs: Dict[str, np.ndarray], market_rates: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Array version of calculate_equilibriums for gathered token pairs
+
+        Parameters:
+        1. pairs: token pairs, from gather_pairs
+        2. market_rates: output token price / input token price of each pair
+
+        Returns:
+        1. equilibrium balances for input tokens
+        2. equilibrium balances for output tokens
+        """
+        raise NotImplementedError
+
+    def calculate_quote(self, intype: str, outtype: str, inval: float) -> Tuple[float, float]:
+        """
+        Prices a swap from the current pool state; must not change any state
+
+        Parameters:
+        1. intype: input token type
+        2. outtype: output token type
+        3. inval: amount of input token inserted
+
+        Returns:
+        1. amount of output token removed by the swap
+        2. after_rate of the swap
+        """
+        raise NotImplementedError
+
     def calculate_equilibriums(self, intype: str, outtype: str) -> Tuple[float, float, float]:
         """
         Calculates and returns equilibrium balances
@@ -153,7 +748,145 @@ class MarketMakerInterface:
         """
         raise NotImplementedError
     
-    def arbitrage(self, lim: float = 1e-8) -> Tuple[List[OutputTx], List[PoolStatusInterface]]:
+    def calculate_equilibrium_matrix(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Calculates equilibrium balances for every ordered token pair at once;
+        entry [i, j] is calculate_equilibriums(tokens[i], tokens[j]) for the
+        tokens of rate_tokens. Market makers override this with a vectorized
+        version, this one loops over the pairs
+
+        Returns:
+        1. equilibrium balances for input tokens (nan where there is none)
+        2. equilibrium balances for output tokens (nan where there is none)
+        """
+        tokens = self.rate_tokens()
+        n = len(tokens)
+        in_e, out_e = np.full((n, n), np.nan), np.full((n, n), np.nan)
+        for i, tok1 in enumerate(tokens):
+            for j, tok2 in enumerate(tokens):
+                if i == j or not (self.multi_token or (tok1, tok2) in self.token_info):
+                    continue
+                equilibriums = self.calculate_equilibriums(tok1, tok2)
+                if not any(isinstance(x, complex) for x in equilibriums):
+                    in_e[i, j], out_e[i, j] = equilibriums[0], equilibriums[1]
+
+        return in_e, out_e
+
+    def __layout(self) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        Lays token pairs out in N x N matrices; pools are fixed when a market
+        maker is created, so this is only worked out once
+
+        Returns:
+        1. token types labelling the rows and columns
+        2. flat index of every pool of token_info, in key order (pairwise only)
+        3. flat indices of the token pairs in the order arbitrage scans them
+        """
+        if self.pool_layout is None:
+            tokens = self.token_info.tokens
+            n = len(tokens)
+            if self.multi_token:
+                pool_index = None
+                scan_order = np.array([[i*n + j, j*n + i] for i in range(n) \
+                    for j in range(i + 1, n)], dtype=np.int64).reshape(-1)
+            else:
+                pool_index = np.array([i*n + j for i, j in self.token_info.positions.values()],
+                    dtype=np.int64)
+                scan_order = pool_index
+            self.pool_layout = (tokens, pool_index, scan_order)
+
+        return self.pool_layout
+
+    def rate_tokens(self) -> List[str]:
+        """
+        Returns:
+        1. token types labelling the rows and columns of rate_matrix
+        """
+        return self.__layout()[0]
+
+    def scan_order(self) -> np.ndarray:
+        """
+        Returns:
+        1. flat indices into rate_matrix of the token pairs, in the order
+        arbitrage scans them (ties go to the first pair scanned)
+        """
+        return self.__layout()[2]
+
+    def token_vector(self, status: PoolStatusInterface, slot: int) -> np.ndarray:
+        """
+        Gathers one entry of every token of a multi token pool into a vector
+
+        Parameters:
+        1. status: multi token pool status (token_info or equilibriums)
+        2. slot: index of the entry of each token
+
+        Returns:
+        1. vector whose entry i is status[rate_tokens()[i]][slot]
+        """
+        return status.vector(slot).copy()
+
+    def pool_matrix(self, status: PoolStatusInterface, slot: int) -> np.ndarray:
+        """
+        Gathers one entry of every pairwise pool into a matrix
+
+        Parameters:
+        1. status: pairwise pool status (token_info or equilibriums)
+        2. slot: index of the entry in each pool
+
+        Returns:
+        1. matrix whose entry [i, j] is status[(tokens[i], tokens[j])][slot] for
+        the tokens of rate_tokens (nan where there is no such pool)
+        """
+        return status.matrix(slot).copy()
+
+    def price_vector(self) -> np.ndarray:
+        """
+        Returns:
+        1. current market price of every token of rate_tokens
+        """
+        return np.array([self.prices[tok] for tok in self.rate_tokens()], dtype=np.float64)
+
+    def rate_matrix(self) -> Dict[str, np.ndarray]:
+        """
+        Evaluates getRate for every ordered token pair at once
+
+        Returns:
+        1. A dictionary of the form:
+        {
+            "in_amt": amounts of intype token to input to reach equilibrium,
+            "out_amt": amounts of outtype token to remove to reach equilibrium,
+            "rate": ratios of internal exchange rate to market rate
+        }
+        whose entries [i, j] are for intype tokens[i] and outtype tokens[j] of
+        rate_tokens; rate is nan for pairs that cannot be arbitraged (no pool,
+        same token, crashing outtype or no real equilibrium)
+        """
+        in_e, out_e = self.calculate_equilibrium_matrix()
+
+        if self.multi_token:
+            balances = self.token_vector(self.token_info, 0)
+            in_amt, out_amt = in_e - balances[:, None], balances[None, :] - out_e
+        else:
+            in_amt = in_e - self.pool_matrix(self.token_info, 0)
+            out_amt = self.pool_matrix(self.token_info, 1) - out_e
+
+        prices = self.price_vector()
+        with np.errstate(all="ignore"):
+            internal_rate = np.where(out_amt == 0, 1, in_amt / out_amt)
+            internal_rate[internal_rate == 0] = 1
+            rate = (prices[None, :] / prices[:, None]) / internal_rate
+
+        np.fill_diagonal(rate, np.nan)
+        rate[:, [tok in self.crash_type for tok in self.rate_tokens()]] = np.nan
+
+        return {
+                "in_amt": in_amt,
+                "out_amt": out_amt,
+                "rate": rate
+            }
+
+    def arbitrage(self, lim: float = 1e-8
+    ) -> Tuple[List[OutputTx], List[List[Tuple[object, int, float]]]]:
         """
         Performs self.arb_actions arbitrage swaps by returning token pairs "furthest"
         from equilibrium to an equilibrium defined by market exchange rates
@@ -163,48 +896,42 @@ class MarketMakerInterface:
 
         Returns:
         1. list of OutputTx detailing arbitrage swap details
-        2. list of pool statuses after each arbitrage swap
+        2. list of pool entries changed by each arbitrage swap
         """
-        outputtx_lst, poolstatus_lst = [], []
+        outputtx_lst, changes_lst = [], []
         info = [("str", "str"), {"rate": -1}]
+        tokens, pool_index, scan_order = self.__layout()
 
         for i in range(self.arb_actions):
-            if self.multi_token:
-                tokens = list(self.token_info.keys())
-                for c, tok1 in enumerate(tokens):
-                    for tok2 in tokens[c+1:]:
-                        pool = (tok1, tok2)
-                        reverse_pool = (tok2, tok1)
-                        if not tok2 in self.crash_type:
-                            rate_dict = self.getRate(pool)
-                            if rate_dict["rate"] > info[1]["rate"] and \
-                                rate_dict["in_amt"] > lim:
-                                info[0] = pool
-                                info[1] = rate_dict
-                        if not tok1 in self.crash_type:
-                            rate_dict = self.getRate(reverse_pool)
-                            if rate_dict["rate"] > info[1]["rate"] and \
-                                rate_dict["in_amt"] > lim:
-                                info[0] = reverse_pool
-                                info[1] = rate_dict
+            # the best pair only replaces the previous one if it beats its rate
+            if self.arb_index is not None:
+                pool, rate_dict = self.arb_index.best(self.getRate, self.rate_matrix,
+                    self.crash_type, lim)
+                if pool is not None and rate_dict["rate"] > info[1]["rate"]:
+                    info[0], info[1] = pool, rate_dict
             else:
-                for p in self.token_info.keys():
-                    if not p[1] in self.crash_type:
-                        rate_dict = self.getRate(p)
-                        if rate_dict["rate"] > info[1]["rate"] and \
-                            rate_dict["in_amt"] > lim:
-                            info[0] = p
-                            info[1] = rate_dict
+                rates = self.rate_matrix()
+                rate = rates["rate"].reshape(-1)[scan_order]
+                in_amt = rates["in_amt"].reshape(-1)[scan_order]
+                with np.errstate(invalid="ignore"):
+                    candidates = np.where((rate > info[1]["rate"]) & (in_amt > lim), rate, -np.inf)
+
+                best = int(np.argmax(candidates))
+                if candidates[best] > -np.inf:
+                    row, col = divmod(int(scan_order[best]), len(tokens))
+                    info[0] = (tokens[row], tokens[col])
+                    info[1] = {key: float(value[row, col]) for key, value in rates.items()}
 
             if info[1]["rate"] > 1 and info[1]["in_amt"] > 0:
-                output, token_info = self.swap(InputTx(info[0][0], info[0][1], \
+                output, changes = self.swap(InputTx(info[0][0], info[0][1], \
                     info[1]["in_amt"]), info[1]["out_amt"])
+                self.observe(output)
                 outputtx_lst.append(output)
-                poolstatus_lst.append(token_info)              
+                changes_lst.append(changes)
             else:
                 break
         
-        return outputtx_lst, poolstatus_lst         
+        return outputtx_lst, changes_lst
     
     def getRate(self, pool: Tuple[str, str]) -> Dict[str, float]:
         """
@@ -1,9 +1,9 @@
 from typing import List, Dict, Tuple
-import random
+import numpy as np
 from copy import deepcopy
 
 class Initializer():
-    def __init__(self, constant: float, k: float, random_k: str = "False"):
+    def __init__(self, constant: float, k: float, random_k: str = "False", seed: int = None):
         """
         Calculates a fair starting balance for all market makers (all token pools
         start at an equilibrium point)
@@ -12,10 +12,12 @@ class Initializer():
         1. constant: "size" each token balance should be
         2. k: k value for each pool
         3. random_k: whether or not to use random k for each pool
+        4. seed: seed, SeedSequence or numpy Generator random k values are drawn from
         """
         self.constant = constant
         self.k = k
         self.random_k = random_k == "True"
+        self.rng = np.random.default_rng(seed)
         self.traffic_info, self.price_gen_info = None, None
         self.pairwise_pools, self.pairwise_infos, self.single_pools, \
             self.single_infos, self.crash_types = [], [], [], [], []
@@ -104,8 +106,8 @@ class Initializer():
                 self.pairwise_infos.append(reverse_pool_balances)
 
                 if self.random_k:
-                    token_k[tok1] = random.randrange(1, 1000) / 1000
-                    token_k[tok2] = random.randrange(1, 1000) / 1000
+                    token_k[tok1] = int(self.rng.integers(1, 1000)) / 1000
+                    token_k[tok2] = int(self.rng.integers(1, 1000)) / 1000
                 else:
                     token_k[tok1] = self.k
                     token_k[tok2] = self.k
@@ -0,0 +1,31 @@
+from typing import List
+from outputtx import OutputTx
+from poolstatus import PoolStatusInterface
+
+class SwapObserverInterface:
+    def start(self, initial: PoolStatusInterface, crash_types: List[str]):
+        """
+        Called once before any swap is simulated
+
+        Parameters:
+        1. initial: pool status before any swaps; must not be modified
+        2. crash_types: token types that are crashing
+        """
+        pass
+
+    def observe(self, output: OutputTx, status: PoolStatusInterface):
+        """
+        Called after every executed swap, including arbitrage swaps
+
+        Parameters:
+        1. output: output information associated with the swap
+        2. status: live pool status right after the swap; it keeps changing
+        after the call returns, so it must be copied to be kept
+        """
+        raise NotImplementedError
+
+    def finish(self):
+        """
+        Called once after the last swap is simulated
+        """
+        pass
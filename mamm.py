@@ -1,10 +1,14 @@
 from imarketmaker import MarketMakerInterface
+import simloop
 from inputtx import InputTx
-from typing import List, Tuple
+from typing import List, Tuple, Dict
+import numpy as np
 from outputtx import OutputTx
 from poolstatus import MultiTokenPoolStatus
 
 class MAMM(MarketMakerInterface):
+    loop_kind = simloop.MAMM
+
     def __init__(self, single_pools: List[str], single_infos: List[Tuple[float, float]],
     pairwise_pools = None, pairwise_infos = None):
         """
@@ -20,7 +24,8 @@ class MAMM(MarketMakerInterface):
             for i in range(len(single_pools))})
         self.equilibriums = None
 
-    def swap(self, tx: InputTx, out_amt: float = None) -> Tuple[OutputTx, MultiTokenPoolStatus]:
+    def swap(self, tx: InputTx, out_amt: float = None
+    ) -> Tuple[OutputTx, List[Tuple[object, int, float]]]:
         """
         Initiate a swap specified by tx
 
@@ -29,19 +34,83 @@ class MAMM(MarketMakerInterface):
         2. out_amt: specifies the amount of output token removed
 
         Returns:
-        1. output information associated with swap (after_rate is incorrect)
-        2. status of pool ater swap
+        1. output information associated with swap
+        2. (pool key, entry index, value after swap) for every pool entry changed
+        by the swap
+        """
+        out_amt, after_rate = self.quote(tx.intype, tx.outtype, tx.inval)
+
+        output_tx, changes = super().swap(tx, out_amt)
+        output_tx.after_rate = after_rate
+
+        return output_tx, changes
+
+    def calculate_quote(self, intype: str, outtype: str, inval: float) -> Tuple[float, float]:
         """
-        in_type, in_val, out_type = tx.intype, tx.inval, tx.outtype
-        in_balance, out_balance = self.token_info[in_type][0], self.token_info[out_type][0]
+        Prices a swap from the current pool state
+
+        Parameters:
+        1. intype: input token type
+        2. outtype: output token type
+        3. inval: amount of input token inserted
+
+        Returns:
+        1. amount of output token removed by the swap
+        2. after_rate of the swap
+        """
+        in_balance, out_balance = self.token_info[intype][0], self.token_info[outtype][0]
         const = in_balance * out_balance
-        out_amt = const*(1/in_balance - (1/(in_balance + in_val)))
+        out_amt = const*(1/in_balance - (1/(in_balance + inval)))
+        after_rate = inval / \
+                (const*(1/(in_balance + inval) - (1/(in_balance + 2*inval))))
+
+        return out_amt, after_rate
+    
+    def pair_swaps(self, pairs: Dict[str, np.ndarray], invals: np.ndarray,
+    market_rates: np.ndarray, out_amts: np.ndarray = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Array version of swap's pricing for gathered token pairs; as in swap, the
+        output amount is always quoted
+
+        Parameters:
+        1. pairs: token pairs, from gather_pairs
+        2. invals: amounts of input token inserted
+        3. market_rates: output token price / input token price of each swap
+        4. out_amts: irrelevant (the swaps are quoted)
 
-        output_tx, pool_stat = super().swap(tx, out_amt)
-        output_tx.after_rate = in_val / \
-                (const*(1/(in_balance + in_val) - (1/(in_balance + 2*in_val))))
-        
-        return output_tx, pool_stat
+        Returns:
+        1. amounts of output token removed by the swaps
+        2. after_rates of the swaps
+        3. amounts of input token inserted
+        """
+        in_balance = pairs["i_0"]
+        const = in_balance * pairs["o_0"]
+        with np.errstate(all="ignore"):
+            out_amt = const*(1/in_balance - (1/(in_balance + invals)))
+            after_rate = invals / \
+                    (const*(1/(in_balance + invals) - (1/(in_balance + 2*invals))))
+
+        return out_amt, after_rate, invals
+
+    def pair_equilibriums(self, pairs: Dict[str, np.ndarray], market_rates: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Array version of calculate_equilibriums for gathered token pairs
+
+        Parameters:
+        1. pairs: token pairs, from gather_pairs
+        2. market_rates: output token price / input token price of each pair
+
+        Returns:
+        1. equilibrium balances for input tokens
+        2. equilibrium balances for output tokens
+        """
+        const = pairs["i_0"] * pairs["o_0"]
+        with np.errstate(all="ignore"):
+            new_out = (const / market_rates) ** 0.5
+
+            return const / new_out, new_out
     
     def calculate_equilibriums(self, intype: str, outtype: str) -> Tuple[float, float]:
         """
@@ -60,3 +129,21 @@ class MAMM(MarketMakerInterface):
         new_out = (const / market_rate) ** 0.5
 
         return const / new_out, new_out
+
+    def calculate_equilibrium_matrix(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized calculate_equilibriums over every ordered token pair of
+        rate_tokens
+
+        Returns:
+        1. equilibrium balances for input tokens
+        2. equilibrium balances for output tokens
+        """
+        balances = self.token_vector(self.token_info, 0)
+        const = np.multiply.outer(balances, balances)
+        prices = self.price_vector()
+        market_rate = prices[None, :] / prices[:, None]
+        with np.errstate(all="ignore"):
+            new_out = (const / market_rate) ** 0.5
+
+            return const / new_out, new_out
@@ -1,10 +1,15 @@
-from typing import List, Tuple
+from typing import List, Tuple, Dict
+import numpy as np
 from imarketmaker import MarketMakerInterface
+import simloop
 from inputtx import InputTx
 from outputtx import OutputTx
 from poolstatus import MultiTokenPoolStatus
 
 class MCSMM(MarketMakerInterface):
+    has_arbitrage = False
+    loop_kind = simloop.MCSMM
+
     def __init__(self, single_pools: List[str], single_infos: List[Tuple[float, float]],
     pairwise_pools = None, pairwise_infos = None):
         """
@@ -29,7 +34,8 @@ class MCSMM(MarketMakerInterface):
         """
         return [], []
 
-    def swap(self, tx: InputTx, out_amt: float = None) -> Tuple[OutputTx, MultiTokenPoolStatus]:
+    def swap(self, tx: InputTx, out_amt: float = None
+    ) -> Tuple[OutputTx, List[Tuple[object, int, float]]]:
         """
         Initiate a swap specified by tx
 
@@ -38,18 +44,65 @@ class MCSMM(MarketMakerInterface):
         2. out_amt: specifies the amount of output token removed
 
         Returns:
-        1. output information associated with swap (after_rate is incorrect)
-        2. status of pool ater swap
+        1. output information associated with swap
+        2. (pool key, entry index, value after swap) for every pool entry changed
+        by the swap
         """
         p = self.prices[tx.outtype] / self.prices[tx.intype]
         if out_amt == None:
-            if (tx.inval / p > self.token_info[tx.outtype][0]):
-                out_amt = 0
+            out_amt, p = self.quote(tx.intype, tx.outtype, tx.inval)
+            if out_amt == 0:
+                # the pool cannot cover the swap
                 tx.inval = 0
-            else:
-                out_amt = tx.inval / p
 
-        output_tx, pool_stat = super().swap(tx, out_amt)
+        output_tx, changes = super().swap(tx, out_amt)
         output_tx.after_rate = p
 
-        return output_tx, pool_stat
+        return output_tx, changes
+
+    def pair_swaps(self, pairs: Dict[str, np.ndarray], invals: np.ndarray,
+    market_rates: np.ndarray, out_amts: np.ndarray = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Array version of swap's pricing for gathered token pairs; as in swap,
+        swaps the pool cannot cover insert and remove nothing
+
+        Parameters:
+        1. pairs: token pairs, from gather_pairs
+        2. invals: amounts of input token inserted
+        3. market_rates: output token price / input token price of each swap
+        4. out_amts: amounts of output token removed (quoted if None)
+
+        Returns:
+        1. amounts of output token removed by the swaps
+        2. after_rates of the swaps
+        3. amounts of input token actually inserted
+        """
+        p = market_rates
+        if out_amts is None:
+            with np.errstate(all="ignore"):
+                out_amts = invals / p
+            out_amts = np.where(out_amts > pairs["o_0"], 0, out_amts)
+            invals = np.where(out_amts == 0, 0, invals)
+
+        return out_amts, np.broadcast_to(p, np.shape(out_amts)), invals
+
+    def calculate_quote(self, intype: str, outtype: str, inval: float) -> Tuple[float, float]:
+        """
+        Prices a swap from the current pool state; swaps the pool cannot cover
+        remove nothing
+
+        Parameters:
+        1. intype: input token type
+        2. outtype: output token type
+        3. inval: amount of input token inserted
+
+        Returns:
+        1. amount of output token removed by the swap
+        2. after_rate of the swap
+        """
+        p = self.prices[outtype] / self.prices[intype]
+        if inval / p > self.token_info[outtype][0]:
+            return 0, p
+
+        return inval / p, p
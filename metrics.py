@@ -1,46 +1,310 @@
 import numpy as np
 import statistics
-import matplotlib.pyplot as plt
 import json
-from typing import List, Tuple, Dict
-from outputtx import OutputTx
-from poolstatus import PoolStatusInterface
+from typing import List, Tuple, Dict, Union
+from outputtx import OutputTx, OutputTxLog
+from poolstatus import PoolStatusInterface, PoolStatusHistory
+from iobserver import SwapObserverInterface
+from ensemble import EnsembleOutput
 
-def get_stats(data: List[float], title: str) -> Dict[str, float]:
+SWAP_COLUMNS = OutputTxLog.VALUES
+OBSERVER_CHUNK = 65536
+
+def get_stats(data: np.ndarray, title: str) -> Dict[str, float]:
     """
     Computes and prints statistics given data
 
     Parameters:
-    1. data: data
+    1. data: (x, y) data points, as an (N, 2) array or a list of pairs
     2. title: label for data (to be printed)
 
     Returns:
-    1. statistics on Data
+    1. statistics on the y values of data (see summarize)
     """
     print("\n{} data:".format(title))
-    sliced_data = [i[1] for i in data]
-    stat_dict = {}
-    
-    if len(sliced_data):
-        stat_dict["avg"] = sum(sliced_data) / len(sliced_data)
-        stat_dict["med"] = statistics.median(sliced_data)
-        
-        plot = plt.boxplot(sliced_data)
-        plt.close()
-        quartiles = [item.get_ydata()[0] for item in plot['whiskers']]
-        ends = [item.get_ydata()[1] for item in plot['whiskers']]
-        stat_dict["quart_1"],  stat_dict["quart_3"] = quartiles[0], quartiles[1]
-        stat_dict["min"], stat_dict["max"] = ends[0], ends[1]
-
-        stat_dict["stdv"] = np.std(sliced_data)
+    stat_dict = summarize(np.asarray(data, dtype=np.float64).reshape(-1, 2)[:, 1])
+
+    if len(stat_dict):
         print(json.dumps(stat_dict, indent=4))
     else:
         print("    no {} data".format(title))
 
     return stat_dict
 
-def price_impact(output: List[List[OutputTx]], crash_types: List[str], file: str
-) -> Tuple[List[Tuple[float, float]], Dict[str, float]]:
+def swap_columns(output: Union[OutputTxLog, List[List[OutputTx]]], crash_types: List[str]
+) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """
+    Lays swap outputs out as columns; the columns of an OutputTxLog are sliced
+    directly
+
+    Parameters:
+    1. output: swap metrics
+    2. crash_types: what token types crashed in price
+
+    Returns:
+    1. array of every OutputTx field of SWAP_COLUMNS
+    2. whether or not the input token of each swap crashed in price
+    """
+    if isinstance(output, OutputTxLog):
+        return {name: output.column(name) for name in SWAP_COLUMNS}, output.crashed(crash_types)
+
+    log = OutputTxLog()
+    for batch in output:
+        for info in batch:
+            log.append(info)
+
+    return swap_columns(log, crash_types)
+
+def _drains(columns: Dict[str, np.ndarray], crashed: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns:
+    1. mask of the swaps that remove output token for a non-crashing input token
+    2. internal exchange rate of each swap
+    3. proportion of output token balance each swap removes
+    """
+    in_0, out_0 = columns["inpool_init_val"], columns["outpool_init_val"]
+    in_1, out_1 = columns["inpool_after_val"], columns["outpool_after_val"]
+
+    with np.errstate(all="ignore"):
+        drains = (out_1 < out_0) & ~np.asarray(crashed, dtype=bool) & (out_0 != 0)
+        rate = (in_1 - in_0) / (out_0 - out_1)
+        drained = 1 - out_1 / out_0
+
+    return drains, rate, drained
+
+def price_impact_points(columns: Dict[str, np.ndarray], crashed: np.ndarray) -> np.ndarray:
+    """
+    Computes the price impact metric (see price_impact) of swaps given as columns
+
+    Parameters:
+    1. columns: arrays of the OutputTx fields of SWAP_COLUMNS
+    2. crashed: whether or not the input token of each swap crashed in price
+
+    Returns:
+    1. (N, 2) array of (proportion of output token drained, magnitude of the
+    percentage change of exchange rate) for every swap the metric covers
+    """
+    drains, rate, drained = _drains(columns, crashed)
+    keep = drains & (rate != 0)
+    with np.errstate(all="ignore"):
+        impact = np.abs((columns["after_rate"][keep] - rate[keep]) / rate[keep])
+
+    return np.stack([drained[keep], impact], axis=1)
+
+def capital_efficiency_points(columns: Dict[str, np.ndarray], crashed: np.ndarray
+) -> np.ndarray:
+    """
+    Computes the capital efficiency metric (see capital_efficiency) of swaps
+    given as columns
+
+    Parameters:
+    1. columns: arrays of the OutputTx fields of SWAP_COLUMNS
+    2. crashed: whether or not the input token of each swap crashed in price
+
+    Returns:
+    1. (N, 2) array of (proportion of output token drained, internal exchange
+    rate / market rate) for every swap the metric covers
+    """
+    drains, rate, drained = _drains(columns, crashed)
+    market_rate = columns["market_rate"]
+    keep = drains & (market_rate != 0)
+    with np.errstate(all="ignore"):
+        efficiency = rate[keep] / market_rate[keep]
+
+    return np.stack([drained[keep], efficiency], axis=1)
+
+def impermanent_loss_points(changes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, int, int]:
+    """
+    Splits relative token balance changes into impermanent gains and losses
+
+    Parameters:
+    1. changes: (swaps, tokens) changes of the tracked token balances after
+    each swap, relative to the start (status[key][0] / initial[key][0] - 1)
+
+    Returns:
+    1. (N, 2) array of (swap number, magnitude) of every increase, swap by swap
+    2. (N, 2) array of (swap number, magnitude) of every decrease (or no change)
+    3. number of the last swap with an increase (0 if there is none)
+    4. number of the last swap with a decrease (0 if there is none)
+    """
+    changes = np.asarray(changes, dtype=np.float64)
+    gains = changes > 0
+    swap_ids = np.broadcast_to(np.arange(1, len(changes) + 1)[:, None], changes.shape)
+
+    points = [np.stack([swap_ids[mask], np.abs(changes[mask])], axis=1) \
+        for mask in [gains, ~gains]]
+
+    return points[0], points[1], int(swap_ids[gains].max(initial=0)), \
+        int(swap_ids[~gains].max(initial=0))
+
+class SwapColumnsObserver(SwapObserverInterface):
+    def __init__(self, chunk_size: int = OBSERVER_CHUNK):
+        """
+        Computes a metric from swap columns while swaps happen: swaps are logged
+        in an OutputTxLog of at most chunk_size swaps, whose points (see points)
+        are computed and kept each time it fills up, so only the points and one
+        chunk of swaps are held at a time
+
+        Parameters:
+        1. chunk_size: number of swaps logged before their points are computed
+        """
+        self.chunk_size = chunk_size
+        self.log = OutputTxLog(capacity=chunk_size)
+        self.chunks = []
+        self.result = np.empty((0, 2))
+        self.crash_types = []
+
+    def start(self, initial: PoolStatusInterface, crash_types: List[str]):
+        self.crash_types = crash_types
+
+    def observe(self, info: OutputTx, status: PoolStatusInterface = None):
+        self.log.append(info)
+        if self.log.swaps == self.chunk_size:
+            self.__flush()
+
+    def points(self, columns: Dict[str, np.ndarray], crashed: np.ndarray) -> np.ndarray:
+        """
+        Parameters:
+        1. columns: arrays of the OutputTx fields of SWAP_COLUMNS of logged swaps
+        2. crashed: whether or not the input token of each swap crashed in price
+
+        Returns:
+        1. (N, 2) array of the metric's points of the swaps
+        """
+        raise NotImplementedError
+
+    def collect(self) -> np.ndarray:
+        """
+        Returns:
+        1. (N, 2) array of the metric's points of every observed swap
+        """
+        self.__flush()
+        self.result = np.concatenate(self.chunks) if self.chunks else np.empty((0, 2))
+
+        return self.result
+
+    def __flush(self):
+        """
+        Computes the points of the logged swaps and starts a new chunk
+        """
+        if self.log.swaps:
+            self.chunks.append(self.points(*swap_columns(self.log, self.crash_types)))
+        self.log = OutputTxLog(self.log.tokens, self.chunk_size)
+
+class PriceImpactObserver(SwapColumnsObserver):
+    def __init__(self, chunk_size: int = OBSERVER_CHUNK):
+        """
+        Computes the price impact metric (see price_impact) chunk by chunk while
+        swaps happen
+
+        Parameters:
+        1. chunk_size: see SwapColumnsObserver
+        """
+        super().__init__(chunk_size)
+
+    def points(self, columns: Dict[str, np.ndarray], crashed: np.ndarray) -> np.ndarray:
+        return price_impact_points(columns, crashed)
+
+    def results(self, file: str) -> Tuple[np.ndarray, Dict[str, float]]:
+        """
+        Parameters:
+        1. file: name of file running simulation from
+
+        Returns:
+        1. magnitude of percentage changes of exchange rates after each swap
+        2. statistics of results
+        """
+        return self.collect(), get_stats(self.result, "{} price impact".format(file))
+
+class CapitalEfficiencyObserver(SwapColumnsObserver):
+    def __init__(self, chunk_size: int = OBSERVER_CHUNK):
+        """
+        Computes the capital efficiency metric (see capital_efficiency) chunk by
+        chunk while swaps happen
+
+        Parameters:
+        1. chunk_size: see SwapColumnsObserver
+        """
+        super().__init__(chunk_size)
+
+    def points(self, columns: Dict[str, np.ndarray], crashed: np.ndarray) -> np.ndarray:
+        return capital_efficiency_points(columns, crashed)
+
+    def results(self, file: str) -> Tuple[np.ndarray, Dict[str, float]]:
+        """
+        Parameters:
+        1. file: name of file running simulation from
+
+        Returns:
+        1. ratios of internal vs market exchange rate for each swap
+        2. statistics of results
+        """
+        return self.collect(), get_stats(self.result, "{} capital efficiency".format(file))
+
+class ImpermanentLossObserver(SwapObserverInterface):
+    def __init__(self):
+        """
+        Streams the impermanent loss metric (see impermanent_loss) while swaps
+        happen; the tracked token balances are buffered as one row per swap
+        """
+        self.balances = []
+        self.pos_results = np.empty((0, 2))
+        self.neg_results = np.empty((0, 2))
+        self.swap_counter = 1
+        self.last_loss = 0
+        self.last_gain = 0
+        self.initial = None
+        self.crash_types = []
+        self.keys = []
+        self.index = None
+
+    def start(self, initial: PoolStatusInterface, crash_types: List[str]):
+        self.initial = initial
+        self.crash_types = crash_types
+        self.keys = [key for key in initial if not key in crash_types]
+        # array-backed statuses are gathered with one fancy index
+        positions = getattr(initial, "positions", None)
+        if positions is not None and len(self.keys):
+            self.index = tuple(np.array(ix) for ix in \
+                zip(*[np.atleast_1d(positions[key]) for key in self.keys])) + (0,)
+
+    def observe(self, info: OutputTx, status: PoolStatusInterface):
+        if self.index is not None and hasattr(status, "array"):
+            self.balances.append(status.array[self.index])
+        else:
+            self.balances.append([status[key][0] for key in self.keys])
+
+        self.swap_counter += 1
+
+    def results(self, file: str
+    ) -> Tuple[np.ndarray, np.ndarray, Dict[str, float], Dict[str, float]]:
+        """
+        Parameters:
+        1. file: name of file running simulation from
+
+        Returns:
+        1. percentage increases of token balances after each swap (relative to start)
+        2. percentage decreases of token balances after each swap (relative to start)
+        3. statistics on token balance increases
+        4. statistics on token balance decreases
+        """
+        initial = np.array([self.initial[key][0] for key in self.keys], dtype=np.float64)
+        balances = np.array(self.balances, dtype=np.float64).reshape(-1, len(self.keys))
+        with np.errstate(all="ignore"):
+            changes = balances / initial - 1
+        self.pos_results, self.neg_results, self.last_gain, self.last_loss = \
+            impermanent_loss_points(changes)
+
+        pos_dict = get_stats(self.pos_results, "{} impermanent gain".format(file))
+        neg_dict = get_stats(self.neg_results, "{} impermanent loss".format(file))
+        pos_dict["last_gain"], pos_dict["last_swap"] = self.last_gain, self.swap_counter
+        neg_dict["last_loss"], pos_dict["last_swap"] = self.last_loss, self.swap_counter
+
+        return self.pos_results, self.neg_results, pos_dict, neg_dict
+
+def price_impact(output: Union[OutputTxLog, List[List[OutputTx]]], crash_types: List[str], file: str
+) -> Tuple[np.ndarray, Dict[str, float]]:
     """
     Measures magnitude of price impact for transaction pairs before and after 
     transactions' execution as function of proportion of output token balance 
@@ -59,24 +323,13 @@ def price_impact(output: List[List[OutputTx]], crash_types: List[str], file: str
     1. magnitude of percentage changes of exchange rates after each swap
     2. statistics of results
     """
-    result = []
-    
-    for lst in output:
-        for info in lst:
-            if info.outpool_after_val < info.outpool_init_val and \
-                 not info.in_type in crash_types:
-                try:
-                    rate = (info.inpool_after_val - info.inpool_init_val) / \
-                        (info.outpool_init_val - info.outpool_after_val)
-                    drained = 1 - info.outpool_after_val / info.outpool_init_val
-                    result.append([drained, abs((info.after_rate - rate) / rate)])
-                except:
-                    continue
-    
+    result = price_impact_points(*swap_columns(output, crash_types))
+
     return result, get_stats(result, "{} price impact".format(file))
 
-def capital_efficiency(output: List[List[OutputTx]], crash_types: List[str], file: str
-) -> Tuple[List[Tuple[float, float]], Dict[str, float]]:
+def capital_efficiency(output: Union[OutputTxLog, List[List[OutputTx]]],
+crash_types: List[str], file: str
+) -> Tuple[np.ndarray, Dict[str, float]]:
     """
     Measures internal swap rate against market rate as function of proportion of
     output token balance removed
@@ -94,30 +347,19 @@ def capital_efficiency(output: List[List[OutputTx]], crash_types: List[str], fil
     1. ratios of internal vs market exchange rate for each swap
     2. statistics of results
     """
-    result = []
+    result = capital_efficiency_points(*swap_columns(output, crash_types))
 
-    for batch in output:
-        for info in batch:
-            if info.outpool_after_val < info.outpool_init_val and \
-                 not info.in_type in crash_types:
-                try:
-                    rate = (info.inpool_after_val - info.inpool_init_val) / \
-                        (info.outpool_init_val - info.outpool_after_val)
-                    drained = 1 - info.outpool_after_val / info.outpool_init_val
-                    result.append([drained, rate / info.market_rate])
-                except:
-                    continue
-    
     return result, get_stats(result, "{} capital efficiency".format(file))
 
-def impermanent_loss(initial: PoolStatusInterface, history: List[List[PoolStatusInterface]],
+def impermanent_loss(initial: PoolStatusInterface, history: PoolStatusHistory,
 crash_types: List[str], file: str) -> Tuple[List[float], List[float], Dict[str, float], Dict[str, float]]:
     """
     Measures the amount of impermanent loss or gain between batches
 
     Parameters:
     1. initial: pool state before any swaps
-    2. history: pool state after each transaction
+    2. history: pool state after each transaction; statuses are rebuilt one at
+    a time by replaying the recorded changes
     3. crash_types: what token types crashed in price (are excluded from metrics)
     4. file: name of file running simulation from
 
@@ -127,29 +369,135 @@ crash_types: List[str], file: str) -> Tuple[List[float], List[float], Dict[str,
     3. statistics on token balance increases
     4. statistics on token balance decreases
     """
-    pos_results = []
-    neg_results = []
-    swap_counter = 1
-    last_loss = 0
-    last_gain = 0
-
-    for batch in history:
-        for status in batch:
-            for token in initial:
-                if not token in crash_types:
-                    change = status[token][0] / initial[token][0] - 1
-                    if change > 0:
-                        last_gain = swap_counter
-                        pos_results.append((swap_counter, abs(change)))
-                    else:
-                        last_loss = swap_counter
-                        neg_results.append((swap_counter, abs(change)))            
-            
-            swap_counter += 1
-    
-    pos_dict = get_stats(pos_results, "{} impermanent gain".format(file))
-    neg_dict = get_stats(neg_results, "{} impermanent loss".format(file))
-    pos_dict["last_gain"], pos_dict["last_swap"] = last_gain, swap_counter
-    neg_dict["last_loss"], pos_dict["last_swap"] = last_loss, swap_counter
+    if isinstance(history, PoolStatusHistory):
+        statuses = history.states()
+    else:
+        statuses = (status for batch in history for status in batch)
+
+    observer = ImpermanentLossObserver()
+    observer.start(initial, crash_types)
+    for status in statuses:
+        observer.observe(None, status)
     
-    return pos_results, neg_results, pos_dict, neg_dict
+    return observer.results(file)
+
+def summarize(data: np.ndarray) -> Dict[str, float]:
+    """
+    Computes statistics of values: mean, median, quartiles, standard deviation,
+    and as min and max the whisker ends of a 1.5 IQR boxplot (the most extreme
+    values within 1.5 IQR of the quartiles)
+
+    Parameters:
+    1. data: values
+
+    Returns:
+    1. statistics on data
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if not len(data):
+        return {}
+
+    quart_1, med, quart_3 = np.percentile(data, [25, 50, 75])
+    iqr = quart_3 - quart_1
+    low, high = data[data >= quart_1 - 1.5 * iqr], data[data <= quart_3 + 1.5 * iqr]
+
+    return {
+            "avg": float(np.mean(data)),
+            "med": float(med),
+            "quart_1": float(quart_1),
+            "quart_3": float(quart_3),
+            "min": float(min(np.min(low), quart_1)) if len(low) else float(quart_1),
+            "max": float(max(np.max(high), quart_3)) if len(high) else float(quart_3),
+            "stdv": float(np.std(data))
+        }
+
+def replica_metrics(output: EnsembleOutput, replica: int) -> Dict[str, Dict[str, float]]:
+    """
+    Computes the statistics of every metric category for one replica of an
+    Ensemble simulation, as the metric observers would for its swaps
+
+    Parameters:
+    1. output: swaps of an Ensemble simulation
+    2. replica: index of the replica
+
+    Returns:
+    1. statistics of each metric category
+    """
+    steps = output.executed[:, replica]
+    columns = {name: column[steps, replica] for name, column in output.columns.items()}
+    crashed = output.crash[columns["in_type"]]
+    price_impact = price_impact_points(columns, crashed)[:, 1]
+    capital_efficiency = capital_efficiency_points(columns, crashed)[:, 1]
+    gains, losses, last_gain, last_loss = impermanent_loss_points(output.changes[steps, replica])
+
+    # states without a real value are nan in an Ensemble, so they are left out
+    finite = lambda values: values[np.isfinite(values)]
+    gain_dict = summarize(finite(gains[:, 1]))
+    loss_dict = summarize(finite(losses[:, 1]))
+    gain_dict["last_gain"], gain_dict["last_swap"] = last_gain, int(steps.sum()) + 1
+    loss_dict["last_loss"] = last_loss
+
+    return {
+        "price_impact": summarize(finite(price_impact)),
+        "capital_efficiency": summarize(finite(capital_efficiency)),
+        "impermanent_gain": gain_dict,
+        "impermanent_loss": loss_dict
+    }
+
+def confidence_intervals(samples: List[Dict[str, float]], confidence: float = 0.95
+) -> Dict[str, Dict[str, float]]:
+    """
+    Aggregates statistics across replicas: the mean of every statistic and a
+    normal approximation confidence interval of it
+
+    Parameters:
+    1. samples: statistics of each replica
+    2. confidence: confidence level of the intervals
+
+    Returns:
+    1. for every statistic, a dictionary of the form:
+    {
+        "mean": mean across replicas,
+        "ci_low": lower end of the confidence interval,
+        "ci_high": upper end of the confidence interval,
+        "replicas": number of replicas the statistic is defined for
+    }
+    (the interval is nan if the statistic is defined for fewer than 2 replicas)
+    """
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    stat_names = list(dict.fromkeys(name for sample in samples for name in sample))
+
+    stat_dict = {}
+    for name in stat_names:
+        values = np.array([sample[name] for sample in samples if name in sample],
+            dtype=np.float64)
+        mean = float(np.mean(values))
+        half = z * float(np.std(values, ddof=1)) / len(values) ** 0.5 \
+            if len(values) > 1 else np.nan
+        stat_dict[name] = {
+            "mean": mean,
+            "ci_low": mean - half,
+            "ci_high": mean + half,
+            "replicas": len(values)
+        }
+
+    return stat_dict
+
+def ensemble_metrics(output: EnsembleOutput, confidence: float = 0.95
+) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Reports every metric category of an Ensemble simulation as means and
+    confidence intervals of the statistics of each replica (see
+    replica_metrics and confidence_intervals)
+
+    Parameters:
+    1. output: swaps of an Ensemble simulation
+    2. confidence: confidence level of the intervals
+
+    Returns:
+    1. aggregated statistics of each metric category
+    """
+    samples = [replica_metrics(output, replica) for replica in range(output.replicas)]
+
+    return {category: confidence_intervals([sample[category] for sample in samples],
+        confidence) for category in samples[0]}
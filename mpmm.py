@@ -1,11 +1,18 @@
-from typing import List, Tuple
+from typing import List, Tuple, Dict
+import numpy as np
 from imarketmaker import MarketMakerInterface
+import simloop
+import pmmcurve
 from inputtx import InputTx
 from outputtx import OutputTx
 from poolstatus import MultiTokenPoolStatus
 from copy import deepcopy
 
 class MPMM(MarketMakerInterface):
+    loop_kind = simloop.MPMM
+    # each scalar swap solves the curve on its own, so pricing swaps as arrays pays off
+    batch_by_default = True
+
     def __init__(self, single_pools: List[str], single_infos: List[Tuple[float, float]],
     pairwise_pools = None, pairwise_infos = None):
         """
@@ -21,6 +28,8 @@ class MPMM(MarketMakerInterface):
             for i in range(len(single_pools))})
         self.equilibriums = deepcopy(self.token_info)
         self.float_tolerance = 1e-6
+        self.equilibrium_memo = {}
+        self.memo_size = 4096
     
     def getK(self, intype: str, outtype: str) -> float:
         """
@@ -53,52 +62,7 @@ class MPMM(MarketMakerInterface):
         Returns:
         1. optimal excess token equilibrium point
         """
-        t1 = 4*k*L**2*p*s*S**2
-        t2 = 4*k**2*l*p**2*S**4
-        t3 = 8*k**2*L*p**2*S**4
-        t4 = k*p**3*s*S**4
-        t5 = L**4*s**2+4*k*l*L**2*p*s*S**2
-        t6 = 4*k*L**3*p*s*S**2
-        t7 = L**2*p**2*s**2*S**2
-        t8 = 8*k**2*l*L*p**2*S**4
-        t9 = 4*k**2*L**2*p**2*S**4
-        t10 = 2*k*L*p**3*s*S**4
-        t11 = 1024*k**3*L**6*p**3*s**3*S**6
-        t12 = 6144*k**4*l*L**4*p**4*s**2*S**8
-        t13 = 6144*k**4*L**5*p**4*s**2*S**8
-        t14 = 5376*k**3*L**4*p**5*s**3*S**8
-        t15 = 27648*k**4*L**4*p**5*s**3*S**8
-        t16 = 27648*k**5*L**4*p**5*s**3*S**8
-        t17 = 27648*k**4*L**4*p**5*s**2*S**9
-        t18 = 55296*k**5*L**4*p**5*s**2*S**9
-        t19 = 12288*k**5*l**2*L**2*p**5*s*S**10
-        t20 = 24576*k**5*l*L**3*p**5*s*S**10
-        t21 = 39936*k**5*L**4*p**5*s*S**10
-        t22 = 6144*k**4*l*L**2*p**6*s**2*S**10
-        t23 = 6144*k**4*L**3*p**6*s**2*S**10
-        t24 = 768*k**3*L**2*p**7*s**3*S**10
-        t25 = 8192*k**6*l**3*p**6*S**12
-        t26 = 24576*k**6*l**2*L*p**6*S**12
-        t27 = 24576*k**6*l*L**2*p**6*S**12
-        t28 = 8192*k**6*L**3*p**6*S**12
-        t29 = 6144*k**5*l**2*p**7*s*S**12
-        t30 = 12288*k**5*l*L*p**7*s*S**12
-        t31 = 6144*k**5*L**2*p**7*s*S**12
-        t32 = 1536*k**4*l*p**8*s**2*S**12
-        t33 = 1536*k**4*L*p**8*s**2*S**12
-        t34 = 128*k**3*p**9*s**3*S**12
-        t35 = k**2*p**2*S**4
-        x1 = t1+t2+t3+t4
-        x2 = t5+t6+t7+t8+t9+t10
-        x3 = t11-t12+t13+t14-t15+t16+t17-t18+t19-t20+t21+t22-t23+t24-t25+t26-t27+t28-t29+t30-t31-t32+t33-t34
-        x4 = -16*x1**2+192*t35*x2
-        x5 = (x3+(x3**2+4*x4**3)**0.5)**(1/3)
-
-        ans = x1/(12*t35)+x4/(24*2**(2/3)*t35*x5)-(1/(48*2**(1/3)*t35))*x5
-        if isinstance(ans, complex):
-            return ans.real
-        else:
-            return ans
+        return pmmcurve.excess_equilibrium(s, l, S, L, p, k)
     
     def calculate_equilibriums(self, intype: str, outtype: str) -> Tuple[float, float]:
         """
@@ -112,21 +76,47 @@ class MPMM(MarketMakerInterface):
         1. equilibrium balance for input token
         2. equilibrium balance for output token
         """
-        k = self.getK(intype, outtype)
-        p = self.prices[outtype] / self.prices[intype]
-        lst = []
-        I, O = self.equilibriums[intype][0], self.equilibriums[outtype][0]
+        return self.__equilibriums(self.token_info[intype][0], self.token_info[outtype][0],
+            self.equilibriums[intype][0], self.equilibriums[outtype][0],
+            self.getK(intype, outtype), self.prices[intype], self.prices[outtype])
+
+    def __equilibriums(self, in_0: float, out_0: float, I: float, O: float, k: float,
+    in_price: float, out_price: float) -> Tuple[float, float]:
+        """
+        Calculates equilibrium balances of a token pair from its state; results
+        are memoized on the state, so a pair that has not changed is not solved
+        again
+
+        Parameters:
+        1. in_0: input token balance
+        2. out_0: output token balance
+        3. I: input token balance at pool's initialization
+        4. O: output token balance at pool's initialization
+        5. k: k parameter between 2 token types
+        6. in_price: market price of input token
+        7. out_price: market price of output token
+
+        Returns:
+        1. equilibrium balance for input token
+        2. equilibrium balance for output token
+        """
+        key = (in_0, out_0, I, O, k, in_price, out_price)
+        if key in self.equilibrium_memo:
+            return self.equilibrium_memo[key]
+        if len(self.equilibrium_memo) >= self.memo_size:
+            self.equilibrium_memo.clear()
 
-        in_0, out_0 = self.token_info[intype][0], self.token_info[outtype][0]
+        p = out_price / in_price
+        lst = []
         lst.append(((in_0, out_0), self.__distSq(I, O, in_0, out_0)))
 
-        in_1, out_1 = self.__getEquilibrium(intype, outtype, k, 1 / p)
+        in_1, out_1 = self.__getEquilibrium(in_0, out_0, I, O, k, 1 / p)
         if not(isinstance(in_1, complex) or isinstance(out_1, complex)):
             if (in_1 + self.float_tolerance >= in_0 and out_0 + self.float_tolerance >= out_1) or \
                 (out_1 + self.float_tolerance >= out_0 and in_0 + self.float_tolerance >= in_1):
                 lst.append(((in_1, out_1), self.__distSq(I, O, in_1, out_1)))
 
-        out_2, in_2 = self.__getEquilibrium(outtype, intype, k, p)
+        out_2, in_2 = self.__getEquilibrium(out_0, in_0, O, I, k, p)
         if not(isinstance(in_2, complex) or isinstance(out_2, complex)):
             if (in_2 + self.float_tolerance >= in_0 and out_0 + self.float_tolerance >= out_2) or \
                 (out_2 + self.float_tolerance >= out_0 and in_0 + self.float_tolerance >= in_2):
@@ -134,25 +124,113 @@ class MPMM(MarketMakerInterface):
 
         lst = sorted(lst, key=lambda x: x[1])
 
-        return lst[0][0][0], lst[0][0][1]
+        self.equilibrium_memo[key] = lst[0][0][0], lst[0][0][1]
+        return self.equilibrium_memo[key]
     
-    def __getEquilibrium(self, short: str, long: str, k: float, p: float) -> Tuple[float, float]:
+    def calculate_equilibrium_matrix(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized calculate_equilibriums over every ordered token pair of
+        rate_tokens
+
+        Returns:
+        1. equilibrium balances for input tokens
+        2. equilibrium balances for output tokens
+        """
+        balances = self.token_vector(self.token_info, 0)
+        ks = self.token_vector(self.token_info, 1)
+        desired = self.token_vector(self.equilibriums, 0)
+        prices = self.price_vector()
+
+        k = np.maximum.outer(ks, ks)
+        p = prices[None, :] / prices[:, None]
+        in_0, out_0 = balances[:, None], balances[None, :]
+        I, O = desired[:, None], desired[None, :]
+
+        with np.errstate(all="ignore"):
+            # input token in shortage; the output token in shortage is the same
+            # solve for the reversed pair, i.e. the transpose
+            out_1 = pmmcurve.excess_equilibria(in_0, out_0, I, O, 1 / p, k)
+            in_1 = pmmcurve.shortage_equilibrium(in_0, out_0, out_1, 1 / p, k)
+
+            return self.__closest(in_0, out_0, I, O, [(in_1, out_1), (out_1.T, in_1.T)])
+
+    def __equilibrium_arrays(self, in_0: np.ndarray, out_0: np.ndarray, I: np.ndarray,
+    O: np.ndarray, k: np.ndarray, p: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized __equilibriums over independent token pair states; p is the
+        market rate out_price / in_price
+
+        Returns:
+        1. equilibrium balances for input tokens
+        2. equilibrium balances for output tokens
+        """
+        with np.errstate(all="ignore"):
+            out_1 = pmmcurve.excess_equilibria(in_0, out_0, I, O, 1 / p, k)
+            in_1 = pmmcurve.shortage_equilibrium(in_0, out_0, out_1, 1 / p, k)
+            in_2 = pmmcurve.excess_equilibria(out_0, in_0, O, I, p, k)
+            out_2 = pmmcurve.shortage_equilibrium(out_0, in_0, in_2, p, k)
+
+            return self.__closest(in_0, out_0, I, O, [(in_1, out_1), (in_2, out_2)])
+
+    def __closest(self, in_0: np.ndarray, out_0: np.ndarray, I: np.ndarray, O: np.ndarray,
+    solutions: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Picks, for arrays of token pair states, the candidate equilibrium closest
+        to the desired one the way __equilibriums does: the current balances and
+        every solution that does not move both balances the same way, nan
+        solutions excluded
+
+        Parameters:
+        1. in_0: input token balances
+        2. out_0: output token balances
+        3. I: desired input token equilibriums
+        4. O: desired output token equilibriums
+        5. solutions: (input, output) equilibriums with the input and with the
+        output token in shortage
+
+        Returns:
+        1. equilibrium balances for input tokens
+        2. equilibrium balances for output tokens
+        """
+        tol = self.float_tolerance
+
+        with np.errstate(all="ignore"):
+            candidates = [(in_0, out_0, True)]
+            for in_x, out_x in solutions:
+                valid = ((in_x + tol >= in_0) & (out_0 + tol >= out_x)) | \
+                    ((out_x + tol >= out_0) & (in_0 + tol >= in_x))
+                candidates.append((in_x, out_x, valid))
+
+            dists = [np.where(valid, self.__distSq(I, O, in_x, out_x), np.inf) \
+                for in_x, out_x, valid in candidates]
+
+        # first of equally distant candidates, as the stable sort picks
+        best = np.argmin(np.broadcast_arrays(*dists), axis=0)
+        in_e = np.choose(best, [in_x for in_x, out_x, valid in candidates])
+        out_e = np.choose(best, [out_x for in_x, out_x, valid in candidates])
+
+        return in_e, out_e
+    
+    def __getEquilibrium(self, s: float, l: float, S: float, L: float, k: float, p: float
+    ) -> Tuple[float, float]:
         """
         Calculates and returns equilibrium balances given a short and long token type
 
         Parameters:
-        1. short: shortage token type
-        2. long: excess token type
+        1. s: shortage token balance
+        2. l: excess token balance
+        3. S: shortage token balance at pool's initialization
+        4. L: excess token balance at pool's initialization
+        5. k: k parameter between 2 token types
+        6. p: exchange rates in units of excess tokens / shortage tokens
 
         Returns:
         1. equilibrium balance for shortage token type
         2. equilibrium balance for excess token type
         """
-        s = self.token_info[short][0]
-        l = self.token_info[long][0]
-        l_e = self.__argMin(s, l, k, p, self.equilibriums[short][0], self.equilibriums[long][0])
+        l_e = self.__argMin(s, l, k, p, S, L)
 
-        return s + s / (2*k) * ((1 + (4*k * (l - l_e)) / (s * p))**0.5 - 1), l_e
+        return pmmcurve.shortage_equilibrium(s, l, l_e, p, k), l_e
 
     def __distSq(self, x0: float, y0: float, x1: float, y1: float) -> float:
         """
@@ -170,83 +248,122 @@ class MPMM(MarketMakerInterface):
         """
         return (1 - x1 / x0) ** 2 + (1 - y1 / y0) ** 2
 
-    def __solveLong(self, x: float, l_e: float, s_e: float, p: float, k: float
-    ) -> float:
+    def swap(self, tx: InputTx, out_amt: float = None, execute: bool = True
+    ) -> Tuple[OutputTx, List[Tuple[object, int, float]]]:
         """
-        Given the balance of the token in shortage, finds the corresponding balance
-        of the token in excess
+        Initiate a swap specified by tx given that the amount of output token removed
+        is known
 
         Parameters:
-        1. x: shortage token balance
-        2. s_e: shortage token equilibrium balance
-        3. p: exchange rates in units of excess tokens / shortage tokens
-        4. k: k parameter between 2 token types
+        1. tx: transaction
+        2. out_amt: specifies the amount of output token removed
+        3. execute: whether or not to execute the swap
+        
+        Returns:
+        1. output information associated with swap
+        2. (pool key, entry index, value after swap) for every pool entry changed
+        by the swap
+        """
+        after_rate = None
+        if out_amt == None:
+            out_amt, after_rate = self.quote(tx.intype, tx.outtype, tx.inval)
+        output_tx, changes = super().swap(tx, out_amt, execute)
+
+        if execute:
+            if after_rate == None:
+                after_rate = tx.inval / self.__out_amount(tx.intype, tx.outtype,
+                    self.token_info[tx.intype][0], self.token_info[tx.outtype][0], tx.inval)
+            output_tx.after_rate = after_rate
+        
+        return output_tx, changes
+
+    def calculate_quote(self, intype: str, outtype: str, inval: float) -> Tuple[float, float]:
+        """
+        Prices a swap from the current pool state
+
+        Parameters:
+        1. intype: input token type
+        2. outtype: output token type
+        3. inval: amount of input token inserted
 
         Returns:
-        1. excess token balance
+        1. amount of output token removed by the swap
+        2. after_rate of the swap
         """
-        return l_e - p * (x - s_e) * (1 - k + k * s_e / x)
-    
-    def __solveShort(self, y: float, L: float, S: float, p: float, k: float
-    ) -> float:
+        i_0, o_0 = self.token_info[intype][0], self.token_info[outtype][0]
+        out_amt = self.__out_amount(intype, outtype, i_0, o_0, inval)
+        after_rate = inval / self.__out_amount(intype, outtype, i_0 + inval, o_0 - out_amt, inval)
+
+        return out_amt, after_rate
+
+    def pair_swaps(self, pairs: Dict[str, np.ndarray], invals: np.ndarray,
+    market_rates: np.ndarray, out_amts: np.ndarray = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
-        Given the balance of the token in excess, finds the corresponding balance
-        of the token in shortage
+        Array version of swap's pricing for gathered token pairs
 
         Parameters:
-        1. y: excess token balance
-        2. L: excess token equilibrium balance
-        3. p: exchange rates in units of excess tokens / shortage tokens
-        4. k: k parameter between 2 token types
+        1. pairs: token pairs, from gather_pairs
+        2. invals: amounts of input token inserted
+        3. market_rates: output token price / input token price of each swap
+        4. out_amts: amounts of output token removed (quoted if None)
 
         Returns:
-        1. Shortage token balance
+        1. amounts of output token removed by the swaps
+        2. after_rates of the swaps
+        3. amounts of input token inserted
         """
-        return (y-L-p*S+2*k*p*S-(y**2-2*y*L+L**2-2*y*p*S+4*k*y*p*S+2*L*p*S-4*k*L*p*S+p**2*S**2)**0.5)\
-            /(2*(-1+k)*p)
+        i_0, o_0, k = pairs["i_0"], pairs["o_0"], pairs["k"]
+        I, O = pairs["in_eq"], pairs["out_eq"]
+        p = market_rates
 
-    def swap(self, tx: InputTx, out_amt: float = None, execute: bool = True
-    ) -> Tuple[OutputTx, MultiTokenPoolStatus]:
+        with np.errstate(all="ignore"):
+            if out_amts is None:
+                in_e, out_e = self.__equilibrium_arrays(i_0, o_0, I, O, k, p)
+                out_amts = o_0 - pmmcurve.out_balances(i_0, o_0, in_e, out_e, invals, p, k)
+
+            i_1, o_1 = i_0 + invals, o_0 - out_amts
+            in_e, out_e = self.__equilibrium_arrays(i_1, o_1, I, O, k, p)
+            after_rate = invals / (o_1 - pmmcurve.out_balances(i_1, o_1, in_e, out_e, invals, p, k))
+
+        return out_amts, after_rate, invals
+
+    def pair_equilibriums(self, pairs: Dict[str, np.ndarray], market_rates: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Initiate a swap specified by tx given that the amount of output token removed
-        is known
+        Array version of calculate_equilibriums for gathered token pairs
 
         Parameters:
-        1. tx: transaction
-        2. out_amt: specifies the amount of output token removed
-        3. execute: whether or not to execute the swap
-        
+        1. pairs: token pairs, from gather_pairs
+        2. market_rates: output token price / input token price of each pair
+
         Returns:
-        1. output information associated with swap (after_rate is incorrect)
-        2. status of pool ater swap
+        1. equilibrium balances for input tokens
+        2. equilibrium balances for output tokens
         """
-        i_0, o_0 = self.token_info[tx.intype][0], self.token_info[tx.outtype][0]
-        in_e, out_e = self.calculate_equilibriums(tx.intype, tx.outtype)
-        if out_amt == None:
-            d = tx.inval
-            k = self.getK(tx.intype, tx.outtype)
-            p = self.prices[tx.outtype] / self.prices[tx.intype]     
-
-            if o_0 / out_e > i_0 / in_e:
-                s_e, l_e = in_e, out_e
-                static_amt = s_e - i_0
-
-                if static_amt < d:
-                    new_pt = self.__solveShort(d - static_amt + s_e, s_e, l_e, p, k)
-                else:
-                    new_pt = self.__solveLong(i_0 + d, l_e, s_e, 1/p, k)
-            else:
-                s_e, l_e = out_e, in_e
-                new_pt = self.__solveShort(i_0 + d, l_e, s_e, p, k)
-        
-        if out_amt == None:
-            output_tx, pool_stat = super().swap(tx, o_0 - new_pt, execute)
-        else:
-            output_tx, pool_stat = super().swap(tx, out_amt, execute)
+        return self.__equilibrium_arrays(pairs["i_0"], pairs["o_0"], pairs["in_eq"],
+            pairs["out_eq"], pairs["k"], market_rates)
 
-        if execute:
-            o, _ = self.swap(tx, None, False)
-            output_tx.after_rate = tx.inval / \
-                (o.outpool_init_val - o.outpool_after_val)
-        
-        return output_tx, pool_stat
+    def __out_amount(self, intype: str, outtype: str, i_0: float, o_0: float, inval: float
+    ) -> float:
+        """
+        Finds the amount of output token a swap removes from given balances of its
+        token pair
+
+        Parameters:
+        1. intype: input token type
+        2. outtype: output token type
+        3. i_0: input token balance before the swap
+        4. o_0: output token balance before the swap
+        5. inval: amount of input token inserted
+
+        Returns:
+        1. amount of output token removed by the swap
+        """
+        I, O = self.equilibriums[intype][0], self.equilibriums[outtype][0]
+        k = self.getK(intype, outtype)
+        in_price, out_price = self.prices[intype], self.prices[outtype]
+        p = out_price / in_price
+
+        in_e, out_e = self.__equilibriums(i_0, o_0, I, O, k, in_price, out_price)
+        return o_0 - pmmcurve.out_balance(i_0, o_0, in_e, out_e, inval, p, k)
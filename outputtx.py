@@ -1,5 +1,11 @@
 
+import numpy as np
+from typing import List, Iterator
+
 class OutputTx:
+    __slots__ = ["in_type", "out_type", "inpool_init_val", "outpool_init_val",
+        "inpool_after_val", "outpool_after_val", "market_rate", "after_rate"]
+
     def __init__(self,
                  in_type: str,
                  out_type: str,
@@ -31,3 +37,186 @@ class OutputTx:
         self.outpool_after_val = outpool_after_val
         self.market_rate = market_rate
         self.after_rate = after_rate
+
+class OutputTxBatch():
+    def __init__(self, log: "OutputTxLog", start: int, end: int):
+        """
+        Read-only view of the swaps of one batch of an OutputTxLog; swaps are
+        materialized as OutputTx objects only when accessed
+
+        Parameters:
+        1. log: log the batch belongs to
+        2. start: index of the first swap of the batch
+        3. end: index after the last swap of the batch
+        """
+        self.log = log
+        self.start = start
+        self.end = end
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __getitem__(self, i: int) -> OutputTx:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("swap index out of range")
+
+        return self.log.output(self.start + i)
+
+    def __iter__(self) -> Iterator[OutputTx]:
+        records = self.log.records[self.start:self.end]
+        tokens = self.log.tokens
+        rows = zip(records["in_type"].tolist(), records["out_type"].tolist(),
+            *[records[name].tolist() for name in OutputTxLog.VALUES])
+
+        for row in rows:
+            yield OutputTx(tokens[row[0]], tokens[row[1]], *row[2:])
+
+class OutputTxLog():
+    VALUES = ["inpool_init_val", "outpool_init_val", "inpool_after_val",
+        "outpool_after_val", "market_rate", "after_rate"]
+    DTYPE = np.dtype([("in_type", np.int32), ("out_type", np.int32)] + \
+        [(name, np.float64) for name in VALUES] + \
+        [("batch", np.int32), ("is_arb", np.bool_)])
+
+    def __init__(self, tokens: List[str] = None, capacity: int = 1024):
+        """
+        Columnar log of swap outputs: one record of DTYPE (61 bytes) per swap, in
+        a preallocated structured array that doubles when full. It reads like
+        the 2-d list of OutputTx it replaces (a sequence of batches of OutputTx
+        views), and metrics can slice its columns directly
+
+        Parameters:
+        1. tokens: token types, indexed by the token ids of in_type and out_type;
+        tokens missing from it get ids as they are appended
+        2. capacity: number of swaps to preallocate
+        """
+        self.tokens = list(tokens or [])
+        self.token_ids = {tok: i for i, tok in enumerate(self.tokens)}
+        self.data = np.empty(max(1, capacity), dtype=self.DTYPE)
+        self.swaps = 0
+        self.batches = 0
+
+    @property
+    def records(self) -> np.ndarray:
+        """
+        Returns:
+        1. records of the logged swaps (a view, not a copy)
+        """
+        return self.data[:self.swaps]
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Parameters:
+        1. name: field of DTYPE
+
+        Returns:
+        1. that field of every logged swap (a view, not a copy)
+        """
+        return self.records[name]
+
+    def crashed(self, crash_types: List[str]) -> np.ndarray:
+        """
+        Parameters:
+        1. crash_types: token types that crashed in price
+
+        Returns:
+        1. whether or not the input token of each logged swap crashed in price
+        """
+        crash = np.array([tok in crash_types for tok in self.tokens], dtype=bool)
+
+        return crash[self.column("in_type")]
+
+    def append(self, info: OutputTx, is_arb: bool = False):
+        """
+        Logs one swap in the current batch
+
+        Parameters:
+        1. info: output information associated with the swap
+        2. is_arb: whether or not the swap was made by arbitrage
+        """
+        self.__reserve(1)
+        self.data[self.swaps] = (self.__token_id(info.in_type), self.__token_id(info.out_type),
+            info.inpool_init_val, info.outpool_init_val, info.inpool_after_val,
+            info.outpool_after_val, info.market_rate, info.after_rate, self.batches, is_arb)
+        self.swaps += 1
+
+    def extend(self, in_types: np.ndarray, out_types: np.ndarray, values: np.ndarray,
+    batches: np.ndarray, is_arb: np.ndarray):
+        """
+        Logs swaps given as columns, in order
+
+        Parameters:
+        1. in_types: input token ids
+        2. out_types: output token ids
+        3. values: (swaps, 6) array of the OutputTx fields of VALUES
+        4. batches: batch index of each swap (not before the current batch)
+        5. is_arb: whether or not each swap was made by arbitrage
+        """
+        count = len(in_types)
+        self.__reserve(count)
+        records = self.data[self.swaps:self.swaps + count]
+        records["in_type"], records["out_type"] = in_types, out_types
+        for k, name in enumerate(self.VALUES):
+            records[name] = values[:, k]
+        records["batch"], records["is_arb"] = batches, is_arb
+        self.swaps += count
+
+    def end_batch(self):
+        """
+        Closes the current batch; later swaps are logged in the next one
+        """
+        self.batches += 1
+
+    def output(self, i: int) -> OutputTx:
+        """
+        Parameters:
+        1. i: index of a logged swap
+
+        Returns:
+        1. output information associated with the swap
+        """
+        record = self.data[i]
+        tokens = self.tokens
+
+        return OutputTx(tokens[record["in_type"]], tokens[record["out_type"]],
+            *[float(record[name]) for name in self.VALUES])
+
+    def __len__(self) -> int:
+        return self.batches
+
+    def __getitem__(self, j: int) -> OutputTxBatch:
+        if j < 0:
+            j += len(self)
+        if not 0 <= j < len(self):
+            raise IndexError("batch index out of range")
+        start, end = np.searchsorted(self.column("batch"), [j, j + 1])
+
+        return OutputTxBatch(self, int(start), int(end))
+
+    def __iter__(self) -> Iterator[OutputTxBatch]:
+        bounds = np.searchsorted(self.column("batch"), np.arange(len(self) + 1)).tolist()
+        for j in range(len(self)):
+            yield OutputTxBatch(self, bounds[j], bounds[j + 1])
+
+    def __token_id(self, token: str) -> int:
+        """
+        Returns:
+        1. id of token, assigning it the next id if it is new
+        """
+        if not token in self.token_ids:
+            self.token_ids[token] = len(self.tokens)
+            self.tokens.append(token)
+
+        return self.token_ids[token]
+
+    def __reserve(self, count: int):
+        """
+        Grows the preallocated records (at least doubling) to fit count more swaps
+        """
+        needed = self.swaps + count
+        if needed > len(self.data):
+            data = np.empty(max(needed, 2 * len(self.data)), dtype=self.DTYPE)
+            data[:self.swaps] = self.records
+            self.data = data
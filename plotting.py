@@ -0,0 +1,160 @@
+"""
+Plotting stage of a sweep: renders the stored raw data of every job as images,
+separately from simulation so it can be skipped (simulator.py --no-plots) or
+run later on a results directory:
+
+    python plotting.py -d <results_dir>
+
+Series larger than a density threshold are drawn as 2-d histograms (hexbin)
+instead of scatter plots, and figures render concurrently in worker processes.
+"""
+import argparse
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+import rawdata
+
+CATEGORIES = ["price_impact", "capital_efficiency", "impermanent_gain", "impermanent_loss"]
+DENSITY_THRESHOLD = 100000
+
+def image_path(base_dir: str, category: str, market: str, mm_name: str) -> str:
+    """
+    Returns:
+    1. path of the image of one metric category of a job
+    """
+    return "{d}/images/{c}/{m}/{n}.png".format(d=base_dir, c=category, m=market, n=mm_name)
+
+def plot_points(points: np.ndarray, path: str, threshold: int = DENSITY_THRESHOLD):
+    """
+    Renders (x, y) points to an image file without a display: a scatter plot,
+    or a log-scaled hexbin density image if there are more than threshold
+    points
+
+    Parameters:
+    1. points: (N, 2) array of points
+    2. path: image file to write
+    3. threshold: largest number of points drawn one by one
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    points = points[np.isfinite(points).all(axis=1)]
+
+    fig, ax = plt.subplots()
+    if len(points) > threshold:
+        image = ax.hexbin(points[:, 0], points[:, 1], gridsize=200, bins="log", mincnt=1)
+        fig.colorbar(image, ax=ax, label="points")
+    else:
+        ax.scatter(points[:, 0], points[:, 1], s=1, rasterized=True)
+    fig.savefig(path)
+    plt.close(fig)
+
+def plot_figure(base_dir: str, category: str, market: str, mm_name: str,
+threshold: int = DENSITY_THRESHOLD) -> bool:
+    """
+    Renders the image of one metric category of a job from its raw data
+
+    Parameters:
+    1. base_dir: results directory
+    2. category: metric category
+    3. market: market (config subdirectory) name
+    4. mm_name: config name
+    5. threshold: largest number of points drawn one by one (see plot_points)
+
+    Returns:
+    1. whether or not the job has raw data to plot (ensemble jobs do not)
+    """
+    path = rawdata.find_raw_data(base_dir, category, market, mm_name)
+    if path is None:
+        return False
+
+    points = rawdata.load_points(path)
+    plot_points(points, image_path(base_dir, category, market, mm_name), threshold)
+
+    return True
+
+def is_stale(base_dir: str, market: str, mm_name: str) -> bool:
+    """
+    Checks whether a job has raw data without an image, or newer than its image
+
+    Parameters:
+    1. base_dir: results directory
+    2. market: market (config subdirectory) name
+    3. mm_name: config name
+
+    Returns:
+    1. whether or not the job's images need to be rendered
+    """
+    for category in CATEGORIES:
+        path = rawdata.find_raw_data(base_dir, category, market, mm_name)
+        image = image_path(base_dir, category, market, mm_name)
+        if path is not None and (not os.path.exists(image) or \
+            os.path.getmtime(image) < os.path.getmtime(path)):
+            return True
+
+    return False
+
+def plot_results(base_dir: str, jobs: List[Tuple[str, str]], workers: int = 1,
+threshold: int = DENSITY_THRESHOLD) -> int:
+    """
+    Renders the image of every metric category of every job, in parallel worker
+    processes if workers > 1
+
+    Parameters:
+    1. base_dir: results directory
+    2. jobs: (market, mm_name) of each job
+    3. workers: number of worker processes
+    4. threshold: largest number of points drawn one by one (see plot_points)
+
+    Returns:
+    1. number of images rendered
+    """
+    figures = [(category, market, mm_name) for market, mm_name in jobs \
+        for category in CATEGORIES]
+
+    if workers <= 1:
+        return sum(plot_figure(base_dir, *figure, threshold) for figure in figures)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(plot_figure, [base_dir] * len(figures),
+            *zip(*figures), [threshold] * len(figures)))
+
+def find_results(base_dir: str) -> List[Tuple[str, str]]:
+    """
+    Lists the jobs with stored raw data in a results directory
+
+    Parameters:
+    1. base_dir: results directory
+
+    Returns:
+    1. (market, mm_name) of each job, in a fixed order
+    """
+    jobs = set()
+    for category in CATEGORIES:
+        category_dir = os.path.join(base_dir, "raw_data", category)
+        if not os.path.isdir(category_dir):
+            continue
+        for market in os.listdir(category_dir):
+            for file in os.listdir(os.path.join(category_dir, market)):
+                mm_name, format = os.path.splitext(file)
+                if format[1:] in rawdata.FORMATS:
+                    jobs.add((market, mm_name))
+
+    return sorted(jobs)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Market Maker Simulator plots')
+    parser.add_argument('-d', '--results_dir', type=str, required=True,
+                        help='Path to results directory')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes')
+    parser.add_argument('--density_threshold', type=int, default=DENSITY_THRESHOLD,
+                        help='Number of points above which a series is drawn as a density image')
+    args = parser.parse_args()
+
+    plot_results(args.results_dir, find_results(args.results_dir), args.workers,
+        args.density_threshold)
@@ -1,11 +1,17 @@
-from typing import List, Tuple
+from typing import List, Tuple, Dict
+import numpy as np
 from imarketmaker import MarketMakerInterface
+import simloop
+import pmmcurve
 from inputtx import InputTx
 from outputtx import OutputTx
 from copy import deepcopy
 from poolstatus import PairwiseTokenPoolStatus
 
 class PMM(MarketMakerInterface):
+    swaps_change_equilibriums = True
+    loop_kind = simloop.PMM
+
     def __init__(self, pairwise_pools: List[Tuple[str, str]],
     pairwise_infos: List[Tuple[float, float, float]], single_pools = None, single_infos = None):
         """
@@ -19,45 +25,11 @@ class PMM(MarketMakerInterface):
         """
         self.token_info = PairwiseTokenPoolStatus(pairwise_pools, pairwise_infos)
         self.equilibriums = deepcopy(self.token_info)
+        self.equilibrium_memo = {}
+        self.memo_size = 4096
 
-    def __solveLong(self, x: float, l_e: float, s_e: float, p: float, k: float
-    ) -> float:
-        """
-        Given the balance of the token in shortage, finds the corresponding balance
-        of the token in excess
-
-        Parameters:
-        1. x: shortage token balance
-        2. s_e: shortage token equilibrium balance
-        3. p: exchange rates in units of excess tokens / shortage tokens
-        4. k: k parameter between 2 token types
-
-
-        Returns:
-        1. excess token balance
-        """
-        return l_e - p * (x - s_e) * (1 - k + k * s_e / x)
-    
-    def __solveShort(self, y: float, L: float, S: float, p: float, k: float
-    ) -> float:
-        """
-        Given the balance of the token in excess, finds the corresponding balance
-        of the token in shortage
-
-        Parameters:
-        1. y: excess token balance
-        2. L: excess token equilibrium balance
-        3. p: exchange rates in units of excess tokens / shortage tokens
-        4. k: k parameter between 2 token types
-
-        Returns:
-        1. shortage token balance
-        """
-        return (y-L-p*S+2*k*p*S-(y**2-2*y*L+L**2-2*y*p*S+4*k*y*p*S+2*L*p*S-4*k*L*p*S+p**2*S**2)**0.5)\
-            /(2*(-1+k)*p)
-    
     def swap(self, tx: InputTx, out_amt: float = None, execute: bool = True
-    ) -> Tuple[OutputTx, PairwiseTokenPoolStatus]:
+    ) -> Tuple[OutputTx, List[Tuple[object, int, float]]]:
         """
         Initiate a swap specified by tx given that the amount of output token removed
         is known
@@ -68,45 +40,81 @@ class PMM(MarketMakerInterface):
         3. execute: whether or not to execute the swap
         
         Returns:
-        1. output information associated with swap (after_rate is incorrect)
-        2. status of pool ater swap
+        1. output information associated with swap
+        2. (pool key, entry index, value after swap) for every pool entry changed
+        by the swap
         """
         pool = (tx.intype, tx.outtype)
-        i_0 = self.token_info[pool][0]
-        o_0 = self.token_info[pool][1]
         in_e, out_e = self.calculate_equilibriums(tx.intype, tx.outtype)
         k = self.token_info[pool][2]
-        
+
+        after_rate = None
         if out_amt == None:
-            d = tx.inval
-            p = self.prices[tx.outtype] / self.prices[tx.intype]
-
-            if o_0 / out_e > i_0 / in_e:
-                s_e, l_e = in_e, out_e
-                static_amt = s_e - i_0
-
-                if static_amt < d:
-                    new_pt = self.__solveShort(d - static_amt + s_e, s_e, l_e, p, k)
-                else:
-                    new_pt = self.__solveLong(i_0 + d, l_e, s_e, 1/p, k)
-            else:
-                s_e, l_e = out_e, in_e
-                new_pt = self.__solveShort(i_0 + d, l_e, s_e, p, k)
-        
-        if out_amt == None:
-            output_tx, pool_stat = super().swap(tx, o_0 - new_pt, execute)
-        else:
-            output_tx, pool_stat = super().swap(tx, out_amt, execute)
+            out_amt, after_rate = self.quote(tx.intype, tx.outtype, tx.inval)
+        output_tx, changes = super().swap(tx, out_amt, execute)
         
         if execute:
+            self.save_entry(self.equilibriums, pool)
+            self.save_entry(self.equilibriums, (tx.outtype, tx.intype))
             self.equilibriums[pool] = [in_e, out_e, k]
             self.equilibriums[(tx.outtype, tx.intype)] = [out_e, in_e, k]
+            self.state_version += 1
 
-            o, _ = self.swap(tx, None, False)
-            output_tx.after_rate = tx.inval / \
-                (o.outpool_init_val - o.outpool_after_val)
+            if after_rate == None:
+                after_rate = tx.inval / self.__out_amount(tx.intype, tx.outtype,
+                    self.token_info[pool][0], self.token_info[pool][1], in_e, out_e, tx.inval)
+            output_tx.after_rate = after_rate
         
-        return output_tx, pool_stat
+        return output_tx, changes
+
+    def calculate_quote(self, intype: str, outtype: str, inval: float) -> Tuple[float, float]:
+        """
+        Prices a swap from the current pool state
+
+        Parameters:
+        1. intype: input token type
+        2. outtype: output token type
+        3. inval: amount of input token inserted
+
+        Returns:
+        1. amount of output token removed by the swap
+        2. after_rate of the swap
+        """
+        pool = (intype, outtype)
+        i_0, o_0 = self.token_info[pool][0], self.token_info[pool][1]
+        in_e, out_e = self.calculate_equilibriums(intype, outtype)
+        out_amt = self.__out_amount(intype, outtype, i_0, o_0, self.equilibriums[pool][0],
+            self.equilibriums[pool][1], inval)
+        # the swap moves the pool's equilibriums to (in_e, out_e)
+        after_rate = inval / self.__out_amount(intype, outtype, i_0 + inval, o_0 - out_amt,
+            in_e, out_e, inval)
+
+        return out_amt, after_rate
+
+    def __out_amount(self, intype: str, outtype: str, i_0: float, o_0: float, in_eq: float,
+    out_eq: float, inval: float) -> float:
+        """
+        Finds the amount of output token a swap removes from given balances and
+        equilibriums of its pool
+
+        Parameters:
+        1. intype: input token type
+        2. outtype: output token type
+        3. i_0: input token balance before the swap
+        4. o_0: output token balance before the swap
+        5. in_eq: input token equilibrium balance of the pool before the swap
+        6. out_eq: output token equilibrium balance of the pool before the swap
+        7. inval: amount of input token inserted
+
+        Returns:
+        1. amount of output token removed by the swap
+        """
+        k = self.token_info[(intype, outtype)][2]
+        in_price, out_price = self.prices[intype], self.prices[outtype]
+        p = out_price / in_price
+
+        in_e, out_e = self.__equilibriums(i_0, o_0, in_eq, out_eq, k, in_price, out_price)
+        return o_0 - pmmcurve.out_balance(i_0, o_0, in_e, out_e, inval, p, k)
 
     def calculate_equilibriums(self, intype: str, outtype: str) -> Tuple[float, float]:
         """
@@ -120,25 +128,248 @@ class PMM(MarketMakerInterface):
         1. equilibrium balance for input token
         2. equilibrium balance for output token
         """
-        firstIsLong = True
         pool = (intype, outtype)
-        if self.token_info[pool][0] / self.equilibriums[pool][0] >= \
-            self.token_info[pool][1] / self.equilibriums[pool][1]:
-            l_b = self.token_info[pool][0]
-            s_b = self.token_info[pool][1]
-            l_e = self.equilibriums[pool][0]
-            p = self.prices[pool[1]] / self.prices[pool[0]]
+        return self.__equilibriums(self.token_info[pool][0], self.token_info[pool][1],
+            self.equilibriums[pool][0], self.equilibriums[pool][1], self.token_info[pool][2],
+            self.prices[intype], self.prices[outtype])
+
+    def __equilibriums(self, in_b: float, out_b: float, in_eq: float, out_eq: float, k: float,
+    in_price: float, out_price: float) -> Tuple[float, float]:
+        """
+        Calculates equilibrium balances of a pool from its state; results are
+        memoized on the state, so a pool that has not changed is not solved again
+
+        Parameters:
+        1. in_b: input token balance
+        2. out_b: output token balance
+        3. in_eq: input token equilibrium balance
+        4. out_eq: output token equilibrium balance
+        5. k: k parameter of the pool
+        6. in_price: market price of input token
+        7. out_price: market price of output token
+
+        Returns:
+        1. equilibrium balance for input token
+        2. equilibrium balance for output token
+        """
+        key = (in_b, out_b, in_eq, out_eq, k, in_price, out_price)
+        if key in self.equilibrium_memo:
+            return self.equilibrium_memo[key]
+        if len(self.equilibrium_memo) >= self.memo_size:
+            self.equilibrium_memo.clear()
+
+        firstIsLong = True
+        if in_b / in_eq >= out_b / out_eq:
+            l_b = in_b
+            s_b = out_b
+            l_e = in_eq
+            p = out_price / in_price
         else:
-            l_b = self.token_info[pool][1]
-            s_b = self.token_info[pool][0]
-            l_e = self.equilibriums[pool][1]
-            p = self.prices[pool[0]] / self.prices[pool[1]]
+            l_b = out_b
+            s_b = in_b
+            l_e = out_eq
+            p = in_price / out_price
             firstIsLong = False
 
-        k = self.token_info[pool][2]
-        s_e = s_b+s_b/(2*k)*((1+(4*k*(l_b-l_e))/(s_b*p))**0.5-1)
+        s_e = pmmcurve.shortage_equilibrium(s_b, l_b, l_e, p, k)
 
         if firstIsLong:
-            return l_e, s_e
+            self.equilibrium_memo[key] = l_e, s_e
         else:
-            return s_e, l_e
+            self.equilibrium_memo[key] = s_e, l_e
+        return self.equilibrium_memo[key]
+
+    def calculate_equilibrium_matrix(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized calculate_equilibriums over every ordered token pair of
+        rate_tokens
+
+        Returns:
+        1. equilibrium balances for input tokens (nan where there is no pool or
+        no real equilibrium)
+        2. equilibrium balances for output tokens (nan where there is no pool or
+        no real equilibrium)
+        """
+        in_b, out_b, k = [self.pool_matrix(self.token_info, i) for i in range(3)]
+        in_e, out_e = [self.pool_matrix(self.equilibriums, i) for i in range(2)]
+        prices = self.price_vector()
+
+        return self.__equilibrium_arrays(in_b, out_b, in_e, out_e, k,
+            prices[None, :] / prices[:, None])
+
+    def __equilibrium_arrays(self, in_b: np.ndarray, out_b: np.ndarray, in_eq: np.ndarray,
+    out_eq: np.ndarray, k: np.ndarray, market_rate: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized __equilibriums over independent pool states; market_rate is
+        out_price / in_price
+
+        Returns:
+        1. equilibrium balances for input tokens (nan where there is no real
+        equilibrium)
+        2. equilibrium balances for output tokens (nan where there is no real
+        equilibrium)
+        """
+        with np.errstate(all="ignore"):
+            first_is_long = in_b / in_eq >= out_b / out_eq
+            s_e = pmmcurve.shortage_equilibrium(np.where(first_is_long, out_b, in_b),
+                np.where(first_is_long, in_b, out_b), np.where(first_is_long, in_eq, out_eq),
+                np.where(first_is_long, market_rate, 1 / market_rate), k)
+
+        return np.where(first_is_long, in_eq, s_e), np.where(first_is_long, s_e, out_eq)
+
+    def __equilibrium_chain(self, intypes: List[str], outtypes: List[str]
+    ) -> List[Tuple[float, float, float, float]]:
+        """
+        Follows pool equilibriums through swaps that all start from the current
+        balances; as in swap, each swap moves the equilibriums of its pool and
+        of the reverse pool to the ones calculated before it
+
+        Parameters:
+        1. intypes: input token types of the swaps
+        2. outtypes: output token types of the swaps
+
+        Returns:
+        1. for each swap, the equilibriums of its pool before it and the ones
+        the swap moves them to, or None if a pool is missing or an equilibrium
+        is complex
+        """
+        moved = {}
+        chain = []
+        for intype, outtype in zip(intypes, outtypes):
+            pool = (intype, outtype)
+            if not pool in self.token_info:
+                return None
+
+            in_b, out_b, k = self.token_info[pool]
+            in_eq, out_eq = moved.get(pool, self.equilibriums[pool][:2])
+            in_e, out_e = self.__equilibriums(in_b, out_b, in_eq, out_eq, k,
+                self.prices[intype], self.prices[outtype])
+            if isinstance(in_e, complex) or isinstance(out_e, complex):
+                return None
+
+            chain.append((in_eq, out_eq, in_e, out_e))
+            moved[pool] = (in_e, out_e)
+            moved[(outtype, intype)] = (out_e, in_e)
+
+        return chain
+
+    def swap_batch(self, txs: List[InputTx], market_rates: np.ndarray = None
+    ) -> Tuple[List[OutputTx], List[List[Tuple[object, int, float]]]]:
+        """
+        Executes swaps that all start from the current pool balances; the pool
+        equilibriums move from swap to swap as they do in swap
+
+        Parameters:
+        1. txs: transactions
+        2. market_rates: market exchange rate of every transaction; the swaps
+        must be at the current prices, which the equilibriums depend on
+
+        Returns:
+        1. output information associated with each swap, or None
+        2. pool entries each swap changes, or None
+        """
+        outputs, change_lst = super().swap_batch(txs, market_rates)
+
+        if outputs is not None:
+            intypes, outtypes = [tx.intype for tx in txs], [tx.outtype for tx in txs]
+            for intype, outtype, (in_eq, out_eq, in_e, out_e) in \
+                zip(intypes, outtypes, self.__equilibrium_chain(intypes, outtypes)):
+                pool, reverse = (intype, outtype), (outtype, intype)
+                k = self.token_info[pool][2]
+                self.save_entry(self.equilibriums, pool)
+                self.save_entry(self.equilibriums, reverse)
+                self.equilibriums[pool] = [in_e, out_e, k]
+                self.equilibriums[reverse] = [out_e, in_e, k]
+            self.state_version += 1
+
+        return outputs, change_lst
+
+    def pair_swaps(self, pairs: Dict[str, np.ndarray], invals: np.ndarray,
+    market_rates: np.ndarray, out_amts: np.ndarray = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Array version of swap's pricing for gathered token pairs; as in swap, each
+        swap prices its after_rate with its pool's equilibriums moved to the ones
+        of pair_equilibriums
+
+        Parameters:
+        1. pairs: token pairs, from gather_pairs
+        2. invals: amounts of input token inserted
+        3. market_rates: output token price / input token price of each swap
+        4. out_amts: amounts of output token removed (quoted if None)
+
+        Returns:
+        1. amounts of output token removed by the swaps
+        2. after_rates of the swaps
+        3. amounts of input token inserted
+        """
+        i_0, o_0, k = pairs["i_0"], pairs["o_0"], pairs["k"]
+        p = market_rates
+
+        with np.errstate(all="ignore"):
+            in_e, out_e = self.pair_equilibriums(pairs, p)
+            if out_amts is None:
+                out_amts = o_0 - pmmcurve.out_balances(i_0, o_0, in_e, out_e, invals, p, k)
+
+            i_1, o_1 = i_0 + invals, o_0 - out_amts
+            in_e, out_e = self.__equilibrium_arrays(i_1, o_1, in_e, out_e, k, p)
+            after_rate = invals / (o_1 - pmmcurve.out_balances(i_1, o_1, in_e, out_e, invals, p, k))
+
+        return out_amts, after_rate, invals
+
+    def pair_equilibriums(self, pairs: Dict[str, np.ndarray], market_rates: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Array version of calculate_equilibriums for gathered token pairs
+
+        Parameters:
+        1. pairs: token pairs, from gather_pairs
+        2. market_rates: output token price / input token price of each pair
+
+        Returns:
+        1. equilibrium balances for input tokens
+        2. equilibrium balances for output tokens
+        """
+        return self.__equilibrium_arrays(pairs["i_0"], pairs["o_0"], pairs["in_eq"],
+            pairs["out_eq"], pairs["k"], market_rates)
+
+    def calculate_quotes(self, rows: np.ndarray, cols: np.ndarray, invals: np.ndarray,
+    market_rates: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Vectorized calculate_quote over independent swaps from the current pool
+        balances; the equilibriums each swap starts from are followed through
+        the swaps before it with __equilibrium_chain
+
+        Parameters:
+        1. rows: input token ids (indices into rate_tokens)
+        2. cols: output token ids (indices into rate_tokens)
+        3. invals: amounts of input token inserted
+        4. market_rates: output token price / input token price of each swap
+
+        Returns:
+        1. amounts of output token removed by the swaps
+        2. after_rates of the swaps
+        3. amounts of input token inserted
+        """
+        tokens = self.token_info.tokens
+        chain = self.__equilibrium_chain([tokens[i] for i in rows.tolist()],
+            [tokens[j] for j in cols.tolist()])
+        if chain is None:
+            nan = np.full(len(rows), np.nan)
+            return nan, nan, invals
+
+        in_eq, out_eq, in_e, out_e = np.array(chain, dtype=np.float64).reshape(-1, 4).T
+        i_0 = self.token_info.matrix(0)[rows, cols]
+        o_0 = self.token_info.matrix(1)[rows, cols]
+        k = self.token_info.matrix(2)[rows, cols]
+        p = market_rates
+
+        with np.errstate(all="ignore"):
+            out_amt = o_0 - pmmcurve.out_balances(i_0, o_0, in_e, out_e, invals, p, k)
+
+            # each swap moves its pool's equilibriums to (in_e, out_e)
+            i_1, o_1 = i_0 + invals, o_0 - out_amt
+            in_e, out_e = self.__equilibrium_arrays(i_1, o_1, in_e, out_e, k, p)
+            after_rate = invals / (o_1 - pmmcurve.out_balances(i_1, o_1, in_e, out_e, invals, p, k))
+
+        return out_amt, after_rate, invals
@@ -0,0 +1,219 @@
+"""
+Proactive market maker curve shared by PMM and MPMM
+
+Every function is plain arithmetic on its arguments, so it accepts Python floats
+as well as NumPy arrays that broadcast against each other. Scalar floats keep
+Python semantics (a negative square root gives a complex number and a division
+by zero raises); arrays give nan/inf instead, so array callers should evaluate
+under np.errstate and mask non-finite results.
+
+Naming follows the PMM papers: the token in shortage has balance s and
+equilibrium S (or s_e), the token in excess has balance l and equilibrium L
+(or l_e), p is the exchange rate in units of excess tokens / shortage tokens
+and k is the curve's k parameter.
+"""
+import math
+import numpy as np
+
+_TRIG_OFFSETS = 2 * np.pi * np.arange(3) / 3
+
+def solve_long(x, l_e, s_e, p, k):
+    """
+    Given the balance of the token in shortage, finds the corresponding balance
+    of the token in excess
+
+    Parameters:
+    1. x: shortage token balance
+    2. l_e: excess token equilibrium balance
+    3. s_e: shortage token equilibrium balance
+    4. p: exchange rates in units of excess tokens / shortage tokens
+    5. k: k parameter between 2 token types
+
+    Returns:
+    1. excess token balance
+    """
+    return l_e - p * (x - s_e) * (1 - k + k * s_e / x)
+
+def solve_short(y, L, S, p, k):
+    """
+    Given the balance of the token in excess, finds the corresponding balance
+    of the token in shortage
+
+    Parameters:
+    1. y: excess token balance
+    2. L: excess token equilibrium balance
+    3. S: shortage token equilibrium balance
+    4. p: exchange rates in units of excess tokens / shortage tokens
+    5. k: k parameter between 2 token types
+
+    Returns:
+    1. shortage token balance
+    """
+    return (y-L-p*S+2*k*p*S-(y**2-2*y*L+L**2-2*y*p*S+4*k*y*p*S+2*L*p*S-4*k*L*p*S+p**2*S**2)**0.5)\
+        /(2*(-1+k)*p)
+
+def shortage_equilibrium(s, l, l_e, p, k):
+    """
+    Given both balances and the excess token's equilibrium, finds the shortage
+    token's equilibrium balance on the same curve
+
+    Parameters:
+    1. s: shortage token balance
+    2. l: excess token balance
+    3. l_e: excess token equilibrium balance
+    4. p: exchange rates in units of excess tokens / shortage tokens
+    5. k: k parameter between 2 token types
+
+    Returns:
+    1. shortage token equilibrium balance
+    """
+    return s + s / (2*k) * ((1 + (4*k * (l - l_e)) / (s * p))**0.5 - 1)
+
+def out_balance(i_0, o_0, in_e, out_e, d, p, k):
+    """
+    Finds the output token balance after a swap; scalar version of out_balances
+
+    Parameters:
+    1. i_0: input token balance before the swap
+    2. o_0: output token balance before the swap
+    3. in_e: input token equilibrium balance
+    4. out_e: output token equilibrium balance
+    5. d: amount of input token inserted
+    6. p: exchange rate in units of input tokens / output tokens
+    7. k: k parameter between 2 token types
+
+    Returns:
+    1. output token balance after the swap
+    """
+    if o_0 / out_e > i_0 / in_e:
+        # input token is in shortage; the swap may cross its equilibrium
+        static_amt = in_e - i_0
+        if static_amt < d:
+            return solve_short(d - static_amt + in_e, in_e, out_e, p, k)
+        else:
+            return solve_long(i_0 + d, out_e, in_e, 1/p, k)
+    else:
+        return solve_short(i_0 + d, in_e, out_e, p, k)
+
+def out_balances(i_0, o_0, in_e, out_e, d, p, k) -> np.ndarray:
+    """
+    Finds the output token balance after each of many independent swaps; takes
+    the same parameters as out_balance as broadcastable arrays
+
+    Returns:
+    1. output token balances after the swaps
+    """
+    with np.errstate(all="ignore"):
+        static_amt = in_e - i_0
+        crossing = solve_short(d - static_amt + in_e, in_e, out_e, p, k)
+        long = solve_long(i_0 + d, out_e, in_e, 1/p, k)
+        short = solve_short(i_0 + d, in_e, out_e, p, k)
+
+        return np.where(o_0 / out_e > i_0 / in_e,
+            np.where(static_amt < d, crossing, long), short)
+
+def _argmin_cubic(s, l, S, L, p, k):
+    """
+    Sets up the minimization behind excess_equilibrium: with
+    w = sqrt(1 + 4k(l - l_e)/(s p)), both equilibriums are polynomials in w and
+    the squared distance to (S, L) is stationary where w**3 + P*w + Q = 0
+
+    Returns:
+    1. P coefficient of the depressed cubic in w
+    2. Q coefficient of the depressed cubic in w
+    3. g such that l_e = l - (w**2 - 1) * g
+    """
+    g = s * p / (4*k)
+    # 1 - s_e/S = a0 + a1*w and 1 - l_e/L = b0 + b2*w**2
+    a0 = 1 - s / S + s / (2*k*S)
+    a1 = -s / (2*k*S)
+    b0 = 1 - (l + g) / L
+    b2 = g / L
+
+    return (a1*a1 + 2*b0*b2) / (2*b2*b2), a0*a1 / (2*b2*b2), g
+
+def excess_equilibrium(s, l, S, L, p, k, newton=1):
+    """
+    Finds the excess token equilibrium on the curve through (s, l) closest to the
+    desired equilibrium (S, L); scalar version of excess_equilibria
+
+    The stationary points are the real roots of a depressed cubic, found with
+    Cardano's method (one real root) or the trigonometric method (three real
+    roots) and polished with Newton steps. The root selected is the one the
+    closed form's principal complex cube root used to select: the smallest
+    candidate when there are three, and otherwise the real root, or the real
+    part of the complex pair when the closed form went through a negative
+    cube root
+
+    Parameters:
+    1. s: shortage token balance
+    2. l: excess token balance
+    3. S: desired shortage token equilibrium balance
+    4. L: desired excess token equilibrium balance
+    5. p: exchange rates in units of excess tokens / shortage tokens
+    6. k: k parameter between 2 token types
+    7. newton: number of Newton iterations polishing each root
+
+    Returns:
+    1. excess token equilibrium balance
+    """
+    P, Q, g = _argmin_cubic(s, l, S, L, p, k)
+    disc = (Q/2)**2 + (P/3)**3
+
+    if disc > 0:
+        a = -math.copysign(math.pow(abs(Q)/2 + math.sqrt(disc), 1/3), Q)
+        roots = [a - P / (3*a)]
+    else:
+        r = 2 * math.sqrt(-P/3)
+        phi = math.acos(max(-1.0, min(1.0, 3*Q / (P*r)))) / 3
+        roots = [r * math.cos(phi - 2*math.pi*j/3) for j in range(3)]
+
+    for i in range(len(roots)):
+        w = roots[i]
+        for _ in range(newton):
+            slope = 3*w*w + P
+            if slope == 0:
+                break
+            w -= (w*w*w + P*w + Q) / slope
+        roots[i] = w
+
+    if disc > 0:
+        w2 = roots[0]**2
+        if (1.5*w2 + P) * g < 0:
+            # real part of l - (w**2 - 1) * g over the complex pair of roots
+            return l + (w2/2 + P + 1) * g
+        return l - (w2 - 1) * g
+    return min(l - (w*w - 1) * g for w in roots)
+
+def excess_equilibria(s, l, S, L, p, k, newton=1) -> np.ndarray:
+    """
+    Finds the excess token equilibrium for each of many independent curves;
+    takes the same parameters as excess_equilibrium as broadcastable arrays
+
+    Returns:
+    1. excess token equilibrium balances
+    """
+    with np.errstate(all="ignore"):
+        P, Q, g = _argmin_cubic(s, l, S, L, p, k)
+        P, Q = np.broadcast_arrays(P, Q)
+        disc = (Q/2)**2 + (P/3)**3
+        single = disc > 0
+
+        # trigonometric roots are nan where there is a single real root, and
+        # the Cardano root is nan where there are three
+        r = 2 * np.sqrt(-P/3)
+        phi = np.arccos(np.clip(3*Q / (P*r), -1, 1)) / 3
+        roots = r * np.cos(phi - _TRIG_OFFSETS.reshape((3,) + (1,) * P.ndim))
+        a = -np.copysign(np.cbrt(np.abs(Q)/2 + np.sqrt(disc)), Q)
+        roots[0] = np.where(single, a - P / (3*a), roots[0])
+
+        for _ in range(newton):
+            step = (roots**3 + P*roots + Q) / (3*roots**2 + P)
+            roots = np.where(np.isfinite(step), roots - step, roots)
+
+        w2 = roots**2
+        u = l - (w2 - 1) * g
+        real_part = (1.5*w2[0] + P) * g < 0
+        single_eq = np.where(real_part, l + (w2[0]/2 + P + 1) * g, u[0])
+
+        return np.where(single, single_eq, u.min(axis=0))
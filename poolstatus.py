@@ -1,31 +1,246 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Iterator
+from copy import deepcopy
+import numpy as np
 
 class PoolStatusInterface:
     def __init__(self):
         raise NotImplementedError
 
-class MultiTokenPoolStatus(PoolStatusInterface, dict):
+class ArrayPoolStatus(PoolStatusInterface, dict):
+    def __init__(self, keys: List[object], array: np.ndarray, positions: List[Tuple[int, ...]]):
+        """
+        Pool status whose entries live in one float64 array; the mapping from pool
+        keys to entries is a view of the array, so status[key][slot] reads and
+        writes the array in place and returns Python floats
+
+        Parameters:
+        1. keys: pool keys, in order
+        2. array: entries of every pool along its last axis
+        3. positions: index into array of each key's entries
+        """
+        self.array = array
+        self.positions = dict(zip(keys, positions))
+        self.__bind()
+
+    def __bind(self):
+        """
+        Points every key at its entries in array
+        """
+        for key, position in self.positions.items():
+            dict.__setitem__(self, key, memoryview(self.array[position]))
+
+    def __setitem__(self, key: object, info: Tuple[float, ...]):
+        self.array[self.positions[key]] = info
+
+    def snapshot(self) -> "ArrayPoolStatus":
+        """
+        Returns:
+        1. independent copy of the status; only the array is copied
+        """
+        status = self.__class__.__new__(self.__class__)
+        status.__dict__.update(self.__dict__)
+        status.array = self.array.copy()
+        status.__bind()
+
+        return status
+
+    def copy(self) -> "ArrayPoolStatus":
+        return self.snapshot()
+
+    def __copy__(self) -> "ArrayPoolStatus":
+        return self.snapshot()
+
+    def __deepcopy__(self, memo: Dict) -> "ArrayPoolStatus":
+        return self.snapshot()
+
+    def __reduce__(self) -> Tuple:
+        return _restore, (self.__class__, list(self.positions.keys()), self.array,
+            list(self.positions.values()), self.__dict__)
+
+def _restore(cls: type, keys: List[object], array: np.ndarray,
+positions: List[Tuple[int, ...]], state: Dict) -> ArrayPoolStatus:
+    """
+    Unpickles an ArrayPoolStatus; memoryviews cannot be pickled, so the mapping
+    is rebuilt from the array
+    """
+    status = cls.__new__(cls)
+    status.__dict__.update(state)
+    ArrayPoolStatus.__init__(status, keys, array, positions)
+    return status
+
+class MultiTokenPoolStatus(ArrayPoolStatus):
     def __init__(self, status: Dict[str, Tuple[float, float]]):
         """
         Represents pool status for multi token liquidity pool market makers with
-        computable k
+        computable k; balances and k values are the columns of an N x 2 array
+        whose row i belongs to tokens[i]
 
         Parameters:
         1. status: dictionary indicating tokens' counts and min k value
         """
-        dict.__init__(self, status)
+        self.tokens = list(status.keys())
+        self.index = {tok: i for i, tok in enumerate(self.tokens)}
+        array = np.array([list(info) for info in status.values()],
+            dtype=np.float64).reshape(len(self.tokens), 2)
+        ArrayPoolStatus.__init__(self, self.tokens, array, [(i,) for i in range(len(self.tokens))])
 
+    def vector(self, slot: int) -> np.ndarray:
+        """
+        Parameters:
+        1. slot: index of the entry of each token (0 for balances, 1 for k)
+
+        Returns:
+        1. view of the array whose entry i is status[tokens[i]][slot]
+        """
+        return self.array[:, slot]
 
-class PairwiseTokenPoolStatus(PoolStatusInterface, dict):
+
+class PairwiseTokenPoolStatus(ArrayPoolStatus):
     def __init__(self, token_pairs: List[Tuple[str, str]],
     token_infos: List[Tuple[float, float, float]]):
         """
-        Represents pool status for 2 token liquidity pool market makers
+        Represents pool status for 2 token liquidity pool market makers; the
+        entries of pool (tokens[i], tokens[j]) are array[i, j], so every entry
+        is an N x N matrix (nan where there is no pool)
 
         Parameters:
         1. token_pairs: tuples of trading pairs, i.e "['BTC. 'ETH']"; should not 
         have redundant pairs
         2. token_infos: token counts and k values for each trading pair
         """
+        pools = {}
         for (tokenA, tokenB), (amountA, amountB, k) in zip(token_pairs, token_infos):
-            self[(tokenA, tokenB)] = [amountA, amountB, k]
+            pools[(tokenA, tokenB)] = [amountA, amountB, k]
+
+        self.tokens = list(dict.fromkeys(tok for pool in pools for tok in pool))
+        self.index = {tok: i for i, tok in enumerate(self.tokens)}
+        n = len(self.tokens)
+        array = np.full((n, n, 3), np.nan)
+        positions = [(self.index[tokenA], self.index[tokenB]) for tokenA, tokenB in pools]
+        for position, info in zip(positions, pools.values()):
+            array[position] = info
+        ArrayPoolStatus.__init__(self, list(pools.keys()), array, positions)
+
+    def matrix(self, slot: int) -> np.ndarray:
+        """
+        Parameters:
+        1. slot: index of the entry in each pool
+
+        Returns:
+        1. view of the array whose entry [i, j] is
+        status[(tokens[i], tokens[j])][slot] (nan where there is no such pool)
+        """
+        return self.array[:, :, slot]
+
+
+class PoolStatusHistory():
+    def __init__(self, initial: PoolStatusInterface, checkpoint_interval: int = 1024):
+        """
+        Records the pool status after every swap as the pool entries the swap
+        changed; full statuses are rebuilt on demand by replaying the changes
+        from the nearest checkpoint
+
+        Parameters:
+        1. initial: pool status before any swaps
+        2. checkpoint_interval: number of swaps between stored full statuses
+        """
+        self.initial = deepcopy(initial)
+        self.checkpoint_interval = checkpoint_interval
+        self.changes = []
+        self.batch_ends = []
+        self.checkpoints = [deepcopy(initial)]
+        self.__state = deepcopy(initial)
+        self.__pending = []
+        self.__touched = set()
+
+    def record(self, changes: List[Tuple[object, int, float]]):
+        """
+        Records one swap
+
+        Parameters:
+        1. changes: (pool key, entry index, value after swap) for every pool
+        entry the swap changed
+        """
+        if self.__pending:
+            changes = self.__pending + list(changes)
+            self.__pending = []
+
+        changes = tuple(changes)
+        self.changes.append(changes)
+        state = self.__state
+        for key, slot, value in changes:
+            state[key][slot] = value
+            self.__touched.add((key, slot))
+
+        if len(self.changes) % self.checkpoint_interval == 0:
+            self.checkpoints.append(deepcopy(state))
+
+    def resync(self, status: PoolStatusInterface):
+        """
+        Notes that every entry changed since the last resync was reset to its
+        value in status; the reset is folded into the next recorded swap
+
+        Parameters:
+        1. status: pool status after the reset
+        """
+        self.__pending.extend((key, slot, status[key][slot]) for key, slot in self.__touched)
+        self.__touched = set()
+
+    def end_batch(self):
+        """
+        Marks the end of a batch of swaps
+        """
+        self.batch_ends.append(len(self.changes))
+
+    def __len__(self) -> int:
+        return len(self.changes)
+
+    def state_at(self, i: int) -> PoolStatusInterface:
+        """
+        Rebuilds the pool status after a swap
+
+        Parameters:
+        1. i: index of the swap
+
+        Returns:
+        1. pool status after swap i
+        """
+        if i < 0:
+            i += len(self.changes)
+        if not 0 <= i < len(self.changes):
+            raise IndexError("swap index out of range")
+
+        c = (i + 1) // self.checkpoint_interval
+        state = deepcopy(self.checkpoints[c])
+        for changes in self.changes[c * self.checkpoint_interval:i + 1]:
+            for key, slot, value in changes:
+                state[key][slot] = value
+
+        return state
+
+    def states(self) -> Iterator[PoolStatusInterface]:
+        """
+        Replays the history from the initial status
+
+        Returns:
+        1. iterator over the pool status after each swap; the same object is
+        updated in place and yielded every time, so it must be copied to be kept
+        """
+        state = deepcopy(self.initial)
+        for changes in self.changes:
+            for key, slot, value in changes:
+                state[key][slot] = value
+            yield state
+
+    def batches(self) -> Iterator[List[PoolStatusInterface]]:
+        """
+        Replays the history batch by batch
+
+        Returns:
+        1. iterator over lists of pool statuses after each swap of a batch
+        """
+        states = self.states()
+        start = 0
+        for end in self.batch_ends:
+            yield [deepcopy(next(states)) for _ in range(end - start)]
+            start = end
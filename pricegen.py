@@ -1,10 +1,12 @@
-from typing import List, Dict
+from typing import Dict
 from copy import deepcopy
 import random
 import numpy as np
+from pricepath import PricePath
 
 class PriceGenerator():
-    def __init__(self, mean: float, stdv: float, change_probability: float, batches: int):
+    def __init__(self, mean: float, stdv: float, change_probability: float, batches: int,
+    bulk: str = "True", seed: int = None):
         """
         Generates prices for each batch in the traffic; price percentage changes are normally distributed
 
@@ -13,11 +15,16 @@ class PriceGenerator():
         2. stdv: standard deviation of percent price changes between batches
         3. change_probability: probability of any token's price changing between batches
         4. batches: number of batches in traffic
+        5. bulk: whether or not to generate the whole price path with array operations
+        6. seed: seed, SeedSequence or numpy Generator that all random draws come from
         """
         self.batches = batches
         self.mean = mean
         self.stdv = stdv
         self.probabilities = [1 - change_probability, change_probability]
+        self.bulk = bulk == "True"
+        self.rng = np.random.default_rng(seed)
+        self.random = random.Random(int(self.rng.integers(2**63)))
 
     def configure_tokens(self, token_info: Dict[str, Dict[str, float]]):
         """
@@ -69,19 +76,52 @@ class PriceGenerator():
             val = info["change_probability"]
             probability = [1 - val, val]
         
-        if random.choices([0,1], probability) == [1]:
+        if self.random.choices([0,1], probability) == [1]:
 
-            return (1 + mean + np.random.normal(0, stdv)) * old_price
+            return (1 + mean + self.rng.normal(0, stdv)) * old_price
         else:
             return old_price
     
-    def simulate_ext_prices(self) -> List[Dict[str, float]]:
+    def __simulate_bulk(self) -> PricePath:
         """
-        Generates prices for each batch in the traffic; price percentage changes are normally distributed
+        Generates the whole price path at once: price changes are drawn as
+        (batches - 1, tokens) matrices of change masks and normal shocks and
+        accumulated with a cumulative product per token
 
         Returns:
         1. prices for each batch of swaps
         """
+        tokens = list(self.token_info.keys())
+        infos = [self.token_info[tok] for tok in tokens]
+        start = np.array([info["start"] for info in infos], dtype=np.float64)
+        means = np.array([info.get("mean", self.mean) for info in infos], dtype=np.float64)
+        stdvs = np.array([info.get("stdv", self.stdv) for info in infos], dtype=np.float64)
+        change_probabilities = np.array([info.get("change_probability", self.probabilities[1]) \
+            for info in infos], dtype=np.float64)
+
+        shape = (max(self.batches - 1, 0), len(tokens))
+        changes = self.rng.random(shape) < change_probabilities
+        factors = 1 + means + self.rng.standard_normal(shape) * stdvs
+        factors[~changes] = 1
+
+        values = np.empty((shape[0] + 1, len(tokens)), dtype=np.float64)
+        values[0] = start
+        np.cumprod(factors, axis=0, out=values[1:])
+        values[1:] *= start
+
+        return PricePath(tokens, values)
+
+    def simulate_ext_prices(self) -> PricePath:
+        """
+        Generates prices for each batch in the traffic; price percentage changes are normally distributed
+
+        Returns:
+        1. prices for each batch of swaps; indexing a batch gives a token to price
+        dictionary
+        """
+        if self.bulk:
+            return self.__simulate_bulk()
+
         batch_price = {i : self.token_info[i]["start"] for i in self.token_info}
         prices = [deepcopy(batch_price)]
 
@@ -91,4 +131,4 @@ class PriceGenerator():
 
             prices.append(deepcopy(batch_price))
         
-        return prices
\ No newline at end of file
+        return PricePath.from_dicts(prices)
\ No newline at end of file
@@ -0,0 +1,66 @@
+import numpy as np
+from typing import List, Dict, Iterator
+
+class PricePath():
+    def __init__(self, tokens: List[str], values: np.ndarray):
+        """
+        External token prices for every batch, stored as a (batches, tokens) array
+
+        Parameters:
+        1. tokens: token names, in column order
+        2. values: token prices; row i holds the prices of batch i
+        """
+        self.tokens = list(tokens)
+        self.values = values
+        self.index = {tok: i for i, tok in enumerate(self.tokens)}
+
+    @classmethod
+    def from_dicts(cls, prices: List[Dict[str, float]]) -> "PricePath":
+        """
+        Converts a list of per-batch price dictionaries into a price path
+
+        Parameters:
+        1. prices: token prices for each batch
+
+        Returns:
+        1. equivalent price path
+        """
+        tokens = list(prices[0].keys())
+        values = np.array([[batch[tok] for tok in tokens] for batch in prices],
+            dtype=np.float64)
+
+        return cls(tokens, values)
+
+    def columns(self, tokens: List[str]) -> np.ndarray:
+        """
+        Returns the price array with columns in the given token order
+
+        Parameters:
+        1. tokens: token names
+
+        Returns:
+        1. (batches, len(tokens)) array of prices
+        """
+        if tokens == self.tokens:
+            return self.values
+
+        return self.values[:, [self.index[tok] for tok in tokens]]
+
+    def __len__(self) -> int:
+        return self.values.shape[0]
+
+    def __getitem__(self, j: int) -> Dict[str, float]:
+        """
+        Builds the price dictionary of a batch, as used by the market makers
+
+        Parameters:
+        1. j: batch index
+
+        Returns:
+        1. token prices for the batch
+        """
+        return dict(zip(self.tokens, self.values[j].tolist()))
+
+    def __iter__(self) -> Iterator[Dict[str, float]]:
+        for j in range(len(self)):
+            yield self[j]
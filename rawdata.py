@@ -0,0 +1,266 @@
+"""
+Columnar raw data files of metric points
+
+Points are written in chunks as they are appended, as either:
+- "npz": a zip archive of compressed .npy chunks named <column>/<chunk>.npy
+- "parquet": a Parquet file with one row group per chunk; needs pyarrow, and
+the npz format is used if it is not installed
+
+load_raw_data reads both formats back as one array per column, memory-mapped
+if asked to.
+"""
+import os
+import warnings
+import zipfile
+import numpy as np
+from typing import List, Dict
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = ["npz", "parquet"]
+RAW_COLUMNS = {
+    "price_impact": ["drained", "price_impact"],
+    "capital_efficiency": ["drained", "rate_ratio"],
+    "impermanent_gain": ["swap", "change"],
+    "impermanent_loss": ["swap", "change"]
+}
+CHUNK_SIZE = 65536
+
+def resolve(name: str) -> str:
+    """
+    Picks the raw data format to write
+
+    Parameters:
+    1. name: requested format, one of FORMATS
+
+    Returns:
+    1. name, or "npz" if parquet is requested without pyarrow
+    """
+    if not name in FORMATS:
+        raise ValueError("unknown raw data format {}, expected one of {}".format(name, FORMATS))
+    if name == "parquet" and pyarrow is None:
+        warnings.warn("pyarrow is not installed, falling back to the npz raw data format")
+        return "npz"
+
+    return name
+
+def raw_data_path(base_dir: str, category: str, market: str, mm_name: str,
+format: str = "npz") -> str:
+    """
+    Returns:
+    1. path of the raw data of one metric category of a job
+    """
+    return "{d}/raw_data/{c}/{m}/{n}.{f}".format(d=base_dir, c=category, m=market, n=mm_name,
+        f=format)
+
+def find_raw_data(base_dir: str, category: str, market: str, mm_name: str) -> str:
+    """
+    Returns:
+    1. path of the stored raw data of one metric category of a job, in any
+    format (the most recently written if there are several), or None if there
+    is none
+    """
+    paths = [raw_data_path(base_dir, category, market, mm_name, format) for format in FORMATS]
+    paths = [path for path in paths if os.path.exists(path)]
+    if not paths:
+        return None
+
+    return max(paths, key=os.path.getmtime)
+
+def other_formats(path: str) -> List[str]:
+    """
+    Returns:
+    1. paths of the same raw data in the formats other than path's
+    """
+    stem, extension = os.path.splitext(path)
+
+    return ["{}.{}".format(stem, format) for format in FORMATS if format != extension[1:]]
+
+class RawDataWriter():
+    def __init__(self, path: str, columns: List[str], chunk_size: int = CHUNK_SIZE):
+        """
+        Writes rows of float64 columns to a raw data file in chunks; the format is
+        given by the extension of path (see FORMATS)
+
+        Parameters:
+        1. path: raw data file to write (replaced if it exists, as are the same
+        raw data in the other formats once it is closed)
+        2. columns: column names
+        3. chunk_size: number of rows buffered before they are written
+        """
+        self.path = path
+        self.columns = list(columns)
+        self.chunk_size = chunk_size
+        self.format = os.path.splitext(path)[1][1:]
+        self.buffer = np.empty((chunk_size, len(self.columns)), dtype=np.float64)
+        self.buffered = 0
+        self.chunks = 0
+
+        if self.format == "parquet":
+            schema = pyarrow.schema([(name, pyarrow.float64()) for name in self.columns])
+            self.file = pyarrow.parquet.ParquetWriter(path, schema, compression="zstd")
+        else:
+            self.file = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED)
+
+    def append(self, rows: np.ndarray):
+        """
+        Parameters:
+        1. rows: (N, columns) array of rows
+        """
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, len(self.columns))
+        while len(rows):
+            count = min(len(rows), self.chunk_size - self.buffered)
+            self.buffer[self.buffered:self.buffered + count] = rows[:count]
+            self.buffered += count
+            rows = rows[count:]
+            if self.buffered == self.chunk_size:
+                self.__flush()
+
+    def close(self):
+        """
+        Writes the buffered rows and closes the file
+        """
+        if self.buffered or not self.chunks:
+            self.__flush()
+        self.file.close()
+
+        # a rerun in another format must not leave the earlier results behind
+        for path in other_formats(self.path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __enter__(self) -> "RawDataWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __flush(self):
+        """
+        Writes the buffered rows as one chunk
+        """
+        chunk = self.buffer[:self.buffered]
+        if self.format == "parquet":
+            self.file.write_table(pyarrow.table({name: chunk[:, k] \
+                for k, name in enumerate(self.columns)}))
+        else:
+            for k, name in enumerate(self.columns):
+                with self.file.open("{}/{:06d}.npy".format(name, self.chunks), "w") as f:
+                    np.lib.format.write_array(f, np.ascontiguousarray(chunk[:, k]))
+
+        self.buffered = 0
+        self.chunks += 1
+
+def write_raw_data(path: str, category: str, points: np.ndarray,
+chunk_size: int = CHUNK_SIZE):
+    """
+    Writes the points of one metric category to a raw data file
+
+    Parameters:
+    1. path: raw data file to write (see RawDataWriter)
+    2. category: metric category, naming the columns (see RAW_COLUMNS)
+    3. points: (N, 2) array of points
+    4. chunk_size: number of rows per chunk
+    """
+    with RawDataWriter(path, RAW_COLUMNS[category], chunk_size) as writer:
+        writer.append(points)
+
+def load_raw_data(path: str, mmap_dir: str = None) -> Dict[str, np.ndarray]:
+    """
+    Reads a raw data file as one array per column
+
+    Parameters:
+    1. path: raw data file
+    2. mmap_dir: if given, the columns are memory-mapped read-only: parquet
+    files are mapped directly, and the chunks of npz files are decompressed once
+    into .npy files in mmap_dir (reused while newer than path)
+
+    Returns:
+    1. column name -> array
+    """
+    if path.endswith(".parquet"):
+        table = pyarrow.parquet.read_table(path, memory_map=mmap_dir is not None)
+        return {name: table.column(name).to_numpy() for name in table.column_names}
+
+    with zipfile.ZipFile(path) as archive:
+        chunks = {}
+        # chunks are stored in write order, columns first to last within a chunk
+        for member in archive.namelist():
+            chunks.setdefault(member.split("/")[0], []).append(member)
+
+        columns = {}
+        for name, members in chunks.items():
+            if mmap_dir is None:
+                columns[name] = np.concatenate([_read_chunk(archive, m) for m in members])
+                continue
+
+            os.makedirs(mmap_dir, exist_ok=True)
+            stem = os.path.splitext(os.path.abspath(path))[0].strip(os.sep).replace(os.sep, "_")
+            target = os.path.join(mmap_dir, "{}.{}.npy".format(stem, name))
+            if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(path):
+                arrays = [_read_chunk(archive, m) for m in members]
+                column = np.lib.format.open_memmap(target + ".tmp", mode="w+",
+                    dtype=np.float64, shape=(sum(len(a) for a in arrays),))
+                start = 0
+                for array in arrays:
+                    column[start:start + len(array)] = array
+                    start += len(array)
+                column.flush()
+                del column
+                os.replace(target + ".tmp", target)
+            columns[name] = np.load(target, mmap_mode="r")
+
+    return columns
+
+def _read_chunk(archive: zipfile.ZipFile, member: str) -> np.ndarray:
+    """
+    Returns:
+    1. array stored in one chunk of an npz raw data file
+    """
+    with archive.open(member) as f:
+        return np.lib.format.read_array(f)
+
+def load_points(path: str, mmap_dir: str = None) -> np.ndarray:
+    """
+    Reads a raw data file as points, stacked in memory
+
+    Parameters:
+    1. path: raw data file
+    2. mmap_dir: see load_raw_data
+
+    Returns:
+    1. (N, 2) array of points
+    """
+    columns = load_raw_data(path, mmap_dir)
+
+    return np.stack(list(columns.values()), axis=1)
+
+def load_category(base_dir: str, category: str, mmap_dir: str = None
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Reads the raw data of one metric category of every job of a sweep, for
+    comparisons across configs
+
+    Parameters:
+    1. base_dir: results directory
+    2. category: metric category
+    3. mmap_dir: see load_raw_data
+
+    Returns:
+    1. "<market>/<mm_name>" -> columns of the job's raw data
+    """
+    category_dir = os.path.join(base_dir, "raw_data", category)
+    results = {}
+    for market in sorted(os.listdir(category_dir)):
+        mm_names = sorted(set(os.path.splitext(file)[0] \
+            for file in os.listdir(os.path.join(category_dir, market)) \
+            if os.path.splitext(file)[1][1:] in FORMATS))
+        for mm_name in mm_names:
+            results["{}/{}".format(market, mm_name)] = load_raw_data(
+                find_raw_data(base_dir, category, market, mm_name), mmap_dir)
+
+    return results
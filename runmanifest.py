@@ -0,0 +1,172 @@
+import fnmatch
+import hashlib
+import json
+import os
+import time
+from typing import List, Dict
+
+# modules whose code decides the results of a job: the market makers and their
+# simulation loops, the scenario generators, the metrics and the simulator
+RESULT_MODULES = [
+    "imarketmaker", "amm", "pmm", "pmmcurve", "csmm", "mamm", "mpmm", "mcsmm",
+    "marketmakers", "arbindex", "poolstatus", "simloop", "backends", "ensemble",
+    "inputtx", "outputtx", "traffic", "pricepath", "pricegen", "trafficgen",
+    "initializer", "seeding", "scenario", "metrics", "iobserver", "simulator"
+]
+
+def config_hash(config: Dict) -> str:
+    """
+    Parameters:
+    1. config: simulation config
+
+    Returns:
+    1. hexadecimal hash of the canonical JSON form of the config
+    """
+    canonical = json.dumps(config, sort_keys=True, separators=(",", ":"))
+
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+def code_version(root: str = None) -> str:
+    """
+    Version of the simulation code: a hash of the contents of the modules the
+    results depend on (see RESULT_MODULES), so any edit to them makes earlier
+    results out of date, while edits to plotting or tooling do not
+
+    Parameters:
+    1. root: directory of the modules (the directory of this module if None)
+
+    Returns:
+    1. hexadecimal hash
+    """
+    root = root or os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for module in sorted(RESULT_MODULES):
+        digest.update(module.encode("utf-8"))
+        with open(os.path.join(root, module + ".py"), "rb") as f:
+            digest.update(f.read())
+
+    return digest.hexdigest()[:32]
+
+def job_id(market: str, mm_name: str) -> str:
+    """
+    Returns:
+    1. name of a (market, config) job, as "<market>/<mm_name>"
+    """
+    return "{}/{}".format(market, mm_name)
+
+def matches(job: str, patterns: List[str] = None) -> bool:
+    """
+    Parameters:
+    1. job: job name (see job_id)
+    2. patterns: shell-style patterns, such as "random/*" or "*/pmm_005"; None
+    matches every job
+
+    Returns:
+    1. whether or not the job matches any of patterns
+    """
+    if patterns is None:
+        return True
+
+    return any(fnmatch.fnmatchcase(job, pattern) for pattern in patterns)
+
+class RunManifest():
+    def __init__(self, base_dir: str):
+        """
+        Records the jobs of the sweeps run into a results directory in
+        base_dir/run_manifest.json: what each job was run from (config hash,
+        scenario keys, code version and options), its status, its output files
+        and its statistics, so a rerun only has to run the jobs that are not
+        complete and current
+
+        Like ScenarioCache's manifest, it is only read and written by the process
+        driving a sweep
+
+        Parameters:
+        1. base_dir: results directory
+        """
+        self.path = os.path.join(base_dir, "run_manifest.json")
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)["jobs"]
+
+    def is_current(self, job: str, fingerprint: Dict) -> bool:
+        """
+        Checks whether a job completed from the same inputs and its outputs are
+        all still there
+
+        Parameters:
+        1. job: job name (see job_id)
+        2. fingerprint: what the job would be run from now, as passed to start
+
+        Returns:
+        1. whether or not the job can be skipped
+        """
+        entry = self.entries.get(job)
+        if entry is None or entry["status"] != "complete":
+            return False
+        if any(entry.get(key) != value for key, value in fingerprint.items()):
+            return False
+
+        return all(os.path.exists(path) for path in entry["outputs"])
+
+    def start(self, job: str, fingerprint: Dict, outputs: List[str]):
+        """
+        Records a job as running
+
+        Parameters:
+        1. job: job name (see job_id)
+        2. fingerprint: what the job is run from, of the form:
+        {
+            "config_hash": hash of the config (see config_hash),
+            "scenario_keys": keys of the job's scenario replicas,
+            "code_version": version of the code (see code_version),
+            "options": sweep options that change the results
+        }
+        3. outputs: files the job writes
+        """
+        self.entries[job] = dict(fingerprint, status="running", outputs=outputs, stats=None,
+            updated=time.time())
+
+    def complete(self, job: str, stats: Dict):
+        """
+        Records a running job as complete
+
+        Parameters:
+        1. job: job name (see job_id)
+        2. stats: statistics of the job
+        """
+        self.entries[job].update(status="complete", stats=stats, updated=time.time())
+
+    def fail(self, job: str, error: str):
+        """
+        Records a running job as failed
+
+        Parameters:
+        1. job: job name (see job_id)
+        2. error: description of the failure
+        """
+        self.entries[job].update(status="failed", error=error, updated=time.time())
+
+    def stats(self, job: str) -> Dict:
+        """
+        Parameters:
+        1. job: job name (see job_id)
+
+        Returns:
+        1. statistics of the job, or None if it is not complete
+        """
+        entry = self.entries.get(job)
+        if entry is None or entry["status"] != "complete":
+            return None
+
+        return entry["stats"]
+
+    def save(self):
+        """
+        Writes the manifest
+        """
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps({"jobs": self.entries}, indent=4))
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+from typing import List, Tuple, Dict
+from pricepath import PricePath
+from traffic import Traffic
+
+TRAFFIC_COLUMNS = ["intype", "outtype", "inval", "is_arb"]
+
+def scenario_key(config: Dict, seed: int = None, market: str = "", replica: int = 0) -> str:
+    """
+    Content address of the scenario a config generates: a hash of the canonical
+    JSON form of the config sections scenario generation depends on and the seed
+
+    Only the initializer's token_configs enter the hash: its init_kwargs (pool
+    size and k) do not change prices or traffic, so configs of one market that
+    only differ in k share a scenario
+
+    The market and replica select the random streams derived from the seed,
+    so they are part of the content when a seed is given
+
+    Parameters:
+    1. config: simulation config
+    2. seed: root seed scenario generation is run with
+    3. market: market (config subdirectory) name
+    4. replica: index of the scenario replica
+
+    Returns:
+    1. hexadecimal key
+    """
+    content = {
+        "initializer": config["initializer"]["token_configs"],
+        "traffic": config["traffic"],
+        "price_gen": config["price_gen"],
+        "seed": seed
+    }
+    if seed is not None:
+        content["stream"] = [market, replica]
+    canonical = json.dumps(content, sort_keys=True, separators=(",", ":"))
+
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+def directory_size(path: str) -> int:
+    """
+    Parameters:
+    1. path: directory
+
+    Returns:
+    1. total size in bytes of the files in the directory
+    """
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+def scenario_exists(path: str) -> bool:
+    """
+    Checks whether a complete scenario is stored at path
+
+    Parameters:
+    1. path: scenario directory
+
+    Returns:
+    1. whether or not the scenario can be loaded
+    """
+    return os.path.exists(os.path.join(path, "meta.json"))
+
+def write_scenario(path: str, prices: PricePath, traffic: Traffic):
+    """
+    Stores prices and traffic as .npy arrays; the directory is written under a
+    temporary name and renamed into place, so readers never see a partial scenario
+
+    Parameters:
+    1. path: scenario directory
+    2. prices: external prices of the scenario
+    3. traffic: traffic of the scenario
+    """
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    np.save(os.path.join(tmp_path, "prices.npy"), np.ascontiguousarray(prices.values))
+    for column in TRAFFIC_COLUMNS:
+        np.save(os.path.join(tmp_path, column + ".npy"),
+            np.ascontiguousarray(getattr(traffic, column)))
+
+    # meta.json is written last and marks the scenario as complete
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        f.write(json.dumps({"price_tokens": prices.tokens, "traffic_tokens": traffic.tokens}))
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # another process stored the same scenario first
+        shutil.rmtree(tmp_path)
+        if not scenario_exists(path):
+            raise
+
+def load_scenario(path: str) -> Tuple[PricePath, Traffic]:
+    """
+    Opens a stored scenario; arrays are memory-mapped read-only, so processes
+    loading the same scenario share its pages instead of copying them
+
+    Parameters:
+    1. path: scenario directory
+
+    Returns:
+    1. external prices of the scenario
+    2. traffic of the scenario
+    """
+    with open(os.path.join(path, "meta.json"), "r") as f:
+        meta = json.load(f)
+
+    prices = PricePath(meta["price_tokens"],
+        np.load(os.path.join(path, "prices.npy"), mmap_mode="r"))
+    traffic = Traffic(meta["traffic_tokens"], *[np.load(os.path.join(path, column + ".npy"),
+        mmap_mode="r") for column in TRAFFIC_COLUMNS])
+
+    return prices, traffic
+
+class ScenarioCache():
+    def __init__(self, root: str, max_bytes: int = None):
+        """
+        Stores scenarios in root/<key>/ by content address; root/manifest.json
+        records each entry's size and last use, and the least recently used
+        entries are evicted once the cache grows past max_bytes
+
+        The manifest is only read and written by the process driving a sweep;
+        worker processes only write scenario directories
+
+        Parameters:
+        1. root: cache directory
+        2. max_bytes: size bound of the cache; unbounded if None
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.manifest_path = os.path.join(root, "manifest.json")
+        os.makedirs(root, exist_ok=True)
+
+        self.entries = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as f:
+                self.entries = json.load(f)["entries"]
+        # drop entries whose directory was removed by hand
+        self.entries = {key: entry for key, entry in self.entries.items() \
+            if scenario_exists(self.path(key))}
+
+    def path(self, key: str) -> str:
+        """
+        Parameters:
+        1. key: scenario key
+
+        Returns:
+        1. directory of the scenario
+        """
+        return os.path.join(self.root, key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries or scenario_exists(self.path(key))
+
+    def add(self, key: str, description: Dict = None):
+        """
+        Registers a scenario written to path(key) and marks it used
+
+        Parameters:
+        1. key: scenario key
+        2. description: free-form information stored in the manifest entry
+        """
+        now = time.time()
+        self.entries[key] = {
+            "size": directory_size(self.path(key)),
+            "created": self.entries.get(key, {}).get("created", now),
+            "last_used": now,
+            "description": description or {}
+        }
+
+    def touch(self, key: str):
+        """
+        Marks a scenario used
+
+        Parameters:
+        1. key: scenario key
+        """
+        if not key in self.entries:
+            self.add(key)
+        else:
+            self.entries[key]["last_used"] = time.time()
+
+    def evict(self, pinned: List[str] = []) -> List[str]:
+        """
+        Removes least recently used scenarios until the cache fits in max_bytes
+
+        Parameters:
+        1. pinned: keys that must not be removed
+
+        Returns:
+        1. removed keys
+        """
+        removed = []
+        if self.max_bytes is None:
+            return removed
+
+        total = sum(entry["size"] for entry in self.entries.values())
+        for key in sorted(self.entries, key=lambda k: self.entries[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if key in pinned:
+                continue
+
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            total -= self.entries.pop(key)["size"]
+            removed.append(key)
+
+        return removed
+
+    def save(self):
+        """
+        Writes the manifest
+        """
+        tmp_path = "{}.{}.tmp".format(self.manifest_path, os.getpid())
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps({"entries": self.entries}, indent=4, sort_keys=True))
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,22 @@
+import zlib
+import numpy as np
+
+COMPONENTS = {"initializer": 0, "price_gen": 1, "traffic": 2}
+
+def stream(seed: int, market: str, component: str, replica: int = 0) -> np.random.SeedSequence:
+    """
+    Derives the random stream of one component of one scenario; streams of
+    different (market, component, replica) triples are statistically
+    independent and do not depend on the process or order they are used in
+
+    Parameters:
+    1. seed: root seed of the sweep
+    2. market: market (config subdirectory) name
+    3. component: one of COMPONENTS
+    4. replica: index of the scenario replica
+
+    Returns:
+    1. seed sequence to seed the component with
+    """
+    return np.random.SeedSequence(seed, spawn_key=(zlib.crc32(market.encode("utf-8")),
+        COMPONENTS[component], replica))
@@ -0,0 +1,308 @@
+"""
+Compiled simulation loop of the numba backend (see backends)
+
+simulate runs MarketMakerInterface.simulate_traffic's loop (swaps, arbitrage,
+reset_tx) over array-backed pool state: token_info and equilibriums arrays
+flattened to one row per token (multi token) or per ordered token pair
+(pairwise, row i*n + j). Every function here is plain arithmetic and loops
+over scalars and arrays, so it compiles with numba and also runs, slowly, as
+Python. States without a real value go nan instead of raising or turning
+complex.
+
+Executed swaps are written to rows of the form
+[batch, tx, in id, out id, inpool_init_val, outpool_init_val, inpool_after_val,
+outpool_after_val, market_rate, after_rate, reverse pool balance 0,
+reverse pool balance 1] (the reverse pool balances are nan for multi token
+pools).
+"""
+import math
+import numpy as np
+import pmmcurve
+from backends import jit
+
+# market maker kinds
+AMM, MAMM, CSMM, MCSMM, PMM, MPMM = range(6)
+ROW_SIZE = 12
+
+_solve_long = jit(pmmcurve.solve_long)
+_solve_short = jit(pmmcurve.solve_short)
+_shortage_equilibrium = jit(pmmcurve.shortage_equilibrium)
+_argmin_cubic = jit(pmmcurve._argmin_cubic)
+
+@jit
+def _out_balance(i_0, o_0, in_e, out_e, d, p, k):
+    """
+    pmmcurve.out_balance, calling the compiled curve functions
+    """
+    if o_0 / out_e > i_0 / in_e:
+        static_amt = in_e - i_0
+        if static_amt < d:
+            return _solve_short(d - static_amt + in_e, in_e, out_e, p, k)
+        return _solve_long(i_0 + d, out_e, in_e, 1/p, k)
+    return _solve_short(i_0 + d, in_e, out_e, p, k)
+
+@jit
+def _newton(w, P, Q):
+    """
+    One Newton step on w**3 + P*w + Q = 0, as in pmmcurve.excess_equilibrium
+    """
+    slope = 3*w*w + P
+    if slope == 0:
+        return w
+    return w - (w*w*w + P*w + Q) / slope
+
+@jit
+def _excess_equilibrium(s, l, S, L, p, k):
+    """
+    pmmcurve.excess_equilibrium with one Newton step, without lists
+    """
+    P, Q, g = _argmin_cubic(s, l, S, L, p, k)
+    disc = (Q/2)**2 + (P/3)**3
+
+    if disc > 0:
+        a = -math.copysign(math.pow(abs(Q)/2 + math.sqrt(disc), 1/3), Q)
+        w2 = _newton(a - P / (3*a), P, Q)**2
+        if (1.5*w2 + P) * g < 0:
+            return l + (w2/2 + P + 1) * g
+        return l - (w2 - 1) * g
+
+    r = 2 * math.sqrt(-P/3)
+    phi = math.acos(max(-1.0, min(1.0, 3*Q / (P*r)))) / 3
+    best = 0.0
+    for j in range(3):
+        w = _newton(r * math.cos(phi - 2*math.pi*j/3), P, Q)
+        u = l - (w*w - 1) * g
+        if j == 0 or u < best:
+            best = u
+    return best
+
+@jit
+def _pmm_equilibriums(in_b, out_b, in_eq, out_eq, k, in_price, out_price):
+    """
+    PMM's equilibriums of a pool
+    """
+    if in_b / in_eq >= out_b / out_eq:
+        return in_eq, _shortage_equilibrium(out_b, in_b, in_eq, out_price / in_price, k)
+    return _shortage_equilibrium(in_b, out_b, out_eq, in_price / out_price, k), out_eq
+
+@jit
+def _dist_sq(x0, y0, x1, y1):
+    return (1 - x1 / x0) ** 2 + (1 - y1 / y0) ** 2
+
+@jit
+def _valid(in_0, out_0, in_x, out_x, tol):
+    return (in_x + tol >= in_0 and out_0 + tol >= out_x) or \
+        (out_x + tol >= out_0 and in_0 + tol >= in_x)
+
+@jit
+def _mpmm_equilibriums(in_0, out_0, I, O, k, in_price, out_price, tol):
+    """
+    MPMM's equilibriums of a token pair: the closest to (I, O) of the current
+    balances and the valid equilibriums with either token in shortage
+    """
+    p = out_price / in_price
+    in_e, out_e, best = in_0, out_0, _dist_sq(I, O, in_0, out_0)
+
+    out_1 = _excess_equilibrium(in_0, out_0, I, O, 1 / p, k)
+    in_1 = _shortage_equilibrium(in_0, out_0, out_1, 1 / p, k)
+    if _valid(in_0, out_0, in_1, out_1, tol):
+        dist = _dist_sq(I, O, in_1, out_1)
+        if dist < best:
+            in_e, out_e, best = in_1, out_1, dist
+
+    in_2 = _excess_equilibrium(out_0, in_0, O, I, p, k)
+    out_2 = _shortage_equilibrium(out_0, in_0, in_2, p, k)
+    if _valid(in_0, out_0, in_2, out_2, tol):
+        dist = _dist_sq(I, O, in_2, out_2)
+        if dist < best:
+            in_e, out_e, best = in_2, out_2, dist
+
+    return in_e, out_e
+
+@jit
+def _is_multi(kind):
+    return kind == MAMM or kind == MCSMM or kind == MPMM
+
+@jit
+def _balances(kind, n, state, i, j):
+    if _is_multi(kind):
+        return state[i, 0], state[j, 0]
+    return state[i*n + j, 0], state[i*n + j, 1]
+
+@jit
+def _equilibriums(kind, n, state, eqs, prices, i, j, tol):
+    """
+    calculate_equilibriums of the market maker kind for tokens i and j
+    """
+    in_price, out_price = prices[i], prices[j]
+    if kind == AMM or kind == MAMM:
+        i_0, o_0 = _balances(kind, n, state, i, j)
+        const = i_0 * o_0
+        new_out = (const / (out_price / in_price)) ** 0.5
+        return const / new_out, new_out
+    if kind == PMM:
+        pool = i*n + j
+        return _pmm_equilibriums(state[pool, 0], state[pool, 1], eqs[pool, 0], eqs[pool, 1],
+            state[pool, 2], in_price, out_price)
+    if kind == MPMM:
+        return _mpmm_equilibriums(state[i, 0], state[j, 0], eqs[i, 0], eqs[j, 0],
+            max(state[i, 1], state[j, 1]), in_price, out_price, tol)
+    return np.nan, np.nan
+
+@jit
+def _swap(kind, n, state, eqs, prices, i, j, d, out_amt, quoted, tol, row):
+    """
+    Executes a swap of d of token i for token j as the market maker kind's swap
+    does, removing out_amt of token j unless the swap is quoted, and writes its
+    output to row[2:]
+    """
+    in_price, out_price = prices[i], prices[j]
+    p = out_price / in_price
+    pool, rev = i*n + j, j*n + i
+    i_0, o_0 = _balances(kind, n, state, i, j)
+
+    if kind == AMM or kind == MAMM:
+        const = i_0 * o_0
+        out_amt = const*(1/i_0 - (1/(i_0 + d)))
+        after_rate = d / (const*(1/(i_0 + d) - (1/(i_0 + 2*d))))
+    elif kind == CSMM or kind == MCSMM:
+        if quoted:
+            out_amt = d / p
+            if out_amt > o_0:
+                out_amt = 0.0
+            if out_amt == 0:
+                # the pool cannot cover the swap
+                d = 0.0
+        after_rate = p
+    elif kind == PMM:
+        k = state[pool, 2]
+        in_e, out_e = _pmm_equilibriums(i_0, o_0, eqs[pool, 0], eqs[pool, 1], k, in_price,
+            out_price)
+        if quoted:
+            out_amt = o_0 - _out_balance(i_0, o_0, in_e, out_e, d, p, k)
+        # the swap moves the pool's equilibriums to (in_e, out_e)
+        i_1, o_1 = i_0 + d, o_0 - out_amt
+        in_1, out_1 = _pmm_equilibriums(i_1, o_1, in_e, out_e, k, in_price, out_price)
+        after_rate = d / (o_1 - _out_balance(i_1, o_1, in_1, out_1, d, p, k))
+        eqs[pool, 0], eqs[pool, 1], eqs[pool, 2] = in_e, out_e, k
+        eqs[rev, 0], eqs[rev, 1], eqs[rev, 2] = out_e, in_e, k
+    else:
+        I, O, k = eqs[i, 0], eqs[j, 0], max(state[i, 1], state[j, 1])
+        if quoted:
+            in_e, out_e = _mpmm_equilibriums(i_0, o_0, I, O, k, in_price, out_price, tol)
+            out_amt = o_0 - _out_balance(i_0, o_0, in_e, out_e, d, p, k)
+        i_1, o_1 = i_0 + d, o_0 - out_amt
+        in_e, out_e = _mpmm_equilibriums(i_1, o_1, I, O, k, in_price, out_price, tol)
+        after_rate = d / (o_1 - _out_balance(i_1, o_1, in_e, out_e, d, p, k))
+
+    row[2], row[3], row[4], row[5] = i, j, i_0, o_0
+    row[6], row[7], row[8], row[9] = i_0 + d, o_0 - out_amt, p, after_rate
+    if _is_multi(kind):
+        state[i, 0] = i_0 + d
+        state[j, 0] = o_0 - out_amt
+        row[10], row[11] = np.nan, np.nan
+    else:
+        state[pool, 0] = i_0 + d
+        state[pool, 1] = o_0 - out_amt
+        state[rev, 0] -= out_amt
+        state[rev, 1] += d
+        row[10], row[11] = state[rev, 0], state[rev, 1]
+
+@jit
+def _arbitrage(kind, n, state, eqs, prices, crash, scan_order, arb_actions, lim, tol,
+rows, count, batch, tx):
+    """
+    arbitrage: up to arb_actions swaps of the pair furthest from equilibrium;
+    like arbitrage's info, the best pair so far carries over between actions
+
+    Returns:
+    1. number of rows written so far
+    """
+    info_rate, info_in, info_out, info_i, info_j = -1.0, 0.0, 0.0, 0, 0
+
+    for action in range(arb_actions):
+        best = -np.inf
+        best_in, best_out, best_i, best_j = 0.0, 0.0, 0, 0
+        for flat in scan_order:
+            i, j = flat // n, flat % n
+            if i == j or crash[j]:
+                continue
+            in_e, out_e = _equilibriums(kind, n, state, eqs, prices, i, j, tol)
+            i_0, o_0 = _balances(kind, n, state, i, j)
+            in_amt, out_amt = in_e - i_0, o_0 - out_e
+
+            internal_rate = 1.0 if out_amt == 0 else in_amt / out_amt
+            if internal_rate == 0:
+                internal_rate = 1.0
+            rate = (prices[j] / prices[i]) / internal_rate
+            if rate > info_rate and in_amt > lim and rate > best:
+                best, best_in, best_out, best_i, best_j = rate, in_amt, out_amt, i, j
+
+        if best > -np.inf:
+            info_rate, info_in, info_out, info_i, info_j = best, best_in, best_out, best_i, best_j
+
+        if info_rate > 1 and info_in > 0:
+            rows[count, 0], rows[count, 1] = batch, tx
+            _swap(kind, n, state, eqs, prices, info_i, info_j, info_in, info_out, False, tol,
+                rows[count])
+            count += 1
+        else:
+            break
+
+    return count
+
+@jit
+def simulate(kind, n, reset, arb, arb_actions, lim, tol, state, eqs, prices, intype, outtype,
+inval, is_arb, crash, scan_order, rows):
+    """
+    Simulates traffic on array-backed pool state, changing state and eqs as
+    simulate_traffic changes token_info and equilibriums
+
+    Parameters:
+    1. kind: market maker kind (AMM, MAMM, CSMM, MCSMM, PMM or MPMM)
+    2. n: number of tokens
+    3. reset: reset_tx
+    4. arb: whether or not arbitrage opportunities are acted on
+    5. arb_actions: how many swaps can occur for one arbitrage opportunity
+    6. lim: how large the input token amount must be to execute an arbitrage
+    7. tol: float tolerance of MPMM's equilibriums
+    8. state: token_info array, one row per token or ordered token pair
+    9. eqs: equilibriums array laid out like state (any array for makers
+    without equilibriums)
+    10. prices: (batches, tokens) market prices
+    11. intype: (batches, batch_size) input token ids
+    12. outtype: (batches, batch_size) output token ids
+    13. inval: (batches, batch_size) amounts of input token inserted
+    14. is_arb: (batches, batch_size) whether or not transactions are arbitrage
+    15. crash: whether or not each token crashed in price
+    16. scan_order: flat indices i*n + j of the pairs in the order arbitrage
+    scans them
+    17. rows: (capacity, ROW_SIZE) output rows
+
+    Returns:
+    1. number of rows written
+    """
+    start_state = state.copy()
+    start_eqs = eqs.copy()
+    count = 0
+
+    for batch in range(intype.shape[0]):
+        batch_prices = prices[batch]
+        if reset:
+            eqs[:, :] = start_eqs
+
+        for tx in range(intype.shape[1]):
+            if is_arb[batch, tx] and arb:
+                if kind != CSMM and kind != MCSMM:
+                    count = _arbitrage(kind, n, state, eqs, batch_prices, crash, scan_order,
+                        arb_actions, lim, tol, rows, count, batch, tx)
+            else:
+                rows[count, 0], rows[count, 1] = batch, tx
+                _swap(kind, n, state, eqs, batch_prices, intype[batch, tx], outtype[batch, tx],
+                    inval[batch, tx], 0.0, True, tol, rows[count])
+                count += 1
+
+            if reset:
+                state[:, :] = start_state
+
+    return count
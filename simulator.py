@@ -1,28 +1,101 @@
 import argparse
 import json
-import pickle
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Tuple, Dict
 
+import backends
 import marketmakers
 import metrics
+import plotting
+import rawdata
+import runmanifest
+import scenario
+import seeding
+from ensemble import Ensemble
 from initializer import Initializer
 from pricegen import PriceGenerator
 from trafficgen import TrafficGenerator
 
-import matplotlib.pyplot as plt
-import json
+CATEGORIES = plotting.CATEGORIES
+
+def initialize(config: Dict, seed: int = None, market: str = "") -> Tuple:
+    """
+    Runs the initializer section of a config
+
+    Parameters:
+    1. config: simulation config
+    2. seed: root seed; random k values come from the market's initializer
+    stream if given
+    3. market: market (config subdirectory) name
 
-def simulate(config):
-    initializer = Initializer(**config["initializer"]["init_kwargs"])
+    Returns:
+    1. Initializer.get_stats() of the configured initializer
+    """
+    init_kwargs = dict(config["initializer"]["init_kwargs"])
+    if seed is not None:
+        init_kwargs["seed"] = seeding.stream(seed, market, "initializer")
+    initializer = Initializer(**init_kwargs)
     initializer.configure_tokens(**config["initializer"]["token_configs"])
-    pairwise_pools, pairwise_infos, single_pools, single_infos, \
-        traffic_info, price_gen_info, crash_types = initializer.get_stats()
 
-    traffic_generator = TrafficGenerator(**config['traffic']['init_kwargs'])
-    traffic_generator.configure_tokens(single_pools, traffic_info)
+    return initializer.get_stats()
+
+def prepare_scenario(config: Dict, path: str, seed: int = None, market: str = "",
+replica: int = 0):
+    """
+    Generates a config's prices and traffic and stores them as arrays at path,
+    unless they are already stored
 
-    price_generator = PriceGenerator(**config['price_gen']['init_kwargs'])
+    Parameters:
+    1. config: simulation config the scenario is generated from
+    2. path: scenario directory
+    3. seed: root seed; the generators draw from the (market, component, replica)
+    streams derived from it, or are seeded by their own init_kwargs if None
+    4. market: market (config subdirectory) name
+    5. replica: index of the scenario replica
+    """
+    if scenario.scenario_exists(path):
+        return
+
+    _, _, single_pools, _, traffic_info, price_gen_info, _ = initialize(config, seed, market)
+    price_kwargs = dict(config['price_gen']['init_kwargs'])
+    traffic_kwargs = dict(config['traffic']['init_kwargs'])
+    if seed is not None:
+        price_kwargs["seed"] = seeding.stream(seed, market, "price_gen", replica)
+        traffic_kwargs["seed"] = seeding.stream(seed, market, "traffic", replica)
+
+    price_generator = PriceGenerator(**price_kwargs)
     price_generator.configure_tokens(price_gen_info)
+    ext_prices = price_generator.simulate_ext_prices()
+
+    traffic_generator = TrafficGenerator(**traffic_kwargs)
+    traffic_generator.configure_tokens(single_pools, traffic_info)
+    traffics = traffic_generator.generate_traffic(ext_prices)
+
+    scenario.write_scenario(path, ext_prices, traffics)
+
+def simulate(config: Dict, base_dir: str, market: str, mm_name: str, scenario_path: str,
+seed: int = None, backend: str = None, raw_format: str = "npz"
+) -> Dict[str, Dict[str, float]]:
+    """
+    Simulates one market maker config on a stored scenario and stores the
+    resulting raw data and statistics
+
+    Parameters:
+    1. config: simulation config
+    2. base_dir: results directory
+    3. market: market (config subdirectory) name
+    4. mm_name: config name
+    5. scenario_path: directory of the scenario generated from config
+    6. seed: root seed the scenario was generated with
+    7. backend: compute backend, overriding the config's (see backends)
+    8. raw_format: file format of the raw data (see rawdata)
+
+    Returns:
+    1. statistics of each metric category
+    """
+    pairwise_pools, pairwise_infos, single_pools, single_infos, \
+        traffic_info, price_gen_info, crash_types = initialize(config, seed, market)
 
     MMClass = getattr(marketmakers, config['market_maker']['type'])
     mm = MMClass(
@@ -31,108 +104,392 @@ def simulate(config):
         single_pools = single_pools,
         single_infos = single_infos
     )
-    mm.configure_simulation(**config['market_maker']['simulate_kwargs'])
+    simulate_kwargs = dict(config['market_maker']['simulate_kwargs'])
+    if backend is not None:
+        simulate_kwargs["backend"] = backend
+    mm.configure_simulation(**simulate_kwargs)
     mm.configure_crash_types(crash_types)
 
-    # generate prices, traffic and store in files
-    price_dir = os.path.join(base_dir, market + "_price.obj")
-    if not os.path.exists(price_dir):
-        ext_prices = price_generator.simulate_ext_prices()
-        f = open(price_dir, "wb")
-        pickle.dump(ext_prices, f)
-        f.close()
-    else:
-        f = open(price_dir, "rb")
-        ext_prices = pickle.load(f)
-        f.close()
-    
-    traffic_dir = os.path.join(base_dir, market + "_traffic.obj")
-    if not os.path.exists(traffic_dir):
-        traffics = traffic_generator.generate_traffic(ext_prices)
-        f = open(traffic_dir, "wb")
-        pickle.dump(traffics, f)
-        f.close()
-    else:
-        f = open(traffic_dir, "rb")
-        traffics = pickle.load(f)
-        f.close()
+    # open prices and traffic read-only
+    ext_prices, traffics = scenario.load_scenario(scenario_path)
 
-    outputs, statuses, status0, crash_types = mm.simulate_traffic(traffics, ext_prices)
+    # compute metrics while simulating, without keeping swap outputs or pool history
+    cap_eff_observer = metrics.CapitalEfficiencyObserver()
+    imp_loss_observer = metrics.ImpermanentLossObserver()
+    price_imp_observer = metrics.PriceImpactObserver()
+    mm.simulate_traffic(traffics, ext_prices,
+        [cap_eff_observer, imp_loss_observer, price_imp_observer], False)
 
-    # compute metrics
     disply_name = market + " " + mm_name
-    capital_efficiency, cap_eff_dict = metrics.capital_efficiency(outputs, crash_types, disply_name)
+    capital_efficiency, cap_eff_dict = cap_eff_observer.results(disply_name)
     impermanent_gain, impermanent_loss, gain_dict, loss_dict =\
-         metrics.impermanent_loss(status0, statuses, crash_types, disply_name)
-    price_impact, price_imp_dict = metrics.price_impact(outputs, crash_types, disply_name)
-
-    # price_impact
-    plt.scatter([x[0] for x in price_impact], [x[1] for x in price_impact], s=1)
-    plt.savefig('{d}/images/price_impact/{m}/{n}.png'.format(d=base_dir, m=market, n=mm_name))
-    plt.clf()
-    pickle.dump(price_impact, \
-        open("{d}/raw_data/price_impact/{m}/{n}.pkl".format(d=base_dir, m=market, n=mm_name), "wb"))
-    with open("{d}/stats/price_impact/{m}/{n}.json".format(d=base_dir, m=market, n=mm_name), "w") as f:
-        f.write(json.dumps(price_imp_dict))
-    
-    # capital efficiency
-    plt.scatter([x[0] for x in capital_efficiency], [x[1] for x in capital_efficiency], s=1)
-    plt.savefig('{d}/images/capital_efficiency/{m}/{n}.png'.format(d=base_dir, m=market, n=mm_name))
-    plt.clf()
-    pickle.dump(capital_efficiency, \
-        open("{d}/raw_data/capital_efficiency/{m}/{n}.pkl".format(d=base_dir, m=market, n=mm_name), "wb"))
-    with open("{d}/stats/capital_efficiency/{m}/{n}.json".format(d=base_dir, m=market, n=mm_name), "w") as f:
-        f.write(json.dumps(cap_eff_dict))
-    
-    # impermanent loss
-    plt.scatter([x[0] for x in impermanent_gain], [x[1] for x in impermanent_gain], s=1)
-    plt.savefig('{d}/images/impermanent_gain/{m}/{n}.png'.format(d=base_dir, m=market, n=mm_name))
-    plt.clf()
-    pickle.dump(impermanent_gain, \
-        open("{d}/raw_data/impermanent_gain/{m}/{n}.pkl".format(d=base_dir, m=market, n=mm_name), "wb"))
-    with open("{d}/stats/impermanent_gain/{m}/{n}.json".format(d=base_dir, m=market, n=mm_name), "w") as f:
-        f.write(json.dumps(gain_dict))
-    plt.scatter([x[0] for x in impermanent_loss], [x[1] for x in impermanent_loss], s=1)
-    plt.savefig('{d}/images/impermanent_loss/{m}/{n}.png'.format(d=base_dir, m=market, n=mm_name))
-    plt.clf()
-    pickle.dump(impermanent_loss, \
-        open("{d}/raw_data/impermanent_loss/{m}/{n}.pkl".format(d=base_dir, m=market, n=mm_name), "wb"))
-    with open("{d}/stats/impermanent_loss/{m}/{n}.json".format(d=base_dir, m=market, n=mm_name), "w") as f:
-        f.write(json.dumps(loss_dict))
+         imp_loss_observer.results(disply_name)
+    price_impact, price_imp_dict = price_imp_observer.results(disply_name)
+
+    points = {
+        "price_impact": price_impact,
+        "capital_efficiency": capital_efficiency,
+        "impermanent_gain": impermanent_gain,
+        "impermanent_loss": impermanent_loss
+    }
+    stat_dicts = {
+        "price_impact": price_imp_dict,
+        "capital_efficiency": cap_eff_dict,
+        "impermanent_gain": gain_dict,
+        "impermanent_loss": loss_dict
+    }
+    # images are rendered from the raw data in the plotting stage (see plotting)
+    for category in CATEGORIES:
+        rawdata.write_raw_data(rawdata.raw_data_path(base_dir, category, market, mm_name,
+            raw_format), category, points[category])
+        with open("{d}/stats/{c}/{m}/{n}.json".format(d=base_dir, c=category, m=market,
+            n=mm_name), "w") as f:
+            f.write(json.dumps(stat_dicts[category]))
+
+    return stat_dicts
+
+def simulate_ensemble(config: Dict, base_dir: str, market: str, mm_name: str,
+scenario_paths: List[str], seed: int = None) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Simulates one market maker config on stored scenario replicas at once (see
+    Ensemble) and stores the means and confidence intervals of the statistics
+    of each replica; no images or raw data are stored, and those left by an
+    earlier single-replica run of the job are removed
+
+    Parameters:
+    1. config: simulation config
+    2. base_dir: results directory
+    3. market: market (config subdirectory) name
+    4. mm_name: config name
+    5. scenario_paths: directories of the scenario replicas generated from config
+    6. seed: root seed the scenarios were generated with
+
+    Returns:
+    1. aggregated statistics of each metric category
+    """
+    pairwise_pools, pairwise_infos, single_pools, single_infos, \
+        traffic_info, price_gen_info, crash_types = initialize(config, seed, market)
+
+    MMClass = getattr(marketmakers, config['market_maker']['type'])
+    mm = MMClass(
+        pairwise_pools = pairwise_pools,
+        pairwise_infos = pairwise_infos,
+        single_pools = single_pools,
+        single_infos = single_infos
+    )
+    mm.configure_simulation(**config['market_maker']['simulate_kwargs'])
+    mm.configure_crash_types(crash_types)
+
+    scenarios = [scenario.load_scenario(path) for path in scenario_paths]
+    output = Ensemble(mm).simulate([traffics for _, traffics in scenarios],
+        [ext_prices for ext_prices, _ in scenarios])
+    results = metrics.ensemble_metrics(output)
+
+    for category in CATEGORIES:
+        with open("{d}/stats/{c}/{m}/{n}.json".format(d=base_dir, c=category, m=market,
+            n=mm_name), "w") as f:
+            f.write(json.dumps(results[category]))
+
+        # they would otherwise read as results of this run next to its stats
+        stale = [plotting.image_path(base_dir, category, market, mm_name)] + \
+            [rawdata.raw_data_path(base_dir, category, market, mm_name, format) \
+            for format in rawdata.FORMATS]
+        for path in stale:
+            if os.path.exists(path):
+                os.remove(path)
+
+    return results
+
+def make_dirs(base_dir: str, markets: List[str]):
+    """
+    Creates the results directory tree
+
+    Parameters:
+    1. base_dir: results directory
+    2. markets: market (config subdirectory) names
+    """
+    for dir in ["images", "stats", "raw_data"]:
+        for sub_dir in CATEGORIES:
+            for market in markets:
+                os.makedirs(os.path.join(base_dir, dir, sub_dir, market), exist_ok=True)
+
+def find_jobs(base_dir: str, config_dir: str = "config") -> List[Tuple[str, str, str, Dict]]:
+    """
+    Lists every (market, config) pair as a self-contained job, in a fixed order
+
+    Parameters:
+    1. base_dir: results directory
+    2. config_dir: directory containing one subdirectory of configs per market
+
+    Returns:
+    1. jobs of the form (base_dir, market, mm_name, config)
+    """
+    jobs = []
+    for market in sorted(os.listdir(config_dir)):
+        market_path = os.path.join(config_dir, market)
+        for env in sorted(os.listdir(market_path)):
+            with open(os.path.join(market_path, env), 'r') as f:
+                config = json.load(f)
+            jobs.append((base_dir, market, env[:-5], config))
+
+    return jobs
+
+def run_job(job: Tuple[str, str, str, Dict], scenario_paths: List[str], seed: int = None,
+backend: str = None, raw_format: str = "npz") -> Dict[str, Dict[str, float]]:
+    """
+    Runs one job produced by find_jobs
+
+    Parameters:
+    1. job: (base_dir, market, mm_name, config)
+    2. scenario_paths: directories of the job's scenario replicas; more than one
+    replica runs the job as an ensemble (see simulate_ensemble)
+    3. seed: root seed of the sweep
+    4. backend: compute backend, overriding the configs' (see backends)
+    5. raw_format: file format of the raw data (see rawdata)
+
+    Returns:
+    1. statistics of each metric category
+    """
+    base_dir, market, mm_name, config = job
+
+    if len(scenario_paths) > 1:
+        return simulate_ensemble(config, base_dir, market, mm_name, scenario_paths, seed)
+
+    return simulate(config, base_dir, market, mm_name, scenario_paths[0], seed, backend,
+        raw_format)
+
+def generate_scenarios(jobs: List[Tuple[str, str, str, Dict]], cache: scenario.ScenarioCache,
+seed: int = None, workers: int = 1, replicas: int = 1) -> List[List[str]]:
+    """
+    Scenario stage of a sweep: generates and stores every scenario the jobs need
+    that is not cached yet, in parallel worker processes if workers > 1, then
+    updates the cache manifest and evicts unused scenarios if it is too large
+
+    Parameters:
+    1. jobs: jobs produced by find_jobs
+    2. cache: scenario cache
+    3. seed: seed of scenario generation
+    4. workers: number of worker processes
+    5. replicas: number of scenario replicas of each job
+
+    Returns:
+    1. scenario directory of each replica of each job, in the order of jobs
+    """
+    job_keys = [[scenario.scenario_key(config, seed, market, replica) \
+        for replica in range(replicas)] for _, market, _, config in jobs]
+    keys = [key for replica_keys in job_keys for key in replica_keys]
+    missing = {}
+    for replica_keys, (_, market, _, config) in zip(job_keys, jobs):
+        for replica, key in enumerate(replica_keys):
+            if not key in cache and not key in missing:
+                missing[key] = (config, market, replica)
+
+    if workers <= 1:
+        for key, (config, market, replica) in missing.items():
+            prepare_scenario(config, cache.path(key), seed, market, replica)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(prepare_scenario, config, cache.path(key), seed, market,
+                replica) for key, (config, market, replica) in missing.items()]
+            for future in futures:
+                future.result()
+
+    for key, (_, market, replica) in missing.items():
+        cache.add(key, {"market": market, "seed": seed, "replica": replica})
+    for key in set(keys):
+        cache.touch(key)
+    cache.evict(keys)
+    cache.save()
+
+    return [[cache.path(key) for key in replica_keys] for replica_keys in job_keys]
+
+def job_outputs(job: Tuple[str, str, str, Dict], replicas: int = 1, raw_format: str = "npz"
+) -> List[str]:
+    """
+    Parameters:
+    1. job: (base_dir, market, mm_name, config)
+    2. replicas: number of scenario replicas the job is simulated on
+    3. raw_format: file format of the raw data (see rawdata)
+
+    Returns:
+    1. files the job writes: its statistics, and its raw data unless it runs as
+    an ensemble
+    """
+    base_dir, market, mm_name, _ = job
+    outputs = ["{d}/stats/{c}/{m}/{n}.json".format(d=base_dir, c=category, m=market, n=mm_name) \
+        for category in CATEGORIES]
+    if replicas == 1:
+        outputs += [rawdata.raw_data_path(base_dir, category, market, mm_name, raw_format) \
+            for category in CATEGORIES]
+
+    return outputs
+
+def job_fingerprint(job: Tuple[str, str, str, Dict], seed: int = None, replicas: int = 1,
+backend: str = None, raw_format: str = "npz", code_version: str = None) -> Dict:
+    """
+    Describes what a job is run from, for the run manifest (see
+    runmanifest.RunManifest.start)
+
+    Parameters:
+    1. job: (base_dir, market, mm_name, config)
+    2. seed: root seed of the sweep
+    3. replicas: number of scenario replicas of the job
+    4. backend: compute backend, overriding the configs' (see backends)
+    5. raw_format: file format of the raw data (see rawdata)
+    6. code_version: version of the code (computed if None)
+
+    Returns:
+    1. fingerprint of the job
+    """
+    _, market, _, config = job
+
+    return {
+            "config_hash": runmanifest.config_hash(config),
+            "scenario_keys": [scenario.scenario_key(config, seed, market, replica) \
+                for replica in range(replicas)],
+            "code_version": code_version or runmanifest.code_version(),
+            "options": {"seed": seed, "replicas": replicas, "backend": backend,
+                "raw_format": raw_format}
+        }
+
+def run_sweep(jobs: List[Tuple[str, str, str, Dict]], cache: scenario.ScenarioCache,
+seed: int = None, workers: int = 1, replicas: int = 1, backend: str = None,
+raw_format: str = "npz", manifest: runmanifest.RunManifest = None
+) -> List[Dict[str, Dict[str, float]]]:
+    """
+    Runs jobs, in parallel worker processes if workers > 1, after generating
+    their scenarios; every job opens its stored scenarios read-only
+
+    With a run manifest, every job is recorded as running before the sweep and
+    as complete or failed as soon as it finishes, so an interrupted sweep can be
+    resumed; a failed job does not stop the others
+
+    Parameters:
+    1. jobs: jobs produced by find_jobs
+    2. cache: scenario cache
+    3. seed: seed of scenario generation
+    4. workers: number of worker processes
+    5. replicas: number of scenario replicas each job is simulated on at once
+    6. backend: compute backend, overriding the configs' (see backends)
+    7. raw_format: file format of the raw data (see rawdata)
+    8. manifest: run manifest to record the jobs in, or None
+
+    Returns:
+    1. statistics of each job, in the order of jobs (None for failed jobs)
+    """
+    paths = generate_scenarios(jobs, cache, seed, workers, replicas)
+    results = [None] * len(jobs)
+
+    if manifest is not None:
+        version = runmanifest.code_version()
+        for job in jobs:
+            manifest.start(runmanifest.job_id(job[1], job[2]), job_fingerprint(job, seed,
+                replicas, backend, raw_format, version), job_outputs(job, replicas, raw_format))
+        manifest.save()
+
+    def finish(i: int, run):
+        if manifest is None:
+            results[i] = run()
+            return
+
+        name = runmanifest.job_id(jobs[i][1], jobs[i][2])
+        try:
+            results[i] = run()
+            manifest.complete(name, results[i])
+        except Exception as e:
+            print("job {} failed: {!r}".format(name, e))
+            manifest.fail(name, repr(e))
+        manifest.save()
+
+    if workers <= 1:
+        for i, (job, job_paths) in enumerate(zip(jobs, paths)):
+            finish(i, lambda: run_job(job, job_paths, seed, backend, raw_format))
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_job, job, job_paths, seed, backend, raw_format): i \
+            for i, (job, job_paths) in enumerate(zip(jobs, paths))}
+        for future in as_completed(futures):
+            finish(futures[future], future.result)
+
+    return results
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Market Maker Simulator')
     parser.add_argument('-d', '--results_dir', type=str, required=True,
                         help='Path to results directory')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes')
+    parser.add_argument('-s', '--scenarios_only', action='store_true',
+                        help='Only generate and store the scenarios of every market')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed of scenario generation')
+    parser.add_argument('--cache_dir', type=str, default=None,
+                        help='Path to scenario cache (default: <results_dir>/scenarios)')
+    parser.add_argument('--cache_size', type=float, default=None,
+                        help='Size bound of the scenario cache in GB (default: unbounded)')
+    parser.add_argument('-r', '--replicas', type=int, default=1,
+                        help='Number of scenario replicas (seeds) every config is simulated '
+                        'on at once; statistics are reported as means and confidence intervals')
+    parser.add_argument('-b', '--backend', type=str, default=None, choices=backends.BACKENDS,
+                        help='Compute backend of the simulation loop, overriding the configs '
+                        '(numba falls back to python if it is not installed)')
+    parser.add_argument('--raw_format', type=str, default="npz", choices=rawdata.FORMATS,
+                        help='File format of the raw data (parquet needs pyarrow, and falls '
+                        'back to npz without it)')
+    parser.add_argument('--force', action='store_true',
+                        help='Rerun the selected jobs even if the run manifest has them complete '
+                        'and current')
+    parser.add_argument('--only', type=str, nargs='+', default=None,
+                        help='Only run the jobs matching these <market>/<config> patterns '
+                        '(e.g. "random/*" "*/pmm_005")')
+    parser.add_argument('--no-plots', action='store_true',
+                        help='Skip the plotting stage; images can be rendered later from the '
+                        'raw data with plotting.py')
+    parser.add_argument('--density_threshold', type=int, default=plotting.DENSITY_THRESHOLD,
+                        help='Number of points above which a series is drawn as a density image')
+    args = parser.parse_args()
+    if args.replicas > 1 and args.seed is None:
+        parser.error('--replicas needs --seed to draw different scenario replicas')
 
-    base_dir = parser.parse_args().results_dir
-    if not os.path.exists(base_dir):
-        os.mkdir(base_dir)
+    base_dir = args.results_dir
+    all_jobs = find_jobs(base_dir)
+    jobs = [job for job in all_jobs if runmanifest.matches(runmanifest.job_id(job[1], job[2]),
+        args.only)]
+    make_dirs(base_dir, sorted({job[1] for job in all_jobs}))
 
-    data_dirs = []
-    for dir in ["images", "stats", "raw_data"]:
-        combined_dir = os.path.join(base_dir, dir)
-        data_dirs.append(combined_dir)
-        if not os.path.exists(combined_dir):
-            os.mkdir(combined_dir)
-    
-    for market in os.listdir("config"): 
-        category_dirs = \
-            ["price_impact", "capital_efficiency", "impermanent_gain", "impermanent_loss"]
-        for dir in data_dirs:
-            for sub_dir in category_dirs:
-                combined_dir = os.path.join(dir, sub_dir)
-                if not os.path.exists(combined_dir):
-                    os.mkdir(combined_dir)
-                
-                market_dir = os.path.join(combined_dir, market)
-                if not os.path.exists(market_dir):
-                    os.mkdir(market_dir)
-        
-        market_path = os.path.join("config", market)
-        for env in os.listdir(market_path):
-            mm_name = env[:-5]
-            with open(os.path.join(market_path, env), 'r') as f:
-                config = json.load(f)
+    cache_dir = args.cache_dir or os.path.join(base_dir, "scenarios")
+    max_bytes = None if args.cache_size is None else int(args.cache_size * 1e9)
+    cache = scenario.ScenarioCache(cache_dir, max_bytes)
+
+    if args.scenarios_only:
+        generate_scenarios(jobs, cache, args.seed, args.workers, args.replicas)
+    else:
+        # skip the jobs whose outputs are complete and current
+        raw_format = rawdata.resolve(args.raw_format)
+        manifest = runmanifest.RunManifest(base_dir)
+        version = runmanifest.code_version()
+        if not args.force:
+            jobs = [job for job in jobs if not manifest.is_current(runmanifest.job_id(job[1],
+                job[2]), job_fingerprint(job, args.seed, args.replicas, args.backend, raw_format,
+                version))]
+        print("running {} of {} jobs".format(len(jobs), len(all_jobs)))
+        run_sweep(jobs, cache, args.seed, args.workers, args.replicas, args.backend, raw_format,
+            manifest)
+
+        summary = {}
+        for _, market, mm_name, _ in all_jobs:
+            stats = manifest.stats(runmanifest.job_id(market, mm_name))
+            if stats is not None:
+                summary[runmanifest.job_id(market, mm_name)] = stats
+        with open(os.path.join(base_dir, "stats", "summary.json"), "w") as f:
+            f.write(json.dumps(summary, indent=4))
+
+        if not args.no_plots:
+            plotting.plot_results(base_dir, [(market, mm_name) for _, market, mm_name, _ \
+                in all_jobs if plotting.is_stale(base_dir, market, mm_name)], args.workers,
+                args.density_threshold)
 
-            simulate(config)
+        failed = [name for name, entry in manifest.entries.items() if entry["status"] == "failed"]
+        if failed:
+            raise SystemExit("failed jobs (rerun to retry): {}".format(", ".join(failed)))
@@ -0,0 +1,133 @@
+import numpy as np
+from typing import List, Iterator
+from inputtx import InputTx
+
+class TrafficBatch():
+    def __init__(self, traffic: "Traffic", batch: int):
+        """
+        Read-only view of one batch of a Traffic; transactions are materialized
+        as InputTx objects only when accessed
+
+        Parameters:
+        1. traffic: traffic the batch belongs to
+        2. batch: index of the batch
+        """
+        self.traffic = traffic
+        self.batch = batch
+
+    def __len__(self) -> int:
+        return self.traffic.batch_size
+
+    def __getitem__(self, i: int) -> InputTx:
+        t = self.traffic
+        j = self.batch
+
+        return InputTx(t.tokens[t.intype[j, i]], t.tokens[t.outtype[j, i]],
+            float(t.inval[j, i]), bool(t.is_arb[j, i]))
+
+    def __iter__(self) -> Iterator[InputTx]:
+        t = self.traffic
+        j = self.batch
+        tokens = t.tokens
+        rows = zip(t.intype[j].tolist(), t.outtype[j].tolist(), t.inval[j].tolist(),
+            t.is_arb[j].tolist())
+
+        for intype, outtype, inval, is_arb in rows:
+            yield InputTx(tokens[intype], tokens[outtype], inval, is_arb)
+
+class Traffic():
+    def __init__(self, tokens: List[str], intype: np.ndarray, outtype: np.ndarray,
+    inval: np.ndarray, is_arb: np.ndarray):
+        """
+        Columnar traffic; every array has shape (batches, batch_size)
+
+        Parameters:
+        1. tokens: token names, indexed by token id
+        2. intype: input token ids
+        3. outtype: output token ids
+        4. inval: amount of input token to be inserted for each transaction
+        5. is_arb: whether or not each transaction results in a call to arbitrage()
+        """
+        self.tokens = list(tokens)
+        self.intype = intype
+        self.outtype = outtype
+        self.inval = inval
+        self.is_arb = is_arb
+
+    @classmethod
+    def empty(cls, tokens: List[str], batches: int, batch_size: int) -> "Traffic":
+        """
+        Allocates traffic of the given shape to be filled in
+
+        Parameters:
+        1. tokens: token names, indexed by token id
+        2. batches: number of batches
+        3. batch_size: number of transactions per batch
+
+        Returns:
+        1. zero-filled traffic
+        """
+        shape = (batches, batch_size)
+
+        return cls(tokens, np.zeros(shape, dtype=np.int32), np.zeros(shape, dtype=np.int32),
+            np.zeros(shape, dtype=np.float64), np.zeros(shape, dtype=bool))
+
+    @classmethod
+    def from_txs(cls, tokens: List[str], txs: List[List[InputTx]]) -> "Traffic":
+        """
+        Converts a 2-d list of transactions into columnar traffic
+
+        Parameters:
+        1. tokens: token names, indexed by token id
+        2. txs: batches of transactions; every batch must have the same size
+
+        Returns:
+        1. equivalent traffic
+        """
+        batch_size = len(txs[0]) if len(txs) else 0
+        traffic = cls.empty(tokens, len(txs), batch_size)
+        ids = {tok: i for i, tok in enumerate(tokens)}
+
+        for j, batch in enumerate(txs):
+            traffic.intype[j] = [ids[tx.intype] for tx in batch]
+            traffic.outtype[j] = [ids[tx.outtype] for tx in batch]
+            traffic.inval[j] = [tx.inval for tx in batch]
+            traffic.is_arb[j] = [tx.is_arb for tx in batch]
+
+        return traffic
+
+    def to_txs(self) -> List[List[InputTx]]:
+        """
+        Materializes every transaction
+
+        Returns:
+        1. 2-d list of transactions
+        """
+        return [list(batch) for batch in self]
+
+    @property
+    def shape(self):
+        return self.inval.shape
+
+    @property
+    def batches(self) -> int:
+        return self.inval.shape[0]
+
+    @property
+    def batch_size(self) -> int:
+        return self.inval.shape[1]
+
+    def __len__(self) -> int:
+        return self.batches
+
+    def __getitem__(self, j: int) -> TrafficBatch:
+        if j < 0:
+            j += self.batches
+        if not 0 <= j < self.batches:
+            raise IndexError("batch index out of range")
+
+        return TrafficBatch(self, j)
+
+    def __iter__(self) -> Iterator[TrafficBatch]:
+        for j in range(self.batches):
+            yield TrafficBatch(self, j)
@@ -1,11 +1,52 @@
 import numpy as np
 import random
+from statistics import NormalDist
 from typing import List, Tuple, Dict
-from inputtx import InputTx
+from traffic import Traffic
+from pricepath import PricePath
+
+# coefficients of Acklam's rational approximation of the inverse normal cdf
+_PPF_A = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+    1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00)
+_PPF_B = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+    6.680131188771972e+01, -1.328068155288572e+01)
+_PPF_C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+    -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00)
+_PPF_D = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+    3.754408661907416e+00)
+_PPF_LOW = 0.02425
+
+def _norm_ppf(q: np.ndarray) -> np.ndarray:
+    """
+    Vectorized inverse of the standard normal cdf (relative error below 1.2e-9)
+
+    Parameters:
+    1. q: probabilities in the open interval (0, 1)
+
+    Returns:
+    1. standard normal quantiles
+    """
+    q = np.asarray(q, dtype=np.float64)
+    a, b, c, d = _PPF_A, _PPF_B, _PPF_C, _PPF_D
+    x = np.empty_like(q)
+
+    tail = np.minimum(q, 1 - q)
+    is_tail = tail < _PPF_LOW
+    r = np.sqrt(-2 * np.log(tail[is_tail]))
+    t = (((((c[0]*r + c[1])*r + c[2])*r + c[3])*r + c[4])*r + c[5]) / \
+        ((((d[0]*r + d[1])*r + d[2])*r + d[3])*r + 1)
+    x[is_tail] = np.where(q[is_tail] < 0.5, t, -t)
+
+    r = q[~is_tail] - 0.5
+    t = r * r
+    x[~is_tail] = (((((a[0]*t + a[1])*t + a[2])*t + a[3])*t + a[4])*t + a[5]) * r / \
+        (((((b[0]*t + b[1])*t + b[2])*t + b[3])*t + b[4])*t + 1)
+
+    return x
 
 class TrafficGenerator():
     def __init__(self, sigma: float, mean: float, arb_probability: float, shape: Tuple[int, int],
-    max_price: float, is_norm: str = "True"):
+    max_price: float, is_norm: str = "True", bulk: str = "True", seed: int = None):
         """
         Generates traffic
 
@@ -16,6 +57,8 @@ class TrafficGenerator():
         4. shape: output shape of traffic
         5. max_price: upper bound on how much (in dollars) a swap can be
         6. is_norm: whether or not swap amounts should be normally distributed
+        7. bulk: whether or not to draw the whole traffic with array operations
+        8. seed: seed, SeedSequence or numpy Generator that all random draws come from
         """
         self.mean = mean
         self.sigma = sigma
@@ -28,7 +71,9 @@ class TrafficGenerator():
         self.token_info = None
         self.intype_probabilities = []
         self.outtype_probabilities = []
-        
+        self.bulk = bulk == "True"
+        self.rng = np.random.default_rng(seed)
+        self.random = random.Random(int(self.rng.integers(2**63)))
     
     def configure_tokens(self, token_list: List[str], token_info: Dict[str, Dict[str, float]]):
         """
@@ -86,6 +131,15 @@ class TrafficGenerator():
                 if not percent:
                     self.outtype_probabilities[i] = avg
 
+        self.amt_means = np.full(tokens, self.mean, dtype=np.float64)
+        self.amt_stdvs = np.full(tokens, self.sigma, dtype=np.float64)
+        self.amt_maxes = np.full(tokens, self.max_price, dtype=np.float64)
+        for i, tok in enumerate(token_list):
+            info = token_info.get(tok, {})
+            self.amt_means[i] = info.get("amt_mean", self.mean)
+            self.amt_stdvs[i] = info.get("amt_stdv", self.sigma)
+            self.amt_maxes[i] = info.get("amt_max", self.max_price)
+
     def __get_amt(self, intype: str, price: float) -> float:
         """
         Given the token price, generates a swap amount
@@ -105,19 +159,19 @@ class TrafficGenerator():
             if "amt_stdv" in info:
                 sigma = info["amt_stdv"]
             if "amt_mean" in info:
-                mean = info["mean"]
+                mean = info["amt_mean"]
             if "amt_max" in info:
                 max_price = info["amt_max"]
         
         if self.is_norm:
-            deviation = np.random.normal(0, sigma)
+            deviation = self.rng.normal(0, sigma)
             while deviation <= -1 * mean:
-                deviation = np.random.normal(0, sigma)
+                deviation = self.rng.normal(0, sigma)
             
             return min((deviation + mean), max_price) / price
         else:
 
-            return random.randrange(0, max_price * 1000) / (1000 * price)
+            return self.random.randrange(0, max_price * 1000) / (1000 * price)
     
     def __get_pair(self) -> Tuple[str, str]:
         """
@@ -127,37 +181,130 @@ class TrafficGenerator():
         1. input token type
         2. output token type
         """
-        intype = random.choices(self.token_list, weights=self.intype_probabilities, k=1)[0]
-        outtype = random.choices(self.token_list, weights=self.outtype_probabilities, k=1)[0]
+        intype = self.random.choices(self.token_list, weights=self.intype_probabilities, k=1)[0]
+        outtype = self.random.choices(self.token_list, weights=self.outtype_probabilities, k=1)[0]
         while outtype == intype:
-            outtype = random.choices(self.token_list, weights=self.outtype_probabilities, k=1)[0]
+            outtype = self.random.choices(self.token_list, weights=self.outtype_probabilities, k=1)[0]
         
         return intype, outtype
 
-    def generate_traffic(self, prices: List[Dict[str, float]]) -> List[List[InputTx]]:
+    def __get_pairs(self, shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Randomly picks input and output token ids for every transaction; output
+        tokens are drawn from the output distribution conditioned on differing
+        from the input token
+
+        Parameters:
+        1. shape: shape of the traffic
+
+        Returns:
+        1. input token ids
+        2. output token ids
+        """
+        tokens = len(self.token_list)
+        in_cdf = np.cumsum(self.intype_probabilities, dtype=np.float64)
+        in_cdf /= in_cdf[-1]
+        intype = np.searchsorted(in_cdf, self.rng.random(shape), side="right")
+        np.minimum(intype, tokens - 1, out=intype)
+
+        out_weights = np.tile(np.asarray(self.outtype_probabilities, dtype=np.float64), (tokens, 1))
+        np.fill_diagonal(out_weights, 0)
+        out_cdf = np.cumsum(out_weights, axis=1)
+        totals = out_cdf[:, -1:]
+        if np.any(totals[np.unique(intype)] <= 0):
+            raise ValueError("no output token can be paired with some input token")
+        out_cdf /= np.where(totals > 0, totals, 1)
+
+        outtype = np.empty(shape, dtype=np.int64)
+        u = self.rng.random(shape)
+        for i in range(tokens):
+            rows = intype == i
+            outtype[rows] = np.searchsorted(out_cdf[i], u[rows], side="right")
+        np.minimum(outtype, tokens - 1, out=outtype)
+
+        return intype, outtype
+
+    def __get_amts(self, intype: np.ndarray, prices: np.ndarray) -> np.ndarray:
+        """
+        Generates swap amounts for every transaction; normally distributed dollar
+        amounts are drawn from a normal distribution truncated at 0
+
+        Parameters:
+        1. intype: input token ids
+        2. prices: input token price for every transaction
+
+        Returns:
+        1. token swap amounts
+        """
+        maxes = self.amt_maxes[intype]
+
+        if self.is_norm:
+            means = self.amt_means[intype]
+            stdvs = self.amt_stdvs[intype]
+            # mass of each token's amount distribution above 0
+            upper = np.array([NormalDist().cdf(m / s) if s > 0 else 1.0 \
+                for m, s in zip(self.amt_means, self.amt_stdvs)])
+            # inverse cdf sampling from the upper tail keeps precision for large z
+            v = 1 - self.rng.random(intype.shape)
+            amts = means - stdvs * _norm_ppf(upper[intype] * v)
+
+            return np.minimum(amts, maxes) / prices
+        else:
+            high = (maxes * 1000).astype(np.int64)
+
+            return self.rng.integers(0, high) / (1000 * prices)
+
+    def __generate_bulk(self, prices: PricePath) -> Traffic:
+        """
+        Generates traffic with array operations over the whole traffic shape
+
+        Parameters:
+        1. prices: token prices at each batch
+
+        Returns:
+        1. columnar traffic of shape (batches, batch_size)
+        """
+        shape = (self.batches, self.batch_size)
+        if not isinstance(prices, PricePath):
+            prices = PricePath.from_dicts(prices[:self.batches])
+        price_matrix = prices.columns(self.token_list)[:self.batches]
+
+        intype, outtype = self.__get_pairs(shape)
+        batch_ids = np.arange(self.batches)[:, None]
+        amts = self.__get_amts(intype, price_matrix[batch_ids, intype])
+        is_arb = self.rng.random(shape) < self.arb_probability[1]
+
+        return Traffic(self.token_list, intype.astype(np.int32), outtype.astype(np.int32),
+            amts.astype(np.float64), is_arb)
+
+    def generate_traffic(self, prices: PricePath) -> Traffic:
         """
         Generates traffic
 
         Parameters:
-        1. prices: details token prices at each batch; of the form:
+        1. prices: details token prices at each batch; each batch is of the form:
         {
             "BTC": 23004,
             "UST": 1
         }
 
         Returns:
-        1. list of batches of swaps
+        1. columnar traffic of shape (batches, batch_size)
         """
-        txs = []
+        if self.bulk:
+            return self.__generate_bulk(prices)
+
+        traffic = Traffic.empty(self.token_list, self.batches, self.batch_size)
+        ids = {tok: i for i, tok in enumerate(self.token_list)}
         choices = [0,1]
         for batch in range(self.batches):
-            batch_txs = []
             for tx in range(self.batch_size):
                 intype, outtype = self.__get_pair()
                 amt = self.__get_amt(intype, prices[batch][intype])
-                arb = random.choices(choices, self.arb_probability) == [1]
-                batch_txs.append(InputTx(intype, outtype, amt, arb))
-            
-            txs.append(batch_txs)
+                arb = self.random.choices(choices, self.arb_probability) == [1]
+                traffic.intype[batch, tx] = ids[intype]
+                traffic.outtype[batch, tx] = ids[outtype]
+                traffic.inval[batch, tx] = amt
+                traffic.is_arb[batch, tx] = arb
         
-        return txs
\ No newline at end of file
+        return traffic
\ No newline at end of file